@@ -0,0 +1,119 @@
+"""
+Banc de mesure de latence DICOMweb des PACS
+Requêtes répétées, après préchauffage, à plusieurs niveaux de concurrence :
+QIDO-RS, métadonnées WADO-RS et récupération complète d'une instance.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional, Sequence
+import httpx
+
+OPERATIONS = ('qido', 'metadata', 'retrieve')
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Percentile q (0-100) par interpolation linéaire"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * q / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def summarize(samples: List[float], total_bytes: int, wall_seconds: float, errors: int = 0) -> Dict:
+    """Distribution d'une série de mesures (secondes) et débit"""
+    return {
+        'samples': [round(s, 6) for s in samples],
+        'count': len(samples),
+        'errors': errors,
+        'mean': round(sum(samples) / len(samples), 6) if samples else 0.0,
+        'p50': round(percentile(samples, 50), 6),
+        'p95': round(percentile(samples, 95), 6),
+        'p99': round(percentile(samples, 99), 6),
+        'bytes_per_second': round(total_bytes / wall_seconds, 1) if wall_seconds > 0 else 0.0
+    }
+
+class PacsBenchmark:
+    """Mesure la latence d'une étude sur un point d'accès DICOMweb"""
+
+    def __init__(self, client: httpx.AsyncClient, repetitions: int = 5, warmup: int = 1,
+                 concurrency: Sequence[int] = (1,), operations: Sequence[str] = OPERATIONS):
+        self.client = client
+        self.repetitions = max(1, repetitions)
+        self.warmup = max(0, warmup)
+        self.concurrency = [max(1, level) for level in concurrency] or [1]
+        self.operations = [op for op in operations if op in OPERATIONS]
+
+    async def run(self, dicomweb_root: str, study_uid: str) -> Dict:
+        """Mesurer toutes les opérations configurées pour une étude"""
+        results = {}
+        for operation in self.operations:
+            request = await self._build_request(operation, dicomweb_root, study_uid)
+            if request is None:
+                continue
+            url, headers = request
+            # Préchauffage : connexion keep-alive établie et caches serveur chauds
+            for _ in range(self.warmup):
+                try:
+                    await self._measure(url, headers)
+                except httpx.HTTPError:
+                    pass
+            results[operation] = {}
+            for level in self.concurrency:
+                results[operation][str(level)] = await self._run_level(url, headers, level)
+        return results
+
+    async def _build_request(self, operation: str, root: str, study_uid: str) -> Optional[tuple]:
+        """URL et en-têtes d'une opération"""
+        if operation == 'qido':
+            return f"{root}/studies?StudyInstanceUID={study_uid}", {'Accept': 'application/dicom+json'}
+        if operation == 'metadata':
+            return f"{root}/studies/{study_uid}/metadata", {'Accept': 'application/dicom+json'}
+        # Récupération complète d'une instance représentative de l'étude
+        response = await self.client.get(
+            f"{root}/studies/{study_uid}/instances",
+            params={'limit': 1},
+            headers={'Accept': 'application/dicom+json'}
+        )
+        if response.status_code != 200 or not response.json():
+            return None
+        instance = response.json()[0]
+        series_uid = (instance.get('0020000E', {}).get('Value') or [None])[0]
+        sop_uid = (instance.get('00080018', {}).get('Value') or [None])[0]
+        if not series_uid or not sop_uid:
+            return None
+        return (
+            f"{root}/studies/{study_uid}/series/{series_uid}/instances/{sop_uid}",
+            {'Accept': 'multipart/related; type="application/dicom"'}
+        )
+
+    async def _run_level(self, url: str, headers: Dict, level: int) -> Dict:
+        """`repetitions` requêtes par emplacement, `level` requêtes simultanées"""
+        semaphore = asyncio.Semaphore(level)
+        samples = []
+        total_bytes = 0
+        errors = 0
+
+        async def one():
+            nonlocal total_bytes, errors
+            async with semaphore:
+                try:
+                    elapsed, size = await self._measure(url, headers)
+                    samples.append(elapsed)
+                    total_bytes += size
+                except httpx.HTTPError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(self.repetitions * level)))
+        return summarize(samples, total_bytes, time.perf_counter() - start, errors)
+
+    async def _measure(self, url: str, headers: Dict) -> tuple:
+        """Durée jusqu'au dernier octet et taille de la réponse (lue en flux)"""
+        size = 0
+        start = time.perf_counter()
+        async with self.client.stream('GET', url, headers=headers) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+        return time.perf_counter() - start, size
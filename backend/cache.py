@@ -0,0 +1,47 @@
+"""
+Cache en mémoire à durée de vie courte
+Un seul chargement concurrent par clé (single-flight) ; invalidation explicite
+lorsque les données sous-jacentes changent (commit d'une synchronisation).
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+class TTLCache:
+    def __init__(self, ttl: float = 5.0):
+        self.ttl = ttl
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valeur encore valide, None sinon"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Valeur en cache ou chargée une seule fois pour tous les appelants concurrents"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            value = self.get(key)
+            if value is not None:
+                return value
+            generation = self._generation
+            value = await loader()
+            # Une invalidation pendant le chargement rend la valeur potentiellement périmée
+            if generation == self._generation and self.ttl > 0:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Invalider une clé ou tout le cache"""
+        self._generation += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
@@ -1,53 +1,140 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import Patient, Study, Comparison, SyncLog
+import base64
+import json
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, func, or_, select
+from models import Patient, Study, Comparison, SyncLog, SyncServiceStatus
 from schemas import PatientCreate, StudyCreate, ComparisonResponse, SyncStatusResponse
 from datetime import datetime
 
-def get_patients(db: Session, skip: int = 0, limit: int = 100):
-    """Récupérer tous les patients"""
-    return db.query(Patient).offset(skip).limit(limit).all()
+def encode_cursor(*values) -> str:
+    """Curseur opaque de pagination par clé (valeurs de tri de la dernière ligne)"""
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
 
-def get_patient(db: Session, patient_id: str):
+def decode_cursor(cursor: str, *types) -> List:
+    """Valeurs d'un curseur, converties par `types` (une fonction par colonne) s'ils sont donnés ;
+    ValueError si le curseur est invalide"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if types:
+        if len(values) != len(types):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        try:
+            values = [convert(value) for convert, value in zip(types, values)]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+    return values
+
+def _cursor_text(value) -> str:
+    if not isinstance(value, str):
+        raise TypeError(f"Expected a string, got {value!r}")
+    return value
+
+def _cursor_integer(value) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise TypeError(f"Expected an integer, got {value!r}")
+    return value
+
+# Colonnes des curseurs : identifiant seul, ou (horodatage, id) de l'historique
+ID_CURSOR = (_cursor_text,)
+SYNC_LOG_CURSOR = (lambda value: datetime.fromisoformat(_cursor_text(value)), _cursor_integer)
+
+def next_cursor(items: List, limit: int, *columns: str) -> Optional[str]:
+    """Curseur de la page suivante, None si la page est la dernière"""
+    if len(items) < limit:
+        return None
+    return encode_cursor(*(getattr(items[-1], column) for column in columns))
+
+async def get_patients(db: AsyncSession, after: Optional[str] = None, limit: int = 100):
+    """Récupérer les patients, page par page (clé : id)"""
+    query = select(Patient).order_by(Patient.id).limit(limit)
+    if after:
+        query = query.where(Patient.id > decode_cursor(after, *ID_CURSOR)[0])
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def get_patient(db: AsyncSession, patient_id: str):
     """Récupérer un patient spécifique"""
-    return db.query(Patient).filter(Patient.id == patient_id).first()
+    return await db.scalar(select(Patient).where(Patient.id == patient_id))
 
-def create_patient(db: Session, patient: PatientCreate):
+async def create_patient(db: AsyncSession, patient: PatientCreate):
     """Créer un nouveau patient"""
     db_patient = Patient(**patient.dict())
     db.add(db_patient)
-    db.commit()
-    db.refresh(db_patient)
+    await db.commit()
+    await db.refresh(db_patient)
     return db_patient
 
-def get_studies(db: Session, patient_id: str = None, skip: int = 0, limit: int = 100):
-    """Récupérer les études"""
-    query = db.query(Study)
+async def get_studies(db: AsyncSession, patient_id: str = None, after: Optional[str] = None, limit: int = 100):
+    """Récupérer les études, page par page (clé : id, index (patient_id, id) si filtré)"""
+    query = select(Study).order_by(Study.id).limit(limit)
     if patient_id:
-        query = query.filter(Study.patient_id == patient_id)
-    return query.offset(skip).limit(limit).all()
+        query = query.where(Study.patient_id == patient_id)
+    if after:
+        query = query.where(Study.id > decode_cursor(after, *ID_CURSOR)[0])
+    result = await db.execute(query)
+    return list(result.scalars().all())
 
-def create_study(db: Session, study: StudyCreate):
+async def create_study(db: AsyncSession, study: StudyCreate):
     """Créer une nouvelle étude"""
     db_study = Study(**study.dict())
     db.add(db_study)
-    db.commit()
-    db.refresh(db_study)
+    await db.commit()
+    await db.refresh(db_study)
     return db_study
 
-def get_comparisons(db: Session, skip: int = 0, limit: int = 100):
-    """Récupérer les comparaisons"""
-    return db.query(Comparison).offset(skip).limit(limit).all()
+async def get_comparisons(db: AsyncSession, after: Optional[str] = None, limit: int = 100):
+    """Récupérer les comparaisons, page par page (clé : id)"""
+    query = select(Comparison).order_by(Comparison.id).limit(limit)
+    if after:
+        query = query.where(Comparison.id > decode_cursor(after, *ID_CURSOR)[0])
+    result = await db.execute(query)
+    return list(result.scalars().all())
 
-def create_comparison(db: Session, comparison_data: dict):
+async def create_comparison(db: AsyncSession, comparison_data: dict):
     """Créer une nouvelle comparaison"""
     db_comparison = Comparison(**comparison_data)
     db.add(db_comparison)
-    db.commit()
-    db.refresh(db_comparison)
+    await db.commit()
+    await db.refresh(db_comparison)
     return db_comparison
 
-def create_sync_log(db: Session, service: str, action: str, status: str, message: str, details: dict = None):
+async def get_diverging_studies(db: AsyncSession, after: Optional[str] = None, limit: int = 100):
+    """Études dont les empreintes de contenu diffèrent entre les PACS, page par page (clé : id)"""
+    query = (
+        select(Study)
+        .where(Study.dcm4chee_digest.is_distinct_from(Study.orthanc_digest))
+        .order_by(Study.id)
+        .limit(limit)
+    )
+    if after:
+        query = query.where(Study.id > decode_cursor(after, *ID_CURSOR)[0])
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def get_sync_logs(db: AsyncSession, after: Optional[str] = None, limit: int = 50):
+    """Historique de synchronisation, du plus récent au plus ancien (clé : timestamp, id)"""
+    query = select(SyncLog).order_by(SyncLog.timestamp.desc(), SyncLog.id.desc()).limit(limit)
+    if after:
+        timestamp, log_id = decode_cursor(after, *SYNC_LOG_CURSOR)
+        query = query.where(or_(
+            SyncLog.timestamp < timestamp,
+            and_(SyncLog.timestamp == timestamp, SyncLog.id < log_id)
+        ))
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def get_sync_service_status(db: AsyncSession):
+    """Dernier log de chaque service"""
+    result = await db.execute(select(SyncServiceStatus).order_by(SyncServiceStatus.service))
+    return list(result.scalars().all())
+
+async def create_sync_log(db: AsyncSession, service: str, action: str, status: str, message: str, details: dict = None):
     """Créer un log de synchronisation"""
     log = SyncLog(
         service=service,
@@ -57,28 +144,36 @@ def create_sync_log(db: Session, service: str, action: str, status: str, message
         details=details or {}
     )
     db.add(log)
-    db.commit()
-    db.refresh(log)
+    await db.commit()
+    await db.refresh(log)
     return log
 
-def get_sync_status(db: Session) -> SyncStatusResponse:
-    """Récupérer le statut de synchronisation"""
-    total_patients = db.query(func.count(Patient.id)).scalar() or 0
-    synchronized_patients = db.query(func.count(Patient.id)).filter(Patient.synchronized == True).scalar() or 0
-    pending_patients = total_patients - synchronized_patients
-    
-    total_studies = db.query(func.count(Study.id)).scalar() or 0
-    synced_studies = db.query(func.count(Comparison.id)).filter(Comparison.sync_status == "completed").scalar() or 0
-    
-    last_sync_log = db.query(SyncLog).order_by(SyncLog.timestamp.desc()).first()
-    last_sync = last_sync_log.timestamp if last_sync_log else None
-    
+async def get_aggregates(db: AsyncSession) -> dict:
+    """Compteurs du statut et des statistiques, en une seule requête"""
+    def count(model, *conditions):
+        return select(func.count()).select_from(model).where(*conditions).scalar_subquery()
+
+    row = (await db.execute(select(
+        count(Patient).label('total_patients'),
+        count(Patient, Patient.synchronized == True).label('synchronized_patients'),
+        count(Study).label('total_studies'),
+        count(Comparison).label('total_comparisons'),
+        count(Comparison, Comparison.sync_status == "completed").label('synced_studies'),
+        # Dernier log par service maintenu par SyncLogWriter : une ligne par service
+        select(func.max(SyncServiceStatus.last_sync)).scalar_subquery().label('last_sync')
+    ))).one()
+    return dict(row._mapping)
+
+async def get_sync_status(db: AsyncSession, aggregates: Optional[dict] = None) -> SyncStatusResponse:
+    """Récupérer le statut de synchronisation (compteurs fournis, par exemple depuis le cache)"""
+    if aggregates is None:
+        aggregates = await get_aggregates(db)
     return SyncStatusResponse(
-        total_patients=total_patients,
-        synchronized_patients=synchronized_patients,
-        pending_patients=pending_patients,
-        total_studies=total_studies,
-        synced_studies=synced_studies,
-        last_sync=last_sync,
+        total_patients=aggregates['total_patients'],
+        synchronized_patients=aggregates['synchronized_patients'],
+        pending_patients=aggregates['total_patients'] - aggregates['synchronized_patients'],
+        total_studies=aggregates['total_studies'],
+        synced_studies=aggregates['synced_studies'],
+        last_sync=aggregates['last_sync'],
         next_sync=None  # À calculer basé sur SYNC_INTERVAL
     )
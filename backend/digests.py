@@ -0,0 +1,141 @@
+"""
+Empreintes de contenu par PACS (arbre de Merkle série -> étude)
+Série : hachage des SOPInstanceUID triés que détient le PACS ; étude : hachage des
+couples (SeriesInstanceUID, empreinte de série) triés. Deux empreintes d'étude égales
+signifient un contenu identique dans les deux archives : la vérification de cohérence
+ne descend dans les séries, puis les instances, que là où les empreintes diffèrent.
+Les séries à recalculer sont marquées en base (series.digest_dirty) dans la transaction
+qui modifie leurs instances : une passe interrompue laisse les marques pour la suivante.
+"""
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import or_, select, update
+from models import Instance, Series, Study
+
+PACS = ('dcm4chee', 'orthanc')
+
+def merkle_digest(items: Iterable[str]) -> Optional[str]:
+    """Empreinte d'un ensemble (ordre indifférent) ; None pour un ensemble vide"""
+    items = sorted(items)
+    if not items:
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    for item in items:
+        digest.update(item.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def _batches(values: List[str], size: int):
+    for offset in range(0, len(values), size):
+        yield values[offset:offset + size]
+
+async def refresh_digests(db, series_ids: Iterable[str], batch_size: int = 500) -> int:
+    """Recalculer les empreintes des séries indiquées puis de leurs études ; séries recalculées"""
+    series_ids = sorted({series_id for series_id in series_ids if series_id})
+    study_ids = set()
+    for batch in _batches(series_ids, batch_size):
+        members = {series_id: {pacs: [] for pacs in PACS} for series_id in batch}
+        rows = await db.execute(
+            select(Instance.series_id, Instance.sop_instance_uid, Instance.dcm4chee_id, Instance.orthanc_id)
+            .where(Instance.series_id.in_(batch))
+        )
+        for series_id, sop_uid, dcm4chee_id, orthanc_id in rows:
+            if sop_uid is None:
+                continue
+            if dcm4chee_id is not None:
+                members[series_id]['dcm4chee'].append(sop_uid)
+            if orthanc_id is not None:
+                members[series_id]['orthanc'].append(sop_uid)
+        await db.execute(update(Series), [
+            {'id': series_id, 'digest_dirty': False,
+             **{f'{pacs}_digest': merkle_digest(uids[pacs]) for pacs in PACS}}
+            for series_id, uids in members.items()
+        ])
+        study_ids.update(await db.scalars(select(Series.study_id).where(Series.id.in_(batch))))
+
+    for batch in _batches(sorted(s for s in study_ids if s), batch_size):
+        members = {study_id: {pacs: [] for pacs in PACS} for study_id in batch}
+        rows = await db.execute(
+            select(Series.study_id, Series.series_uid, Series.dcm4chee_digest, Series.orthanc_digest)
+            .where(Series.study_id.in_(batch))
+        )
+        for study_id, series_uid, dcm4chee_digest, orthanc_digest in rows:
+            for pacs, digest in (('dcm4chee', dcm4chee_digest), ('orthanc', orthanc_digest)):
+                if digest is not None:
+                    members[study_id][pacs].append(f"{series_uid}:{digest}")
+        await db.execute(update(Study), [
+            {'id': study_id, **{f'{pacs}_digest': merkle_digest(leaves[pacs]) for pacs in PACS}}
+            for study_id, leaves in members.items()
+        ])
+    return len(series_ids)
+
+async def mark_dirty(db, series_ids: Iterable[str], batch_size: int = 500):
+    """Marquer des séries à recalculer, dans la transaction qui modifie leurs instances"""
+    series_ids = sorted({series_id for series_id in series_ids if series_id})
+    for batch in _batches(series_ids, batch_size):
+        await db.execute(update(Series).where(Series.id.in_(batch)).values(digest_dirty=True))
+
+async def refresh_dirty(db, batch_size: int = 500) -> int:
+    """Recalculer les empreintes des séries marquées en base ; séries recalculées"""
+    await db.flush()
+    refreshed = 0
+    while True:
+        # Les marques sont levées par refresh_digests : chaque lot est nouveau
+        batch = (await db.scalars(
+            select(Series.id).where(Series.digest_dirty.is_(True)).order_by(Series.id).limit(batch_size)
+        )).all()
+        if not batch:
+            return refreshed
+        refreshed += await refresh_digests(db, batch, batch_size)
+
+async def clear_missing(db, pacs: str, listed_since, batch_size: int = 500) -> int:
+    """Retirer la présence dans `pacs` des instances absentes d'un listage complet commencé à `listed_since`
+
+    Sans cela, une instance supprimée d'un PACS y resterait présente et les empreintes
+    ne verraient pas la suppression. Les séries concernées sont marquées à recalculer.
+    """
+    pacs_id = getattr(Instance, f'{pacs}_id')
+    seen_at = getattr(Instance, f'{pacs}_seen_at')
+    missing = pacs_id.isnot(None) & or_(seen_at.is_(None), seen_at < listed_since)
+    series_ids = (await db.scalars(select(Instance.series_id).where(missing).distinct())).all()
+    await mark_dirty(db, series_ids, batch_size)
+    result = await db.execute(
+        update(Instance).where(missing).values({pacs_id: None}).execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0
+
+async def diff_study(db, study: Study) -> Dict:
+    """Descendre dans une étude divergente : séries puis instances absentes d'un des PACS"""
+    series_list = (await db.scalars(
+        select(Series)
+        .where(Series.study_id == study.id, Series.dcm4chee_digest.is_distinct_from(Series.orthanc_digest))
+        .order_by(Series.series_uid)
+    )).all()
+    missing = defaultdict(lambda: {'missing_in_dcm4chee': [], 'missing_in_orthanc': []})
+    if series_list:
+        rows = await db.execute(
+            select(Instance.series_id, Instance.sop_instance_uid, Instance.dcm4chee_id, Instance.orthanc_id)
+            .where(Instance.series_id.in_([s.id for s in series_list]))
+            .order_by(Instance.sop_instance_uid)
+        )
+        for series_id, sop_uid, dcm4chee_id, orthanc_id in rows:
+            if dcm4chee_id is None and orthanc_id is not None:
+                missing[series_id]['missing_in_dcm4chee'].append(sop_uid)
+            elif orthanc_id is None and dcm4chee_id is not None:
+                missing[series_id]['missing_in_orthanc'].append(sop_uid)
+    return {
+        'study_id': study.id,
+        'study_uid': study.study_uid,
+        'dcm4chee_digest': study.dcm4chee_digest,
+        'orthanc_digest': study.orthanc_digest,
+        'series': [
+            {
+                'series_uid': series.series_uid,
+                'dcm4chee_digest': series.dcm4chee_digest,
+                'orthanc_digest': series.orthanc_digest,
+                **missing[series.id]
+            }
+            for series in series_list
+        ]
+    }
@@ -0,0 +1,64 @@
+"""
+Bus d'événements de progression de la synchronisation
+SyncService publie sans attendre ; chaque abonné (flux SSE /api/sync/events) lit sa
+propre file bornée. Un abonné trop lent perd les événements les plus anciens au lieu
+de ralentir la synchronisation. Les derniers événements sont conservés pour la
+reprise d'un client reconnecté (en-tête Last-Event-ID).
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+class EventBus:
+    def __init__(self, history: int = 200, queue_size: int = 500):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._next_id = 1
+        self.dropped = 0  # Événements perdus par des abonnés trop lents
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, **data) -> Dict:
+        """Diffuser un événement à tous les abonnés (sans attente)"""
+        event = {'id': self._next_id, 'type': event_type, 'timestamp': time.time(), **data}
+        self._next_id += 1
+        self._history.append(event)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+        return event
+
+    def recent(self, after: Optional[int] = None) -> List[Dict]:
+        """Événements conservés, postérieurs à l'identifiant `after`"""
+        return [event for event in self._history if after is None or event['id'] > after]
+
+    async def subscribe(self, after: Optional[int] = None, keepalive: float = 15.0) -> AsyncIterator[Optional[Dict]]:
+        """Événements à partir de `after` ; None toutes les `keepalive` secondes sans événement"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        # Reprise et abonnement sans point d'attente entre les deux : aucun événement manqué
+        backlog = self.recent(after) if after is not None else []
+        self._subscribers.add(queue)
+        try:
+            for event in backlog:
+                yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self._subscribers.discard(queue)
+
+def format_sse(event: Optional[Dict]) -> str:
+    """Trame Server-Sent Events (commentaire de maintien de connexion si `event` est None)"""
+    if event is None:
+        return ': keepalive\n\n'
+    # Sans champ "event" : reçu par EventSource.onmessage, le type figure dans les données
+    return f"id: {event['id']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,103 @@
+"""
+Surveillance de la santé des services
+Sondes concurrentes sur un client partagé, rafraîchies en tâche de fond :
+/health sert le dernier instantané au lieu d'interroger les PACS à chaque appel.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional
+import httpx
+from sqlalchemy import text
+from database import AsyncSessionLocal
+from metrics import health_probe_duration
+
+logger = logging.getLogger(__name__)
+
+class HealthMonitor:
+    def __init__(self, targets: Dict[str, str], interval: float = 15.0, timeout: float = 5.0,
+                 session_factory=AsyncSessionLocal):
+        self.targets = targets  # service -> URL sondée
+        self.interval = interval
+        self.timeout = timeout
+        self.session_factory = session_factory
+        self.client = None
+        self._snapshot = None
+        self._refreshed_at = None
+        self._refresh_lock = asyncio.Lock()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Client HTTP keep-alive partagé par toutes les sondes"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(follow_redirects=True, timeout=self.timeout)
+        return self.client
+
+    async def close(self):
+        """Fermer le client HTTP partagé"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def run(self):
+        """Boucle de rafraîchissement périodique"""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Erreur lors du rafraîchissement de la santé: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self) -> Dict:
+        """Sonder tous les services en parallèle et mémoriser l'instantané"""
+        async with self._refresh_lock:
+            probes = {'database': self._probe_database()}
+            for service, url in self.targets.items():
+                probes[service] = self._probe_http(service, url)
+            results = await asyncio.gather(*probes.values())
+            services = dict(zip(probes.keys(), results))
+            all_healthy = all(v.startswith('healthy') for v in services.values())
+            self._snapshot = {
+                'status': 'healthy' if all_healthy else 'degraded',
+                'timestamp': datetime.utcnow(),
+                'services': services
+            }
+            self._refreshed_at = time.monotonic()
+            return self._snapshot
+
+    async def snapshot(self) -> Dict:
+        """Dernier instantané et son âge (µs) ; première sonde à la demande si aucun n'existe"""
+        if self._snapshot is None:
+            await self.refresh()
+        age_us = int((time.monotonic() - self._refreshed_at) * 1_000_000)
+        return {**self._snapshot, 'age_us': age_us}
+
+    async def _probe_database(self) -> str:
+        """Sonde de la base de données"""
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                await db.execute(text("SELECT 1"))
+                status = f'healthy ({db.bind.dialect.name})'
+        except Exception as e:
+            status = f'unhealthy: {str(e)}'
+        self._observe('database', status, start)
+        return status
+
+    async def _probe_http(self, service: str, url: str) -> str:
+        """Sonde HTTP d'un service (200 attendu)"""
+        start = time.perf_counter()
+        try:
+            response = await self._get_client().get(url)
+            status = 'healthy' if response.status_code == 200 else 'unhealthy'
+        except Exception as e:
+            status = f'unhealthy: {type(e).__name__}'
+            logger.error(f"{service} health check failed: {type(e).__name__} - {e}")
+        self._observe(service, status, start)
+        return status
+
+    @staticmethod
+    def _observe(service: str, status: str, start: float):
+        """Exporter la durée d'une sonde"""
+        outcome = 'healthy' if status.startswith('healthy') else 'unhealthy'
+        health_probe_duration.labels(service=service, status=outcome).observe(time.perf_counter() - start)
@@ -0,0 +1,176 @@
+"""
+Élection d'un worker de synchronisation par bail en base (table sync_leases)
+Avec plusieurs workers uvicorn ou réplicas, un seul worker détient le bail d'un shard
+et exécute la boucle de synchronisation correspondante ; un worker prend aussi les
+shards restés libres (moins de workers que de shards). Le bail est renouvelé
+périodiquement ; s'il expire (worker arrêté ou bloqué), un autre worker le reprend.
+Le verrou repose sur une mise à jour conditionnelle : aucune fonctionnalité propre
+à un SGBD n'est nécessaire (SQLite comme PostgreSQL). Les horloges des workers
+doivent rester synchronisées à une fraction de `ttl` près.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+from uuid import uuid4
+from sqlalchemy import and_, case, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from database import AsyncSessionLocal
+from models import SyncLease, shard_key
+
+logger = logging.getLogger(__name__)
+
+def shard_of(key: str, shards: int) -> int:
+    """Shard d'une clé (hachage stable entre processus, contrairement à hash()) ; en SQL : shard_key % shards"""
+    return shard_key(key) % shards if shards > 1 else 0
+
+class LeaderElection:
+    def __init__(self, session_factory=AsyncSessionLocal, name: str = 'sync', shards: int = 1,
+                 ttl: float = 30.0, holder: Optional[str] = None):
+        self.session_factory = session_factory
+        self.name = name
+        self.shards = max(1, shards)
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        # Shards dont le bail est détenu -> dernier renouvellement (plusieurs si moins de workers que de shards)
+        self.held: Dict[int, float] = {}
+
+    @property
+    def is_leader(self) -> bool:
+        return bool(self.held)
+
+    def holds(self, shard: int) -> bool:
+        return shard in self.held
+
+    def _lease_name(self, shard: int) -> str:
+        return f"{self.name}:{shard}"
+
+    async def _claim(self, shard: int) -> bool:
+        """Prendre ou prolonger le bail d'un shard s'il est libre, expiré ou déjà détenu"""
+        now = datetime.utcnow()
+        name = self._lease_name(shard)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(SyncLease)
+                .where(
+                    SyncLease.name == name,
+                    or_(SyncLease.holder == self.holder, SyncLease.expires_at < now)
+                )
+                .values(
+                    holder=self.holder,
+                    expires_at=now + timedelta(seconds=self.ttl),
+                    acquired_at=case((SyncLease.holder == self.holder, SyncLease.acquired_at), else_=now)
+                )
+            )
+            if result.rowcount == 1:
+                await db.commit()
+                return True
+            # Bail détenu par un autre worker : aucune insertion tentée (transaction intacte sous PostgreSQL)
+            exists = await db.scalar(select(SyncLease.name).where(SyncLease.name == name))
+            await db.rollback()
+            if exists is not None:
+                return False
+            # Premier démarrage (ou bail libéré) : la ligne du bail n'existe pas encore
+            db.add(SyncLease(
+                name=name, holder=self.holder, acquired_at=now,
+                expires_at=now + timedelta(seconds=self.ttl)
+            ))
+            try:
+                await db.commit()
+                return True
+            except IntegrityError:
+                # Ligne créée en concurrence par un autre worker
+                await db.rollback()
+                return False
+
+    async def try_acquire(self) -> Optional[int]:
+        """Prendre le bail d'un shard libre non encore détenu ; shard obtenu ou None
+
+        Un shard par appel : les autres workers démarrés en même temps obtiennent les leurs.
+        """
+        for shard in range(self.shards):
+            if shard in self.held:
+                continue
+            if await self._claim(shard):
+                self.held[shard] = time.monotonic()
+                logger.info(f"Bail {self._lease_name(shard)} acquis par {self.holder}")
+                return shard
+        return None
+
+    async def renew(self, shard: Optional[int] = None) -> bool:
+        """Prolonger le bail d'un shard (tous par défaut) ; False si l'un d'eux a été perdu"""
+        kept = True
+        for current in ([shard] if shard is not None else list(self.held)):
+            if current not in self.held:
+                kept = False
+            elif await self._claim(current):
+                self.held[current] = time.monotonic()
+            else:
+                logger.warning(f"Bail {self._lease_name(current)} perdu par {self.holder}")
+                del self.held[current]
+                kept = False
+        return kept
+
+    async def release(self, shard: Optional[int] = None):
+        """Libérer le bail d'un shard (tous par défaut) pour une reprise immédiate"""
+        for current in ([shard] if shard is not None else list(self.held)):
+            if self.held.pop(current, None) is None:
+                continue
+            async with self.session_factory() as db:
+                await db.execute(
+                    delete(SyncLease).where(
+                        and_(SyncLease.name == self._lease_name(current), SyncLease.holder == self.holder)
+                    )
+                )
+                await db.commit()
+
+    async def run(self, work: Callable[[int, int], Awaitable]):
+        """Exécuter work(shard, shards) pour chaque shard détenu ; arrêt du travail d'un shard perdu
+
+        À chaque tour, les baux détenus sont renouvelés puis un shard libre de plus est pris :
+        avec moins de workers que de shards, tous les shards finissent détenus.
+        """
+        tasks: Dict[int, asyncio.Task] = {}
+
+        async def stop(shard: int):
+            task = tasks.pop(shard, None)
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        try:
+            while True:
+                try:
+                    for shard in list(self.held):
+                        if not await self.renew(shard):
+                            # Un autre worker a repris le shard : ne pas synchroniser en parallèle
+                            await stop(shard)
+                    shard = await self.try_acquire()
+                    if shard is not None:
+                        tasks[shard] = asyncio.create_task(work(shard, self.shards))
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'élection du worker de synchronisation: {e}")
+                    for shard, renewed_at in list(self.held.items()):
+                        if time.monotonic() - renewed_at >= self.ttl:
+                            # Bail non renouvelé à temps : il peut déjà être détenu ailleurs
+                            logger.warning(f"Bail {self._lease_name(shard)} expiré, synchronisation suspendue")
+                            del self.held[shard]
+                            await stop(shard)
+                for shard, task in list(tasks.items()):
+                    if task.done():
+                        # Travail arrêté sur erreur : libérer le bail pour un autre worker
+                        if not task.cancelled():
+                            logger.error(f"Boucle de synchronisation arrêtée: {task.exception()!r}")
+                        del tasks[shard]
+                        await self.release(shard)
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            for shard in list(tasks):
+                await stop(shard)
+            try:
+                await self.release()
+            except Exception as e:
+                logger.error(f"Erreur lors de la libération du bail: {e}")
@@ -1,28 +1,42 @@
 import os
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Response, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 import asyncio
 from datetime import datetime
+from typing import Optional
 import httpx
 from dotenv import load_dotenv
 
 # Charger les variables d'environnement depuis .env
 load_dotenv()
 
-from database import engine, SessionLocal, Base
+from sqlalchemy import select
+from database import engine, async_engine, AsyncSessionLocal, Base
 from models import Patient, Study, Comparison, SyncLog
 from schemas import (
     PatientResponse, StudyResponse, ComparisonResponse,
-    SyncStatusResponse, HealthResponse
+    SyncStatusResponse, HealthResponse, StudyChangeBatch
 )
 from crud import (
     get_patients, create_patient, get_studies, get_comparisons,
-    create_sync_log, get_sync_status
+    create_sync_log, get_sync_status, get_sync_logs, get_sync_service_status, get_aggregates, next_cursor,
+    get_diverging_studies, decode_cursor, ID_CURSOR, SYNC_LOG_CURSOR
 )
 from sync_service import SyncService
-from prometheus_client import Counter, Histogram, generate_latest
+from sync_log import SyncLogWriter
+from study_events import StudyEventDispatcher
+from cache import TTLCache
+from health import HealthMonitor
+from pacs_stats import PacsStatsProxy
+from digests import diff_study
+from events import EventBus, format_sse
+from leader import LeaderElection
+from migrations import run_migrations
+from metrics import MetricsMiddleware, instrument_engine
+from prometheus_client import Counter, generate_latest, CONTENT_TYPE_LATEST
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -33,17 +47,7 @@ dcm4chee_url = os.getenv('DCM4CHEE_URL', 'http://localhost:8080')
 orthanc_url = os.getenv('ORTHANC_URL', 'http://localhost:8042')
 xnat_url = os.getenv('XNAT_URL', 'http://localhost:8090')
 
-# Prometheus metrics
-requests_total = Counter(
-    'pacs_requests_total',
-    'Total requests',
-    ['method', 'endpoint']
-)
-request_duration = Histogram(
-    'pacs_request_duration_seconds',
-    'Request duration',
-    ['method', 'endpoint']
-)
+# Prometheus metrics (requêtes API, appels amont et SQL : voir metrics.py)
 sync_errors = Counter(
     'pacs_sync_errors_total',
     'Total sync errors',
@@ -57,33 +61,144 @@ pacs_availability = Counter(
 
 # Création des tables
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+
+# Durée des requêtes SQL (moteurs synchrone et asynchrone)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 
 # Service de synchronisation
 sync_service = None
+study_dispatcher = None
+
+# Compteurs du statut et des statistiques (interrogés en continu par les tableaux de bord)
+stats_cache = TTLCache(ttl=float(os.getenv('STATS_CACHE_TTL', '5')))
+
+# Sondes de santé concurrentes, rafraîchies en tâche de fond
+health_monitor = HealthMonitor(
+    targets={
+        'dcm4chee': f"{dcm4chee_url}/dcm4chee-arc/ui2/",
+        'orthanc': f"{orthanc_url}/system",
+        'xnat': xnat_url
+    },
+    interval=float(os.getenv('HEALTH_INTERVAL', '15')),
+    timeout=float(os.getenv('HEALTH_TIMEOUT', '5'))
+)
+
+# Progression de la synchronisation diffusée aux tableaux de bord (SSE)
+sync_events = EventBus(history=int(os.getenv('SYNC_EVENTS_HISTORY', '200')))
+
+# Statistiques des PACS (proxy avec cache par endpoint)
+pacs_stats = PacsStatsProxy(
+    orthanc_url=orthanc_url,
+    dcm4chee_url=dcm4chee_url,
+    ttls={
+        'orthanc_statistics': float(os.getenv('PACS_STATS_TTL', '10')),
+        'dcm4chee_statistics': float(os.getenv('PACS_STATS_TTL', '10')),
+        'orthanc_system': float(os.getenv('PACS_INFO_TTL', '300')),
+        'orthanc_plugins': float(os.getenv('PACS_INFO_TTL', '300'))
+    }
+)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global sync_service
+    global sync_service, study_dispatcher
+    log_writer = SyncLogWriter(
+        flush_interval=float(os.getenv('SYNC_LOG_FLUSH_INTERVAL', '1')),
+        batch_size=int(os.getenv('SYNC_LOG_BATCH_SIZE', '200')),
+        retention_days=int(os.getenv('SYNC_LOG_RETENTION_DAYS', '30')),
+        max_rows=int(os.getenv('SYNC_LOG_MAX_ROWS', '100000')),
+        cache=stats_cache
+    )
+    log_task = asyncio.create_task(log_writer.run())
     sync_service = SyncService(
         dcm4chee_url=os.getenv('DCM4CHEE_URL', 'http://localhost:8080'),
         orthanc_url=os.getenv('ORTHANC_URL', 'http://localhost:8042'),
         xnat_url=os.getenv('XNAT_URL', 'http://localhost:8090'),
-        sync_interval=int(os.getenv('SYNC_INTERVAL', '60'))
+        sync_interval=int(os.getenv('SYNC_INTERVAL', '60')),
+        concurrency=int(os.getenv('SYNC_CONCURRENCY', '8')),
+        page_size=int(os.getenv('SYNC_PAGE_SIZE', '500')),
+        sync_mode=os.getenv('SYNC_MODE', 'incremental'),
+        reconcile_interval=int(os.getenv('RECONCILE_INTERVAL', '3600')),
+        batch_size=int(os.getenv('SYNC_BATCH_SIZE', '500')),
+        pacs_concurrency={
+            'dcm4chee': int(os.getenv('DCM4CHEE_CONCURRENCY', '4')),
+            'orthanc': int(os.getenv('ORTHANC_CONCURRENCY', '4'))
+        },
+        benchmark={
+            'repetitions': int(os.getenv('BENCHMARK_REPETITIONS', '5')),
+            'warmup': int(os.getenv('BENCHMARK_WARMUP', '1')),
+            'concurrency': [int(c) for c in os.getenv('BENCHMARK_CONCURRENCY', '1,4').split(',')],
+            'operations': os.getenv('BENCHMARK_OPERATIONS', 'qido,metadata,retrieve').split(',')
+        } if os.getenv('BENCHMARK_ENABLED', 'false').lower() == 'true' else None,
+        benchmark_sample=float(os.getenv('BENCHMARK_SAMPLE', '0.05')),
+        orthanc_dicomweb_root=os.getenv('ORTHANC_DICOMWEB_ROOT', '/dicom-web'),
+        log_writer=log_writer,
+        cache=stats_cache,
+        transfer={
+            'project': os.getenv('XNAT_PROJECT', 'PACS'),
+            'auth': (os.getenv('XNAT_USER'), os.getenv('XNAT_PASSWORD')) if os.getenv('XNAT_USER') else None,
+            'chunk_size': int(os.getenv('TRANSFER_CHUNK_SIZE', str(1 << 20))),
+            'series_concurrency': int(os.getenv('TRANSFER_SERIES_CONCURRENCY', '4')),
+            'retries': int(os.getenv('TRANSFER_RETRIES', '3'))
+        },
+        events=sync_events,
+        upstream={
+            'retries': int(os.getenv('UPSTREAM_RETRIES', '3')),
+            'failure_threshold': int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', '5')),
+            'reset_timeout': float(os.getenv('UPSTREAM_BREAKER_RESET', '30')),
+            'max_timeout': float(os.getenv('UPSTREAM_MAX_TIMEOUT', '60')),
+            'hedge_after': float(os.getenv('UPSTREAM_HEDGE_AFTER')) if os.getenv('UPSTREAM_HEDGE_AFTER') else None,
+            'rate_limits': {
+                'dcm4chee': float(os.getenv('DCM4CHEE_RATE_LIMIT', '0')),
+                'orthanc': float(os.getenv('ORTHANC_RATE_LIMIT', '0'))
+            }
+        }
     )
     
     # Démarrer la synchronisation en background
-    sync_task = asyncio.create_task(sync_service.start_sync_loop())
+    election = None
+    if os.getenv('SYNC_LEADER_ELECTION', 'true').lower() == 'true':
+        # Plusieurs workers/réplicas : un seul worker par shard exécute la boucle (bail en base) ;
+        # les shards sans worker libre sont repris par les workers déjà actifs
+        election = LeaderElection(
+            shards=int(os.getenv('SYNC_SHARDS', '1')),
+            ttl=float(os.getenv('SYNC_LEASE_TTL', '30'))
+        )
+        sync_task = asyncio.create_task(election.run(sync_service.start_sync_loop))
+    else:
+        sync_task = asyncio.create_task(sync_service.start_sync_loop())
     logger.info("Sync service started")
+    health_task = asyncio.create_task(health_monitor.run())
+    
+    # Synchronisations ciblées déclenchées par les notifications Orthanc
+    study_dispatcher = StudyEventDispatcher(
+        sync_service.sync_studies,
+        debounce=float(os.getenv('WEBHOOK_DEBOUNCE', '2')),
+        max_batch=int(os.getenv('WEBHOOK_MAX_BATCH', '50')),
+        # Seul le détenteur du shard 0 (lecture des PACS) applique les notifications
+        active=(lambda: election.holds(0)) if election is not None else None
+    )
+    dispatch_task = asyncio.create_task(study_dispatcher.run())
     
     yield
     
     # Shutdown
+    dispatch_task.cancel()
+    health_task.cancel()
     sync_task.cancel()
     try:
         await sync_task
     except asyncio.CancelledError:
         logger.info("Sync service stopped")
+    await sync_service.close()
+    # Arrêt de l'écrivain en dernier : les logs en tampon sont écrits
+    log_task.cancel()
+    await asyncio.gather(log_task, return_exceptions=True)
+    await asyncio.gather(health_task, dispatch_task, return_exceptions=True)
+    await health_monitor.close()
+    await pacs_stats.close()
 
 app = FastAPI(
     title="PACS Multi-Systèmes",
@@ -99,74 +214,49 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Latence, statut et taille des réponses par modèle de route
+app.add_middleware(MetricsMiddleware)
+
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def cached_aggregates(db):
+    """Compteurs du tableau de bord (une requête, mise en cache quelques secondes)"""
+    return await stats_cache.get_or_load('aggregates', lambda: get_aggregates(db))
+
+async def keyset_page(response: Response, fetch, *cursor_columns: str, limit: int,
+                      cursor: Optional[str] = None, cursor_types=ID_CURSOR):
+    """Page d'une liste paginée par clé ; curseur suivant dans l'en-tête X-Next-Cursor
+    Le curseur reçu est validé avant la requête : seules ses erreurs donnent un 400."""
+    if cursor:
+        try:
+            decode_cursor(cursor, *cursor_types)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    items = await fetch()
+    cursor = next_cursor(items, limit, *cursor_columns)
+    if cursor:
+        response.headers['X-Next-Cursor'] = cursor
+    return items
 
 # Health endpoint
 @app.get("/health", response_model=HealthResponse)
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
-    """Vérifier la santé de tous les services"""
-    health_status = {}
-    
-    # SQLite local
-    try:
-        from sqlalchemy import text
-        db = SessionLocal()
-        db.execute(text("SELECT 1"))
-        health_status['database'] = 'healthy (SQLite)'
-        db.close()
-    except Exception as e:
-        health_status['database'] = f'unhealthy: {str(e)}'
-    
-    # Vérifier DCM4CHEE
-    try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get("http://localhost:8080/dcm4chee-arc/ui2/", timeout=10)
-            health_status['dcm4chee'] = 'healthy' if response.status_code == 200 else 'unhealthy'
-    except Exception as e:
-        health_status['dcm4chee'] = f'unhealthy: {type(e).__name__}'
-        logger.error(f"DCM4CHEE health check failed: {type(e).__name__} - {e}")
-    
-    # Vérifier Orthanc
-    try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get("http://localhost:8042/system", timeout=10)
-            health_status['orthanc'] = 'healthy' if response.status_code == 200 else 'unhealthy'
-    except Exception as e:
-        health_status['orthanc'] = f'unhealthy: {type(e).__name__}'
-        logger.error(f"Orthanc health check failed: {type(e).__name__} - {e}")
-    
-    # Vérifier XNAT
-    try:
-        async with httpx.AsyncClient(follow_redirects=True) as client:
-            response = await client.get("http://localhost:8090", timeout=10)
-            health_status['xnat'] = 'healthy' if response.status_code == 200 else 'unhealthy'
-    except Exception as e:
-        health_status['xnat'] = f'unhealthy: {type(e).__name__}'
-        logger.error(f"XNAT health check failed: {type(e).__name__} - {e}")
-    
-    all_healthy = all(v == 'healthy' for v in health_status.values())
-    
-    return HealthResponse(
-        status='healthy' if all_healthy else 'degraded',
-        timestamp=datetime.utcnow(),
-        services=health_status
-    )
+    """Santé de tous les services (dernier instantané du moniteur, âge en µs)"""
+    return HealthResponse(**await health_monitor.snapshot())
 
 # Patients endpoints
 @app.get("/api/patients", response_model=list[PatientResponse])
-async def list_patients(db = Depends(get_db)):
-    """Récupérer tous les patients"""
-    requests_total.labels(method='GET', endpoint='/api/patients').inc()
-    return get_patients(db)
+async def list_patients(response: Response, cursor: str = None, limit: int = Query(100, ge=1, le=1000),
+                        db = Depends(get_db)):
+    """Récupérer les patients (pagination par curseur)"""
+    return await keyset_page(response, lambda: get_patients(db, cursor, limit), 'id', limit=limit, cursor=cursor)
 
 @app.post("/api/patients/sync")
 async def sync_patients(db = Depends(get_db)):
@@ -181,32 +271,43 @@ async def sync_patients(db = Depends(get_db)):
 
 # Studies endpoints
 @app.get("/api/studies", response_model=list[StudyResponse])
-async def list_studies(patient_id: str = None, db = Depends(get_db)):
-    """Récupérer les études d'un patient"""
-    requests_total.labels(method='GET', endpoint='/api/studies').inc()
-    return get_studies(db, patient_id)
+async def list_studies(response: Response, patient_id: str = None, cursor: str = None,
+                       limit: int = Query(100, ge=1, le=1000), db = Depends(get_db)):
+    """Récupérer les études d'un patient (pagination par curseur)"""
+    return await keyset_page(response, lambda: get_studies(db, patient_id, cursor, limit), 'id', limit=limit, cursor=cursor)
+
+@app.post("/api/studies/sync")
+async def sync_studies():
+    """Forcer la synchronisation études/séries/instances entre les PACS"""
+    try:
+        result = await sync_service.sync_hierarchy()
+        return {"status": "success", "synced": result}
+    except Exception as e:
+        sync_errors.labels(service='hierarchy').inc()
+        logger.error(f"Hierarchy sync error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/studies/{study_id}/comparison", response_model=ComparisonResponse)
 async def get_study_comparison(study_id: str, db = Depends(get_db)):
     """Comparer une étude entre DCM4CHEE et Orthanc"""
-    requests_total.labels(method='GET', endpoint='/api/studies/comparison').inc()
-    comparison = db.query(Comparison).filter(Comparison.study_id == study_id).first()
+    comparison = await db.scalar(select(Comparison).where(Comparison.study_id == study_id).limit(1))
     if not comparison:
         raise HTTPException(status_code=404, detail="Comparison not found")
     return comparison
 
 # Comparisons endpoints
 @app.get("/api/comparisons", response_model=list[ComparisonResponse])
-async def list_comparisons(db = Depends(get_db)):
-    """Récupérer toutes les comparaisons"""
-    requests_total.labels(method='GET', endpoint='/api/comparisons').inc()
-    return get_comparisons(db)
+async def list_comparisons(response: Response, cursor: str = None, limit: int = Query(100, ge=1, le=1000),
+                           db = Depends(get_db)):
+    """Récupérer les comparaisons (pagination par curseur)"""
+    return await keyset_page(response, lambda: get_comparisons(db, cursor, limit), 'id', limit=limit, cursor=cursor)
 
 @app.post("/api/comparisons/generate")
 async def generate_comparisons(db = Depends(get_db)):
     """Générer les comparaisons pour tous les patients"""
     try:
-        count = await sync_service.generate_comparisons()
+        # Déclenchement manuel : toutes les études, quel que soit le shard (éventuellement périmé) du worker
+        count = await sync_service.generate_comparisons(all_shards=True)
         return {"status": "success", "comparisons_generated": count}
     except Exception as e:
         sync_errors.labels(service='comparisons').inc()
@@ -217,15 +318,68 @@ async def generate_comparisons(db = Depends(get_db)):
 @app.get("/api/sync/status", response_model=SyncStatusResponse)
 async def get_sync_status_endpoint(db = Depends(get_db)):
     """Récupérer le statut de la synchronisation"""
-    requests_total.labels(method='GET', endpoint='/api/sync/status').inc()
-    return get_sync_status(db)
+    return await get_sync_status(db, await cached_aggregates(db))
+
+@app.post("/api/sync/reconcile")
+async def reconcile_sync():
+    """Forcer une réconciliation complète des deux PACS"""
+    try:
+        result = await sync_service.reconcile()
+        return {"status": "success", **result}
+    except Exception as e:
+        sync_errors.labels(service='reconcile').inc()
+        logger.error(f"Reconciliation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/webhooks/orthanc/studies", status_code=202)
+async def orthanc_study_webhook(batch: StudyChangeBatch, x_webhook_token: str = Header(None)):
+    """Notifications d'études Orthanc (scripts Lua) : synchronisation ciblée après anti-rebond"""
+    expected_token = os.getenv('WEBHOOK_TOKEN')
+    if expected_token and x_webhook_token != expected_token:
+        raise HTTPException(status_code=401, detail="Invalid webhook token")
+    if study_dispatcher is None:
+        raise HTTPException(status_code=503, detail="Sync service not started")
+    queued = study_dispatcher.submit(event.id for event in batch.events)
+    return {"status": "accepted", "queued": queued, "pending": study_dispatcher.pending}
 
 @app.get("/api/sync/history")
-async def get_sync_history(limit: int = 50, db = Depends(get_db)):
-    """Récupérer l'historique de synchronisation"""
-    requests_total.labels(method='GET', endpoint='/api/sync/history').inc()
-    logs = db.query(SyncLog).order_by(SyncLog.timestamp.desc()).limit(limit).all()
-    return logs
+async def get_sync_history(response: Response, cursor: str = None, limit: int = Query(50, ge=1, le=1000),
+                           db = Depends(get_db)):
+    """Récupérer l'historique de synchronisation (pagination par curseur)"""
+    return await keyset_page(
+        response, lambda: get_sync_logs(db, cursor, limit), 'timestamp', 'id', limit=limit,
+        cursor=cursor, cursor_types=SYNC_LOG_CURSOR
+    )
+
+@app.get("/api/sync/events")
+async def stream_sync_events(since: int = None, last_event_id: str = Header(None)):
+    """Progression de la synchronisation en direct (Server-Sent Events), sans requête en base"""
+    # Reconnexion EventSource : reprise après le dernier événement reçu
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else since
+    keepalive = float(os.getenv('SYNC_EVENTS_KEEPALIVE', '15'))
+
+    async def stream():
+        async for event in sync_events.subscribe(after, keepalive=keepalive):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/sync/services")
+async def get_sync_services(db = Depends(get_db)):
+    """Dernière synchronisation de chaque service"""
+    return await get_sync_service_status(db)
+
+@app.get("/api/sync/consistency")
+async def get_consistency(response: Response, cursor: str = None, limit: int = Query(100, ge=1, le=1000),
+                          db = Depends(get_db)):
+    """Études dont le contenu diffère entre les PACS (empreintes), détaillées par série et instance"""
+    studies = await keyset_page(response, lambda: get_diverging_studies(db, cursor, limit), 'id', limit=limit,
+                                cursor=cursor)
+    return [await diff_study(db, study) for study in studies]
 
 # Anonymization endpoints
 @app.post("/api/anonymize/study/{study_id}")
@@ -243,94 +397,55 @@ async def anonymize_study(study_id: str, db = Depends(get_db)):
 @app.get("/metrics")
 async def metrics():
     """Métriques Prometheus"""
-    return generate_latest()
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 # Statistics endpoints
 @app.get("/api/statistics")
 async def get_statistics(db = Depends(get_db)):
     """Statistiques globales du système"""
-    requests_total.labels(method='GET', endpoint='/api/statistics').inc()
     
-    total_patients = db.query(Patient).count()
-    total_studies = db.query(Study).count()
-    total_comparisons = db.query(Comparison).count()
+    aggregates = await cached_aggregates(db)
     
     return {
-        "total_patients": total_patients,
-        "total_studies": total_studies,
-        "total_comparisons": total_comparisons,
+        "total_patients": aggregates['total_patients'],
+        "total_studies": aggregates['total_studies'],
+        "total_comparisons": aggregates['total_comparisons'],
         "timestamp": datetime.utcnow()
     }
 
 @app.get("/api/orthanc/statistics")
 async def get_orthanc_statistics():
-    """Statistiques Orthanc via proxy"""
+    """Statistiques Orthanc via proxy (cache partagé)"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{orthanc_url}/statistics")
-            if response.status_code == 200:
-                return response.json()
-            return {"error": "Orthanc unavailable", "status_code": response.status_code}
+        return await pacs_stats.orthanc_statistics()
+    except httpx.HTTPStatusError as e:
+        return {"error": "Orthanc unavailable", "status_code": e.response.status_code}
     except Exception as e:
         return {"error": str(e), "CountPatients": 0, "CountStudies": 0, "CountInstances": 0}
 
 @app.get("/api/orthanc/system")
 async def get_orthanc_system():
-    """Informations système Orthanc via proxy"""
+    """Informations système Orthanc via proxy (cache partagé)"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{orthanc_url}/system")
-            if response.status_code == 200:
-                return response.json()
-            return {"error": "Orthanc unavailable"}
+        return await pacs_stats.orthanc_system()
+    except httpx.HTTPStatusError:
+        return {"error": "Orthanc unavailable"}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/api/orthanc/plugins")
 async def get_orthanc_plugins():
-    """Liste des plugins Orthanc via proxy"""
+    """Liste des plugins Orthanc via proxy (cache partagé)"""
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{orthanc_url}/plugins")
-            if response.status_code == 200:
-                return response.json()
-            return []
-    except Exception as e:
+        return await pacs_stats.orthanc_plugins()
+    except Exception:
         return []
 
 @app.get("/api/dcm4chee/statistics")
 async def get_dcm4chee_statistics():
-    """Statistiques DCM4CHEE via proxy"""
+    """Statistiques DCM4CHEE via proxy (compteurs QIDO-RS, cache partagé)"""
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            # Récupérer les patients
-            patients_response = await client.get(f"{dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/patients")
-            patients_count = 0
-            if patients_response.status_code == 200:
-                patients = patients_response.json()
-                patients_count = len(patients)
-            
-            # Récupérer les études
-            studies_response = await client.get(f"{dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/studies")
-            studies_count = 0
-            instances_count = 0
-            if studies_response.status_code == 200:
-                studies = studies_response.json()
-                studies_count = len(studies)
-                # Compter les instances
-                for study in studies:
-                    try:
-                        series_count = study.get('00201206', {}).get('Value', [0])[0]
-                        instances_count += int(series_count) if series_count else 0
-                    except:
-                        pass
-            
-            return {
-                "CountPatients": patients_count,
-                "CountStudies": studies_count,
-                "CountInstances": instances_count,
-                "TotalDiskSizeMB": 0  # Non disponible via DICOMweb
-            }
+        return await pacs_stats.dcm4chee_statistics()
     except Exception as e:
         return {"error": str(e), "CountPatients": 0, "CountStudies": 0, "CountInstances": 0}
 
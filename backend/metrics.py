@@ -0,0 +1,165 @@
+"""
+Métriques Prometheus du backend
+Requêtes API (middleware ASGI), appels PACS amont (hooks httpx) et état du client
+résilient (upstream.py), requêtes SQL (événements SQLAlchemy), transferts vers XNAT
+et sondes de santé.
+"""
+import time
+from typing import Dict
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+requests_total = Counter(
+    'pacs_requests_total',
+    'Total requests',
+    ['method', 'endpoint', 'status']
+)
+request_duration = Histogram(
+    'pacs_request_duration_seconds',
+    'Request duration',
+    ['method', 'endpoint', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+response_size = Histogram(
+    'pacs_response_size_bytes',
+    'Response body size',
+    ['method', 'endpoint'],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+)
+upstream_duration = Histogram(
+    'pacs_upstream_request_duration_seconds',
+    'Upstream PACS request duration (until response headers)',
+    ['service', 'method', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+upstream_circuit_state = Gauge(
+    'pacs_upstream_circuit_state',
+    'Upstream circuit breaker state (0 closed, 1 half-open, 2 open)',
+    ['service']
+)
+upstream_rejected = Counter(
+    'pacs_upstream_rejected_total',
+    'Upstream requests rejected by an open circuit',
+    ['service']
+)
+upstream_retries = Counter(
+    'pacs_upstream_retries_total',
+    'Upstream request retries',
+    ['service', 'reason']
+)
+upstream_hedges = Counter(
+    'pacs_upstream_hedges_total',
+    'Hedged upstream reads (sent, won by the hedge)',
+    ['service', 'outcome']
+)
+upstream_timeout = Gauge(
+    'pacs_upstream_timeout_seconds',
+    'Current adaptive upstream read timeout',
+    ['service']
+)
+upstream_throttle_wait = Histogram(
+    'pacs_upstream_throttle_wait_seconds',
+    'Time spent waiting for the per-PACS rate limit',
+    ['service'],
+    buckets=LATENCY_BUCKETS
+)
+db_query_duration = Histogram(
+    'pacs_db_query_duration_seconds',
+    'Database query duration',
+    ['operation'],
+    buckets=LATENCY_BUCKETS
+)
+transfer_bytes = Counter(
+    'pacs_transfer_bytes_total',
+    'DICOM bytes routed from DCM4CHEE to XNAT'
+)
+transfer_throughput = Histogram(
+    'pacs_transfer_bytes_per_second',
+    'Per-series DCM4CHEE to XNAT transfer throughput',
+    buckets=(1e5, 5e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8)
+)
+health_probe_duration = Histogram(
+    'pacs_health_probe_duration_seconds',
+    'Health probe duration',
+    ['service', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+class MetricsMiddleware:
+    """Middleware ASGI : latence, statut et taille de réponse par modèle de route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                size += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Modèle de route (/api/studies/{study_id}/comparison) : cardinalité bornée
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', '<unmatched>')
+            method = scope['method']
+            requests_total.labels(method=method, endpoint=endpoint, status=status).inc()
+            request_duration.labels(method=method, endpoint=endpoint, status=status).observe(
+                time.perf_counter() - start
+            )
+            response_size.labels(method=method, endpoint=endpoint).observe(size)
+
+def upstream_event_hooks(services: Dict[str, str]) -> Dict[str, list]:
+    """Hooks httpx mesurant les appels amont ; `services` associe un nom de service à son URL de base"""
+    def service_for(url: str) -> str:
+        for name, base_url in services.items():
+            if base_url and url.startswith(base_url):
+                return name
+        return 'other'
+
+    async def on_request(request):
+        request.extensions['metrics_start'] = time.perf_counter()
+
+    async def on_response(response):
+        start = response.request.extensions.get('metrics_start')
+        if start is None:
+            return
+        upstream_duration.labels(
+            service=service_for(str(response.request.url)),
+            method=response.request.method,
+            status=response.status_code
+        ).observe(time.perf_counter() - start)
+
+    return {'request': [on_request], 'response': [on_response]}
+
+def instrument_engine(engine):
+    """Mesurer la durée des requêtes SQL d'un moteur (synchrone ou `async_engine.sync_engine`)"""
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['metrics_query_start'].pop()
+        operation = statement.lstrip().split(' ', 1)[0].lower() or 'other'
+        db_query_duration.labels(operation=operation).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # Requête en échec : retirer son horodatage pour garder la pile alignée
+        if context.connection is not None and context.connection.info.get('metrics_query_start'):
+            context.connection.info['metrics_query_start'].pop()
@@ -0,0 +1,84 @@
+"""
+Migrations du schéma pour les bases existantes
+create_all() crée les tables manquantes mais ne modifie pas les tables déjà présentes.
+"""
+import logging
+from sqlalchemy import bindparam, inspect, select, text, update
+from database import Base
+import models  # Enregistre les tables dans Base.metadata
+from models import Patient, shard_key
+
+logger = logging.getLogger(__name__)
+
+# Clés devenues uniques : table -> (clé, [(table enfant, colonne de rattachement, lignes supprimées)])
+# Les enfants d'un doublon sont rattachés à la ligne conservée ; les comparaisons sont recalculées.
+UNIQUE_KEYS = {
+    'studies': ('study_uid', [
+        ('series', 'study_id', False), ('annotations', 'study_id', False), ('comparisons', 'study_id', True)
+    ]),
+    'series': ('series_uid', [('instances', 'series_id', False), ('annotations', 'series_id', False)]),
+    'instances': ('sop_instance_uid', []),
+}
+
+def run_migrations(engine):
+    """Ajouter aux tables existantes les colonnes et index déclarés dans les modèles"""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                logger.info(f"Migration : colonne {table.name}.{column.name} ajoutée")
+            # Index déclarés dans les modèles (create_all ne les crée qu'avec la table)
+            existing_indexes = {index['name']: bool(index['unique']) for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    if index.unique:
+                        _merge_duplicates(connection, table.name)
+                    index.create(connection, checkfirst=True)
+                    logger.info(f"Migration : index {index.name} créé")
+                elif index.unique and not existing_indexes[index.name]:
+                    # Index devenu unique : doublons fusionnés puis index recréé
+                    _merge_duplicates(connection, table.name)
+                    index.drop(connection)
+                    index.create(connection)
+                    logger.info(f"Migration : index {index.name} rendu unique")
+        if inspector.has_table(Patient.__tablename__):
+            _backfill_shard_keys(connection)
+
+def _backfill_shard_keys(connection):
+    """Clé de shard des patients créés avant la colonne (calculée à l'insertion ensuite)"""
+    ids = connection.execute(select(Patient.id).where(Patient.shard_key.is_(None))).scalars().all()
+    if ids:
+        connection.execute(
+            update(Patient.__table__).where(Patient.id == bindparam('b_id')).values(shard_key=bindparam('key')),
+            [{'b_id': patient_id, 'key': shard_key(patient_id)} for patient_id in ids]
+        )
+        logger.info(f"Migration : clé de shard de {len(ids)} patients calculée")
+
+def _merge_duplicates(connection, table: str):
+    """Fusionner les lignes d'une même clé (plus petit id conservé) avant l'index unique"""
+    if table not in UNIQUE_KEYS:
+        return
+    key, children = UNIQUE_KEYS[table]
+    kept = f"(SELECT MIN(k.id) FROM {table} k WHERE k.{key} = {table}.{key})"
+    duplicates = f"SELECT id FROM {table} WHERE {key} IS NOT NULL AND id <> {kept}"
+    count = connection.execute(text(f"SELECT COUNT(*) FROM ({duplicates}) d")).scalar()
+    if not count:
+        return
+    for child, column, remove in children:
+        if remove:
+            connection.execute(text(f"DELETE FROM {child} WHERE {column} IN ({duplicates})"))
+        else:
+            connection.execute(text(
+                f"UPDATE {child} SET {column} = (SELECT MIN(k.id) FROM {table} k WHERE k.{key} = "
+                f"(SELECT d.{key} FROM {table} d WHERE d.id = {child}.{column})) "
+                f"WHERE {column} IN ({duplicates})"
+            ))
+    connection.execute(text(f"DELETE FROM {table} WHERE id IN ({duplicates})"))
+    logger.warning(f"Migration : {count} doublons de {table}.{key} fusionnés")
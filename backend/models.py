@@ -1,8 +1,16 @@
-from sqlalchemy import Column, String, Integer, DateTime, Float, JSON, ForeignKey, Text, Boolean
+import zlib
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Float, JSON, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 
+def shard_key(value) -> int:
+    """Hachage stable d'un identifiant (CRC32), base du découpage en shards (voir leader.shard_of)"""
+    return zlib.crc32((value or '').encode())
+
+def _patient_shard_key(context):
+    return shard_key(context.get_current_parameters().get('id'))
+
 class Patient(Base):
     __tablename__ = "patients"
     
@@ -14,6 +22,7 @@ class Patient(Base):
     dcm4chee_id = Column(String)
     orthanc_id = Column(String)
     synchronized = Column(Boolean, default=False)
+    shard_key = Column(BigInteger, default=_patient_shard_key)  # shard_key(id), filtré en SQL par shard
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -21,16 +30,24 @@ class Patient(Base):
 
 class Study(Base):
     __tablename__ = "studies"
+    __table_args__ = (
+        # Pagination par clé des études d'un patient
+        Index("ix_studies_patient_id_id", "patient_id", "id"),
+    )
     
     id = Column(String, primary_key=True)
     patient_id = Column(String, ForeignKey("patients.id"))
-    study_uid = Column(String)
+    study_uid = Column(String, unique=True, index=True)  # Clé des upserts concurrents (ON CONFLICT)
     study_date = Column(DateTime)
     study_time = Column(String)
     study_description = Column(String)
     dcm4chee_id = Column(String)
-    orthanc_id = Column(String)
+    orthanc_id = Column(String, index=True)
     image_count = Column(Integer, default=0)
+    series_count = Column(Integer, default=0)
+    orthanc_last_update = Column(String)  # LastUpdate Orthanc, pour l'empreinte de changement
+    dcm4chee_digest = Column(String)  # Empreintes de contenu par PACS (voir digests.py)
+    orthanc_digest = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     patient = relationship("Patient", back_populates="studies")
@@ -40,31 +57,36 @@ class Series(Base):
     __tablename__ = "series"
     
     id = Column(String, primary_key=True)
-    study_id = Column(String, ForeignKey("studies.id"))
-    series_uid = Column(String)
+    study_id = Column(String, ForeignKey("studies.id"), index=True)
+    series_uid = Column(String, unique=True, index=True)
     series_number = Column(String)
     modality = Column(String)
     series_description = Column(String)
     dcm4chee_id = Column(String)
-    orthanc_id = Column(String)
+    orthanc_id = Column(String, index=True)
     instance_count = Column(Integer, default=0)
+    dcm4chee_digest = Column(String)  # Empreintes des SOPInstanceUID par PACS (voir digests.py)
+    orthanc_digest = Column(String)
+    digest_dirty = Column(Boolean, default=False, index=True)  # Empreintes à recalculer (instances modifiées)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Instance(Base):
     __tablename__ = "instances"
     
     id = Column(String, primary_key=True)
-    series_id = Column(String)
-    sop_instance_uid = Column(String)
+    series_id = Column(String, index=True)
+    sop_instance_uid = Column(String, unique=True, index=True)
     dcm4chee_id = Column(String)
     orthanc_id = Column(String)
+    dcm4chee_seen_at = Column(DateTime)  # Dernier listage complet contenant l'instance, par PACS
+    orthanc_seen_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Comparison(Base):
     __tablename__ = "comparisons"
     
     id = Column(String, primary_key=True)
-    study_id = Column(String, ForeignKey("studies.id"))
+    study_id = Column(String, ForeignKey("studies.id"), index=True)
     dcm4chee_images = Column(Integer, default=0)
     orthanc_images = Column(Integer, default=0)
     dcm4chee_response_time = Column(Float)
@@ -73,6 +95,8 @@ class Comparison(Base):
     orthanc_success = Column(Boolean, default=False)
     differences = Column(JSON, default={})
     sync_status = Column(String, default="pending")
+    fingerprint = Column(String)  # Empreinte de l'étude lors de la dernière comparaison
+    benchmark = Column(JSON)  # Distributions de latence DICOMweb par PACS, opération et concurrence
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -80,6 +104,11 @@ class Comparison(Base):
 
 class SyncLog(Base):
     __tablename__ = "sync_logs"
+    __table_args__ = (
+        # Historique paginé par clé (timestamp, id) et dernier log par service
+        Index("ix_sync_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_sync_logs_service_timestamp", "service", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     service = Column(String)  # dcm4chee, orthanc, xnat
@@ -89,6 +118,31 @@ class SyncLog(Base):
     details = Column(JSON, default={})
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+class SyncServiceStatus(Base):
+    __tablename__ = "sync_service_status"
+
+    service = Column(String, primary_key=True)  # Dernier log de chaque service, maintenu par SyncLogWriter
+    action = Column(String)
+    status = Column(String)
+    message = Column(Text)
+    last_sync = Column(DateTime)
+    last_success = Column(DateTime)
+
+class SyncCursor(Base):
+    __tablename__ = "sync_cursors"
+
+    source = Column(String, primary_key=True)  # orthanc
+    last_seq = Column(Integer, default=0)  # Dernier numéro de séquence /changes traité
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SyncLease(Base):
+    __tablename__ = "sync_leases"
+
+    name = Column(String, primary_key=True)  # sync:<shard>
+    holder = Column(String)  # Worker détenteur (hôte:pid:jeton)
+    expires_at = Column(DateTime)  # Bail libre au-delà (worker arrêté ou bloqué)
+    acquired_at = Column(DateTime)
+
 class Annotation(Base):
     __tablename__ = "annotations"
     
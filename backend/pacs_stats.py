@@ -0,0 +1,87 @@
+"""
+Proxy des statistiques Orthanc et DCM4CHEE
+Client partagé, cache à durée de vie par endpoint et chargement unique par clé
+(single-flight) : les tableaux de bord interrogés en continu ne sollicitent les PACS
+qu'une fois par période. Les compteurs DCM4CHEE passent par les endpoints /count
+de QIDO-RS au lieu de télécharger les listes complètes.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+import httpx
+from cache import TTLCache
+from metrics import upstream_event_hooks
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie par défaut des réponses (secondes)
+DEFAULT_TTLS = {
+    'orthanc_statistics': 10.0,
+    'orthanc_system': 300.0,
+    'orthanc_plugins': 300.0,
+    'dcm4chee_statistics': 10.0
+}
+
+class PacsStatsProxy:
+    def __init__(self, orthanc_url: str, dcm4chee_url: str, ttls: Optional[Dict[str, float]] = None,
+                 timeout: float = 10.0):
+        self.orthanc_url = orthanc_url
+        self.dcm4chee_url = dcm4chee_url
+        self.timeout = timeout
+        self.caches = {name: TTLCache(ttl) for name, ttl in {**DEFAULT_TTLS, **(ttls or {})}.items()}
+        self.client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Client HTTP keep-alive partagé par tous les endpoints"""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=self.timeout,
+                event_hooks=upstream_event_hooks({'orthanc': self.orthanc_url, 'dcm4chee': self.dcm4chee_url})
+            )
+        return self.client
+
+    async def close(self):
+        """Fermer le client HTTP partagé"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _cached(self, name: str, loader) -> Any:
+        return await self.caches[name].get_or_load(name, loader)
+
+    async def _get_json(self, url: str, **kwargs) -> Any:
+        response = await self._get_client().get(url, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    async def orthanc_statistics(self) -> Dict:
+        """/statistics d'Orthanc"""
+        return await self._cached('orthanc_statistics', lambda: self._get_json(f"{self.orthanc_url}/statistics"))
+
+    async def orthanc_system(self) -> Dict:
+        """/system d'Orthanc"""
+        return await self._cached('orthanc_system', lambda: self._get_json(f"{self.orthanc_url}/system"))
+
+    async def orthanc_plugins(self) -> list:
+        """/plugins d'Orthanc"""
+        return await self._cached('orthanc_plugins', lambda: self._get_json(f"{self.orthanc_url}/plugins"))
+
+    async def dcm4chee_statistics(self) -> Dict:
+        """Nombres de patients, études et instances DCM4CHEE, au format de /statistics d'Orthanc"""
+        return await self._cached('dcm4chee_statistics', self._load_dcm4chee_statistics)
+
+    async def _count(self, level: str) -> int:
+        """Compteur QIDO-RS DCM4CHEE ({"count": n}), calculé par l'archive"""
+        data = await self._get_json(f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/{level}/count")
+        return int(data.get('count', 0))
+
+    async def _load_dcm4chee_statistics(self) -> Dict:
+        patients, studies, instances = await asyncio.gather(
+            self._count('patients'), self._count('studies'), self._count('instances')
+        )
+        return {
+            "CountPatients": patients,
+            "CountStudies": studies,
+            "CountInstances": instances,
+            "TotalDiskSizeMB": 0  # Non disponible via DICOMweb
+        }
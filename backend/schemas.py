@@ -6,6 +6,7 @@ class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
     services: Dict[str, str]
+    age_us: Optional[int] = None  # Âge de l'instantané servi, en microsecondes
 
 class PatientBase(BaseModel):
     name: str
@@ -56,6 +57,7 @@ class ComparisonResponse(BaseModel):
     dcm4chee_success: bool
     orthanc_success: bool
     differences: Dict[str, Any]
+    benchmark: Optional[Dict[str, Any]] = None
     sync_status: str
     created_at: datetime
     updated_at: datetime
@@ -72,6 +74,13 @@ class SyncStatusResponse(BaseModel):
     last_sync: Optional[datetime] = None
     next_sync: Optional[datetime] = None
 
+class StudyChangeEvent(BaseModel):
+    id: str = Field(alias="ID")  # Identifiant Orthanc de l'étude
+    type: str = Field("StableStudy", alias="Type")  # NewStudy, StableStudy...
+
+class StudyChangeBatch(BaseModel):
+    events: List[StudyChangeEvent]
+
 class AnnotationBase(BaseModel):
     annotation_type: str
     data: Dict[str, Any]
@@ -0,0 +1,66 @@
+"""
+Notifications de changement d'études (webhooks Orthanc)
+Les événements reçus sont regroupés par étude pendant une fenêtre d'anti-rebond,
+puis synchronisés par lots ciblés au lieu de relire toute l'archive.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class StudyEventDispatcher:
+    def __init__(self, sync_studies: Callable[[List[str]], Awaitable], debounce: float = 2.0,
+                 max_batch: int = 50, active: Optional[Callable[[], bool]] = None):
+        self.sync_studies = sync_studies  # Coroutine de synchronisation d'une liste d'études Orthanc
+        # Worker autorisé à écrire (bail du shard de lecture des PACS) ; sinon le flux /changes du leader suffit
+        self.active = active or (lambda: True)
+        self.debounce = debounce
+        self.max_batch = max(1, max_batch)
+        self._due: Dict[str, float] = {}  # ID Orthanc de l'étude -> échéance de synchronisation
+        self._wakeup = asyncio.Event()
+
+    @property
+    def pending(self) -> int:
+        """Études en attente de synchronisation"""
+        return len(self._due)
+
+    def submit(self, study_ids: Iterable[str]) -> int:
+        """Planifier des études ; un doublon dans la fenêtre d'anti-rebond est fusionné"""
+        if not self.active():
+            return 0
+        now = time.monotonic()
+        queued = 0
+        for study_id in study_ids:
+            if study_id and study_id not in self._due:
+                # Échéance fixée au premier événement : un flux continu ne retarde pas indéfiniment
+                self._due[study_id] = now + self.debounce
+                queued += 1
+        if queued:
+            self._wakeup.set()
+        return queued
+
+    async def run(self):
+        """Synchroniser les études arrivées à échéance, par lots de `max_batch`"""
+        while True:
+            if not self._due:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = min(self._due.values()) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            now = time.monotonic()
+            ready = [study_id for study_id, due in self._due.items() if due <= now][:self.max_batch]
+            for study_id in ready:
+                del self._due[study_id]
+            if not self.active():
+                # Bail perdu depuis la notification : le nouveau leader reprend les études via /changes
+                logger.info(f"{len(ready)} études notifiées ignorées : worker sans bail de synchronisation")
+                continue
+            try:
+                await self.sync_studies(ready)
+            except Exception as e:
+                logger.error(f"Erreur lors de la synchronisation des études notifiées: {e}")
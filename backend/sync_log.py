@@ -0,0 +1,163 @@
+"""
+Écriture des logs de synchronisation
+Les logs sont mis en tampon et écrits par lots depuis une tâche de fond, avec une
+politique de rétention (âge et nombre de lignes) et une table "dernier log par
+service" (sync_service_status) pour des lectures de statut en O(1).
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import delete, func, insert, select
+from database import AsyncSessionLocal
+from models import SyncLog, SyncServiceStatus
+
+logger = logging.getLogger(__name__)
+
+# Lots conservés en mémoire au plus lorsque la base est indisponible
+MAX_BUFFERED_BATCHES = 50
+
+class SyncLogWriter:
+    def __init__(self, session_factory=AsyncSessionLocal, flush_interval: float = 1.0, batch_size: int = 200,
+                 retention_days: int = 30, max_rows: int = 100000, prune_interval: float = 3600.0,
+                 cache=None):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.prune_interval = prune_interval
+        self.cache = cache  # TTLCache à invalider après écriture (dernière synchronisation)
+        self._buffer: List[Dict] = []
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def log(self, service: str, action: str, status: str, message: str, details: Optional[Dict] = None):
+        """Mettre un log en tampon (sans accès à la base)"""
+        self._buffer.append({
+            'service': service,
+            'action': action,
+            'status': status,
+            'message': message,
+            'details': details or {},
+            'timestamp': datetime.utcnow()
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self):
+        """Boucle d'écriture : lot toutes les `flush_interval` secondes ou dès `batch_size` logs"""
+        await self._backfill_status()
+        last_prune = time.monotonic()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                try:
+                    await self.flush()
+                    if time.monotonic() - last_prune >= self.prune_interval:
+                        await self.prune()
+                        last_prune = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'écriture des logs de synchronisation: {e}")
+        finally:
+            # Arrêt : écrire les logs encore en tampon
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Écrire les logs en tampon et mettre à jour le dernier log par service"""
+        async with self._flush_lock:
+            entries, self._buffer = self._buffer, []
+            if not entries:
+                return 0
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(SyncLog), entries)
+                    await self._update_status(db, entries)
+                    await db.commit()
+                if self.cache is not None:
+                    self.cache.invalidate()
+            except BaseException:
+                # Lot remis en tête du tampon pour la prochaine tentative (taille bornée),
+                # y compris sur annulation : l'écriture finale de run() le reprend
+                self._buffer = (entries + self._buffer)[-self.batch_size * MAX_BUFFERED_BATCHES:]
+                raise
+            return len(entries)
+
+    async def prune(self) -> int:
+        """Appliquer la rétention : logs plus anciens que `retention_days`, au-delà de `max_rows`"""
+        deleted = 0
+        async with self.session_factory() as db:
+            if self.retention_days > 0:
+                cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+                result = await db.execute(delete(SyncLog).where(SyncLog.timestamp < cutoff))
+                deleted += result.rowcount or 0
+            if self.max_rows > 0:
+                # Identifiant le plus récent au-delà de la limite (id croissant avec le temps)
+                oldest_kept = await db.scalar(
+                    select(SyncLog.id).order_by(SyncLog.id.desc()).offset(self.max_rows).limit(1)
+                )
+                if oldest_kept is not None:
+                    result = await db.execute(delete(SyncLog).where(SyncLog.id <= oldest_kept))
+                    deleted += result.rowcount or 0
+            await db.commit()
+        if deleted:
+            logger.info(f"Rétention : {deleted} logs de synchronisation supprimés")
+        return deleted
+
+    async def _update_status(self, db, entries: List[Dict]):
+        """Reporter le dernier log de chaque service dans sync_service_status"""
+        latest = {}
+        last_success = {}
+        for entry in entries:
+            latest[entry['service']] = entry
+            if entry['status'] == 'success':
+                last_success[entry['service']] = entry['timestamp']
+        dialect = db.get_bind().dialect.name
+        for service, entry in latest.items():
+            values = {
+                'action': entry['action'],
+                'status': entry['status'],
+                'message': entry['message'],
+                'last_sync': entry['timestamp']
+            }
+            if service in last_success:
+                values['last_success'] = last_success[service]
+            if dialect in ('sqlite', 'postgresql'):
+                # Upsert : deux workers écrivant le premier log d'un service ne créent pas de doublon
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert as dialect_insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert as dialect_insert
+                await db.execute(
+                    dialect_insert(SyncServiceStatus)
+                    .values(service=service, **values)
+                    .on_conflict_do_update(index_elements=[SyncServiceStatus.service], set_=values)
+                )
+                continue
+            status = await db.get(SyncServiceStatus, service)
+            if status is None:
+                status = SyncServiceStatus(service=service)
+                db.add(status)
+            for column, value in values.items():
+                setattr(status, column, value)
+
+    async def _backfill_status(self):
+        """Initialiser sync_service_status depuis sync_logs (bases existantes)"""
+        try:
+            async with self.session_factory() as db:
+                if await db.scalar(select(func.count()).select_from(SyncServiceStatus)):
+                    return
+                rows = (await db.execute(
+                    select(SyncLog.service, func.max(SyncLog.timestamp)).group_by(SyncLog.service)
+                )).all()
+                for service, last_sync in rows:
+                    if service is not None:
+                        db.add(SyncServiceStatus(service=service, last_sync=last_sync))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Erreur lors de l'initialisation du statut par service: {e}")
@@ -1,240 +1,1235 @@
 import asyncio
+import functools
 import httpx
 import logging
 from datetime import datetime
 from typing import Dict, List, Optional
 import time
-from database import SessionLocal
-from models import Patient, Study, Comparison, SyncLog
+import zlib
+from sqlalchemy import func, select, insert, update
+from database import AsyncSessionLocal
+from benchmark import PacsBenchmark
+from metrics import upstream_event_hooks
+from upstream import ResilientTransport
+from events import EventBus
+from models import Patient, Study, Series, Instance, Comparison, SyncCursor
+from sync_log import SyncLogWriter
+from cache import TTLCache
+from transfer import StudyTransfer
+from digests import clear_missing, diff_study, mark_dirty, refresh_dirty
+from crud import encode_cursor, get_diverging_studies
 from uuid import uuid4
 
 logger = logging.getLogger(__name__)
 
+# Types de changements Orthanc appliqués par la synchronisation incrémentale
+INCREMENTAL_CHANGE_TYPES = ('NewPatient', 'NewStudy', 'NewSeries', 'StableStudy')
+
+# Attributs QIDO-RS demandés à DCM4CHEE (includefield) par niveau
+PATIENT_FIELDS = ['00100020', '00100010', '00100030', '00100040']
+STUDY_FIELDS = PATIENT_FIELDS + ['0020000D', '00080020', '00080030', '00081030', '00201206', '00201208']
+SERIES_FIELDS = ['0020000D', '0020000E', '00200011', '00080060', '0008103E', '00201209']
+INSTANCE_FIELDS = ['0020000E', '00080018']
+
+
+def _throughput(count: int, seconds: float) -> float:
+    """Débit en éléments par seconde"""
+    return count / seconds if seconds > 0 else 0.0
+
+def _dicom_value(item: Dict, tag: str):
+    """Première valeur d'un attribut DICOM JSON (QIDO-RS)"""
+    value = (item.get(tag, {}).get('Value') or [None])[0]
+    if isinstance(value, dict):  # Nom de personne (PN)
+        return value.get('Alphabetic')
+    return value
+
+def _study_fingerprint(study) -> str:
+    """Empreinte de changement d'une étude : LastUpdate Orthanc et nombres DCM4CHEE"""
+    return f"{study.orthanc_last_update or ''}|{study.series_count or 0}|{study.image_count or 0}"
+
+def _reference_latency(results: Dict) -> Optional[float]:
+    """Latence de référence : p50 des métadonnées (ou de la première opération) à la plus faible concurrence"""
+    for operation in ('metadata', 'qido', 'retrieve'):
+        levels = results.get(operation)
+        if levels:
+            return levels[min(levels, key=int)]['p50']
+    return None
+
+def _parse_dicom_date(value: Optional[str]) -> Optional[datetime]:
+    """Convertir une date DICOM (AAAAMMJJ) en datetime"""
+    try:
+        return datetime.strptime(value, '%Y%m%d') if value else None
+    except ValueError:
+        return None
+
+
 class SyncService:
-    def __init__(self, dcm4chee_url: str, orthanc_url: str, xnat_url: str, sync_interval: int = 60):
+    def __init__(self, dcm4chee_url: str, orthanc_url: str, xnat_url: str, sync_interval: int = 60,
+                 concurrency: int = 8, page_size: int = 500, sync_mode: str = 'incremental',
+                 reconcile_interval: int = 0, batch_size: int = 500, pacs_concurrency: Optional[Dict] = None,
+                 benchmark: Optional[Dict] = None, benchmark_sample: float = 0.05,
+                 orthanc_dicomweb_root: str = '/dicom-web',
+                 session_factory=AsyncSessionLocal, log_writer: Optional[SyncLogWriter] = None,
+                 cache: Optional[TTLCache] = None, transfer: Optional[Dict] = None,
+                 upstream: Optional[Dict] = None, events: Optional[EventBus] = None):
         self.dcm4chee_url = dcm4chee_url
         self.orthanc_url = orthanc_url
         self.xnat_url = xnat_url
         self.sync_interval = sync_interval
+        self.concurrency = max(1, concurrency)
+        self.page_size = max(1, page_size)
+        self.sync_mode = sync_mode
+        self.reconcile_interval = reconcile_interval
+        self.batch_size = max(1, batch_size)
+        self.pacs_concurrency = pacs_concurrency or {}
+        self._pacs_semaphores = {}
+        self.benchmark = benchmark
+        self.benchmark_sample = benchmark_sample  # Part des études mesurées (même échantillon à chaque passe)
+        self._benchmark_locks = {}  # Une mesure à la fois par PACS, quel que soit le nombre de workers
+        self.orthanc_dicomweb_root = orthanc_dicomweb_root
+        self.session_factory = session_factory
+        # Logs de synchronisation écrits par lots en tâche de fond (voir sync_log.py)
+        self.log_writer = log_writer or SyncLogWriter(session_factory=session_factory)
+        self.cache = cache  # Compteurs du tableau de bord, invalidés en fin de passe
+        self.transfer = {'project': 'PACS', **(transfer or {})}  # Paramètres de StudyTransfer
+        self._transfer_checkpoints = {}  # study_uid -> série -> SOP UID déjà transmis
+        # Nombre de shards de comparaison (hachage du patient, voir leader.py)
+        self.shards = 1
+        self.upstream = upstream or {}  # Paramètres de ResilientTransport (disjoncteurs, reprises, débit)
+        self.events = events or EventBus()  # Progression diffusée en direct (/api/sync/events)
         self.client = None
+        self.benchmark_client = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Client HTTP keep-alive partagé par toutes les requêtes du service"""
+        if self.client is None:
+            services = {'dcm4chee': self.dcm4chee_url, 'orthanc': self.orthanc_url, 'xnat': self.xnat_url}
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=self.concurrency * 2,
+                max_keepalive_connections=self.concurrency
+            ))
+            self.client = httpx.AsyncClient(
+                timeout=10.0,
+                transport=ResilientTransport(services, transport, default_timeout=10.0, **self.upstream),
+                event_hooks=upstream_event_hooks(services)
+            )
+        return self.client
+    
+    def _get_benchmark_client(self) -> httpx.AsyncClient:
+        """Client direct des mesures : latences sans reprises, limite de débit ni couverture"""
+        if self.benchmark_client is None:
+            self.benchmark_client = httpx.AsyncClient(timeout=60.0)
+        return self.benchmark_client
+    
+    def _invalidate_cache(self):
+        """Invalider les compteurs en cache, une fois par passe (les commits par page ne le font pas)"""
+        if self.cache is not None:
+            self.cache.invalidate()
     
-    async def start_sync_loop(self):
-        """Boucle de synchronisation continue"""
-        logger.info("Démarrage de la boucle de synchronisation")
+    async def close(self):
+        """Fermer les clients HTTP"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        if self.benchmark_client is not None:
+            await self.benchmark_client.aclose()
+            self.benchmark_client = None
+    
+    async def start_sync_loop(self, shard: int = 0, shards: int = 1):
+        """Boucle de synchronisation continue ; le shard 0 lit les PACS, chaque shard compare ses patients"""
+        # Un worker peut exécuter une boucle par shard détenu : shard propre à chaque boucle
+        self.shards = max(1, shards)
+        logger.info(
+            f"Démarrage de la boucle de synchronisation (mode {self.sync_mode}, shard {shard + 1}/{self.shards})"
+        )
+        last_reconcile = time.monotonic()
         while True:
             try:
                 await asyncio.sleep(self.sync_interval)
-                await self.sync_patients()
-                await self.generate_comparisons()
+                cycle_start = time.perf_counter()
+                if shard != 0:
+                    # Lecture des PACS réservée au shard 0 : les autres shards se partagent les comparaisons
+                    self.events.publish('cycle_started', mode='comparisons', shard=shard)
+                    await self.generate_comparisons(shard=shard)
+                    self.events.publish('cycle_completed', seconds=round(time.perf_counter() - cycle_start, 3))
+                    continue
+                reconcile_due = (
+                    self.reconcile_interval > 0
+                    and time.monotonic() - last_reconcile >= self.reconcile_interval
+                )
+                incremental = self.sync_mode == 'incremental' and not reconcile_due
+                self.events.publish(
+                    'cycle_started', mode='incremental' if incremental else 'reconcile', shard=shard
+                )
+                if incremental:
+                    await self.sync_changes()
+                    await self.generate_comparisons(shard=shard)
+                else:
+                    await self.reconcile()
+                    last_reconcile = time.monotonic()
                 logger.info("Synchronisation complétée avec succès")
+                self.events.publish('cycle_completed', seconds=round(time.perf_counter() - cycle_start, 3))
             except Exception as e:
                 logger.error(f"Erreur lors de la synchronisation: {e}")
+                self.events.publish('cycle_failed', error=str(e))
     
-    async def sync_patients(self) -> int:
-        """Synchroniser les patients entre les PACS"""
-        db = SessionLocal()
-        synced_count = 0
+    async def reconcile(self) -> Dict:
+        """Réconciliation complète : relecture intégrale des deux PACS"""
+        synced = await self.sync_patients()
+        hierarchy = await self.sync_hierarchy()
+        comparisons = await self.generate_comparisons()
+        consistency = await self.check_consistency()
+        return {
+            'completed': 'error' not in hierarchy,
+            'patients_synced': synced,
+            'hierarchy': hierarchy,
+            'comparisons_generated': comparisons,
+            'consistency': consistency
+        }
+    
+    async def check_consistency(self) -> Dict:
+        """Vérification de cohérence par empreintes : seules les études divergentes sont détaillées"""
+        db = self.session_factory()
+        report = {'diverging_studies': 0, 'diverging_series': 0, 'missing_in_dcm4chee': 0, 'missing_in_orthanc': 0}
+        start = time.perf_counter()
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                # Récupérer les patients de DCM4CHEE
-                dcm4chee_patients = await self._fetch_dcm4chee_patients(client)
-                logger.info(f"Trouvé {len(dcm4chee_patients)} patients dans DCM4CHEE")
-                
-                # Récupérer les patients d'Orthanc
-                orthanc_patients = await self._fetch_orthanc_patients(client)
-                logger.info(f"Trouvé {len(orthanc_patients)} patients dans Orthanc")
-                
-                # Fusionner et synchroniser
-                for patient_data in dcm4chee_patients:
-                    existing_patient = db.query(Patient).filter(
-                        Patient.patient_id == patient_data.get('patient_id')
-                    ).first()
+            cursor = None
+            while True:
+                studies = await get_diverging_studies(db, after=cursor, limit=self.batch_size)
+                for study in studies:
+                    diff = await diff_study(db, study)
+                    report['diverging_studies'] += 1
+                    report['diverging_series'] += len(diff['series'])
+                    for series in diff['series']:
+                        report['missing_in_dcm4chee'] += len(series['missing_in_dcm4chee'])
+                        report['missing_in_orthanc'] += len(series['missing_in_orthanc'])
+                if len(studies) < self.batch_size:
+                    break
+                cursor = encode_cursor(studies[-1].id)
+            
+            report['seconds'] = round(time.perf_counter() - start, 3)
+            self.events.publish('phase_completed', phase='consistency', **report)
+            self.log_writer.log(
+                service='consistency',
+                action='check',
+                status='success',
+                message=f"{report['diverging_studies']} diverging studies",
+                details=report
+            )
+        except Exception as e:
+            logger.error(f"Erreur lors de la vérification de cohérence: {e}")
+            self.log_writer.log(
+                service='consistency',
+                action='check',
+                status='error',
+                message=str(e)
+            )
+        finally:
+            await db.close()
+        
+        return report
+    
+    async def sync_changes(self) -> int:
+        """Appliquer les changements Orthanc (/changes) depuis le dernier numéro de séquence traité"""
+        db = self.session_factory()
+        applied = 0
+        bootstrap = False
+        
+        try:
+            client = self._get_client()
+            cursor = await db.scalar(select(SyncCursor).where(SyncCursor.source == 'orthanc').limit(1))
+            
+            if cursor is None:
+                # Premier démarrage : lire la tête du flux puis réconcilier intégralement
+                response = await client.get(f"{self.orthanc_url}/changes", params={'last': 'true'})
+                response.raise_for_status()
+                head = response.json().get('Last', 0)
+                bootstrap = True
+            else:
+                start_seq = cursor.last_seq
+                done = False
+                while not done:
+                    response = await client.get(
+                        f"{self.orthanc_url}/changes",
+                        params={'since': cursor.last_seq, 'limit': self.page_size}
+                    )
+                    response.raise_for_status()
+                    feed = response.json()
                     
-                    if not existing_patient:
-                        patient = Patient(
-                            id=str(uuid4()),
-                            name=patient_data.get('name'),
-                            birth_date=patient_data.get('birth_date'),
-                            sex=patient_data.get('sex'),
-                            patient_id=patient_data.get('patient_id'),
-                            dcm4chee_id=patient_data.get('id'),
-                            synchronized=False
-                        )
-                        db.add(patient)
-                        synced_count += 1
-                    else:
-                        existing_patient.dcm4chee_id = patient_data.get('id')
-                        existing_patient.updated_at = datetime.utcnow()
-                
-                # Vérifier correspondance Orthanc
-                for patient_data in orthanc_patients:
-                    existing_patient = db.query(Patient).filter(
-                        Patient.patient_id == patient_data.get('patient_id')
-                    ).first()
+                    for change in feed.get('Changes', []):
+                        if change.get('ChangeType') in INCREMENTAL_CHANGE_TYPES:
+                            await self._apply_orthanc_change(db, client, change)
+                            applied += 1
                     
-                    if existing_patient:
-                        existing_patient.orthanc_id = patient_data.get('id')
-                        existing_patient.synchronized = True
-                
-                db.commit()
+                    # Le curseur avance avec les données de la page, dans la même transaction
+                    cursor.last_seq = feed.get('Last', cursor.last_seq)
+                    await db.commit()
+                    done = feed.get('Done', True)
+                    self.events.publish(
+                        'page', phase='orthanc_changes', rows=len(feed.get('Changes', [])),
+                        total=applied, last_seq=cursor.last_seq
+                    )
                 
-                # Log de synchronisation
-                db_log = SyncLog(
-                    service='patients',
-                    action='sync',
+                await refresh_dirty(db, self.batch_size)
+                await db.commit()
+                self.log_writer.log(
+                    service='orthanc',
+                    action='changes',
                     status='success',
-                    message=f'Synced {synced_count} patients',
-                    details={
-                        'dcm4chee_count': len(dcm4chee_patients),
-                        'orthanc_count': len(orthanc_patients)
-                    }
+                    message=f'Applied {applied} changes',
+                    details={'since': start_seq, 'last_seq': cursor.last_seq, 'applied': applied}
                 )
-                db.add(db_log)
-                db.commit()
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la synchronisation incrémentale: {e}")
+            await db.rollback()
+            self.log_writer.log(
+                service='orthanc',
+                action='changes',
+                status='error',
+                message=str(e)
+            )
+        finally:
+            await db.close()
+            self._invalidate_cache()
+        
+        if bootstrap:
+            # Curseur enregistré seulement après une réconciliation réussie : sinon nouvel essai au cycle suivant
+            result = await self.reconcile()
+            if result.get('completed'):
+                await self._save_cursor('orthanc', head)
+        
+        return applied
+    
+    async def _save_cursor(self, source: str, last_seq: int):
+        """Enregistrer la position d'un flux de changements"""
+        db = self.session_factory()
+        try:
+            cursor = await db.scalar(select(SyncCursor).where(SyncCursor.source == source).limit(1))
+            if cursor is None:
+                db.add(SyncCursor(source=source, last_seq=last_seq))
+            else:
+                cursor.last_seq = last_seq
+            await db.commit()
+        finally:
+            await db.close()
+    
+    async def sync_patients(self) -> int:
+        """Synchroniser les patients entre les PACS"""
+        db = self.session_factory()
+        synced_count = 0
+        
+        try:
+            client = self._get_client()
+            # Récupérer les patients de DCM4CHEE
+            start = time.perf_counter()
+            dcm4chee_patients = await self._fetch_dcm4chee_patients(client)
+            dcm4chee_seconds = time.perf_counter() - start
+            logger.info(f"Trouvé {len(dcm4chee_patients)} patients dans DCM4CHEE en {dcm4chee_seconds:.2f}s")
+            
+            # Récupérer les patients d'Orthanc
+            start = time.perf_counter()
+            orthanc_patients = await self._fetch_orthanc_patients(client)
+            orthanc_seconds = time.perf_counter() - start
+            orthanc_rate = _throughput(len(orthanc_patients), orthanc_seconds)
+            logger.info(
+                f"Trouvé {len(orthanc_patients)} patients dans Orthanc en {orthanc_seconds:.2f}s "
+                f"({orthanc_rate:.1f} patients/s)"
+            )
+            
+            # Réconcilier en mémoire à partir de l'index patient_id -> ligne existante
+            result = await db.execute(select(
+                Patient.id, Patient.patient_id, Patient.dcm4chee_id,
+                Patient.orthanc_id, Patient.synchronized
+            ))
+            existing = {row.patient_id: row for row in result}
+            orthanc_ids = {p['patient_id']: p['id'] for p in orthanc_patients if p.get('patient_id')}
+            now = datetime.utcnow()
+            inserts = []
+            updates = {}
+            
+            for patient_data in dcm4chee_patients:
+                patient_id = patient_data.get('patient_id')
+                if not patient_id:
+                    continue
+                orthanc_id = orthanc_ids.get(patient_id)
+                row = existing.get(patient_id)
                 
+                if row is None:
+                    inserts.append({
+                        'id': str(uuid4()),
+                        'name': patient_data.get('name'),
+                        'birth_date': patient_data.get('birth_date'),
+                        'sex': patient_data.get('sex'),
+                        'patient_id': patient_id,
+                        'dcm4chee_id': patient_data.get('id'),
+                        'orthanc_id': orthanc_id,
+                        'synchronized': orthanc_id is not None,
+                        'created_at': now,
+                        'updated_at': now
+                    })
+                else:
+                    updates[patient_id] = {
+                        'id': row.id,
+                        'dcm4chee_id': patient_data.get('id'),
+                        'orthanc_id': orthanc_id or row.orthanc_id,
+                        'synchronized': orthanc_id is not None or row.synchronized,
+                        'updated_at': now
+                    }
+            
+            # Correspondance Orthanc des patients déjà connus
+            for patient_id, orthanc_id in orthanc_ids.items():
+                row = existing.get(patient_id)
+                if row is not None and patient_id not in updates:
+                    updates[patient_id] = {
+                        'id': row.id,
+                        'dcm4chee_id': row.dcm4chee_id,
+                        'orthanc_id': orthanc_id,
+                        'synchronized': True,
+                        'updated_at': now
+                    }
+            
+            batches = await self._bulk_upsert(db, Patient, inserts, conflict_column='patient_id')
+            batches += await self._bulk_update(db, Patient, list(updates.values()))
+            synced_count = len(inserts)
+            await db.commit()
+            self.events.publish(
+                'phase_completed', phase='patients', inserted=len(inserts), updated=len(updates),
+                dcm4chee_count=len(dcm4chee_patients), orthanc_count=len(orthanc_patients)
+            )
+            
+            # Log de synchronisation
+            self.log_writer.log(
+                service='patients',
+                action='sync',
+                status='success',
+                message=f'Synced {synced_count} patients',
+                details={
+                    'dcm4chee_count': len(dcm4chee_patients),
+                    'orthanc_count': len(orthanc_patients),
+                    'dcm4chee_fetch_seconds': round(dcm4chee_seconds, 3),
+                    'orthanc_fetch_seconds': round(orthanc_seconds, 3),
+                    'orthanc_patients_per_second': round(orthanc_rate, 1),
+                    'concurrency': self.concurrency,
+                    'page_size': self.page_size,
+                    'inserted': len(inserts),
+                    'updated': len(updates),
+                    'batches': batches
+                }
+            )
+            
         except Exception as e:
             logger.error(f"Erreur lors de la synchronisation des patients: {e}")
-            db_log = SyncLog(
+            await db.rollback()
+            self.log_writer.log(
                 service='patients',
                 action='sync',
                 status='error',
                 message=str(e)
             )
-            db.add(db_log)
-            db.commit()
         finally:
-            db.close()
+            await db.close()
+            self._invalidate_cache()
         
         return synced_count
     
-    async def generate_comparisons(self) -> int:
-        """Générer les comparaisons entre les PACS"""
-        db = SessionLocal()
+    async def sync_hierarchy(self) -> Dict:
+        """Synchroniser études, séries et instances des deux PACS, page par page (mémoire bornée)"""
+        db = self.session_factory()
+        counts = {}
+        start = time.perf_counter()
+        
+        try:
+            client = self._get_client()
+            listed_since = datetime.utcnow()
+            passes = [
+                ('dcm4chee_studies', self._qido_pages(client, 'studies', STUDY_FIELDS), self._store_dcm4chee_studies),
+                ('dcm4chee_series', self._qido_pages(client, 'series', SERIES_FIELDS), self._store_dcm4chee_series),
+                ('dcm4chee_instances', self._qido_pages(client, 'instances', INSTANCE_FIELDS),
+                 functools.partial(self._store_dcm4chee_instances, seen_at=listed_since)),
+                ('orthanc_studies', self._orthanc_pages(client, '/studies'), self._store_orthanc_studies),
+                ('orthanc_series', self._orthanc_pages(client, '/series'), self._store_orthanc_series),
+                ('orthanc_instances', self._orthanc_pages(client, '/instances'),
+                 functools.partial(self._store_orthanc_instances, seen_at=listed_since)),
+            ]
+            for name, pages, store in passes:
+                pass_start = time.perf_counter()
+                counts[name] = 0
+                async for page in pages:
+                    rows = await store(db, page)
+                    counts[name] += rows
+                    await db.commit()
+                    self.events.publish(
+                        'page', phase=name, fetched=len(page), rows=rows, total=counts[name],
+                        rows_per_second=round(_throughput(counts[name], time.perf_counter() - pass_start), 1)
+                    )
+                if name.endswith('_instances'):
+                    # Listage complet terminé : instances non revues supprimées de ce PACS
+                    pacs = name.split('_')[0]
+                    counts[f'{pacs}_removed'] = await clear_missing(db, pacs, listed_since, self.batch_size)
+                    await db.commit()
+                logger.info(f"{name}: {counts[name]} lignes en {time.perf_counter() - pass_start:.2f}s")
+                self.events.publish(
+                    'phase_completed', phase=name, total=counts[name],
+                    seconds=round(time.perf_counter() - pass_start, 3)
+                )
+            counts['digests'] = await refresh_dirty(db, self.batch_size)
+            await db.commit()
+            
+            elapsed = time.perf_counter() - start
+            instances = counts['dcm4chee_instances'] + counts['orthanc_instances']
+            self.log_writer.log(
+                service='hierarchy',
+                action='sync',
+                status='success',
+                message=f'Synced {instances} instances',
+                details={
+                    **counts,
+                    'seconds': round(elapsed, 3),
+                    'instances_per_second': round(_throughput(instances, elapsed), 1),
+                    'page_size': self.page_size
+                }
+            )
+        
+        except Exception as e:
+            logger.error(f"Erreur lors de la synchronisation de la hiérarchie: {e}")
+            await db.rollback()
+            self.log_writer.log(
+                service='hierarchy',
+                action='sync',
+                status='error',
+                message=str(e),
+                details=counts
+            )
+            counts['error'] = str(e)
+        finally:
+            await db.close()
+            self._invalidate_cache()
+        
+        return counts
+    
+    async def sync_studies(self, orthanc_ids: List[str]) -> Dict:
+        """Synchronisation ciblée d'études Orthanc (notifications) puis comparaison de ces seules études"""
+        db = self.session_factory()
+        study_ids = []
+        
+        try:
+            client = self._get_client()
+            for orthanc_id in orthanc_ids:
+                study = await self._sync_stable_study(db, client, orthanc_id)
+                if study is not None:
+                    study_ids.append(study.id)
+                await db.flush()
+            await refresh_dirty(db, self.batch_size)
+            await db.commit()
+            self.log_writer.log(
+                service='orthanc',
+                action='notify',
+                status='success',
+                message=f'Synced {len(study_ids)} notified studies',
+                details={'notified': len(orthanc_ids), 'synced': len(study_ids)}
+            )
+        except Exception as e:
+            logger.error(f"Erreur lors de la synchronisation ciblée: {e}")
+            await db.rollback()
+            self.log_writer.log(
+                service='orthanc',
+                action='notify',
+                status='error',
+                message=str(e),
+                details={'notified': len(orthanc_ids)}
+            )
+            study_ids = []
+        finally:
+            await db.close()
+            self._invalidate_cache()
+        
+        comparisons = await self.generate_comparisons(study_ids) if study_ids else 0
+        return {'studies_synced': len(study_ids), 'comparisons_generated': comparisons}
+    
+    async def generate_comparisons(self, study_ids: Optional[List[str]] = None, all_shards: bool = False,
+                                   shard: int = 0) -> int:
+        """Générer les comparaisons entre les PACS (pool de workers, études inchangées ignorées)
+        Sans liste d'études, seules les études des patients du shard `shard` sont comparées
+        (toutes avec `all_shards`, déclenchement manuel) ; filtre évalué en SQL."""
+        db = self.session_factory()
         comparison_count = 0
+        skipped = 0
+        start = time.perf_counter()
         
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                studies = db.query(Study).all()
-                
-                for study in studies:
-                    # Vérifier si une comparaison existe déjà
-                    existing = db.query(Comparison).filter(Comparison.study_id == study.id).first()
+            client = self._get_client()
+            orthanc_plugins = await self._fetch_orthanc_plugins(client)
+            queue = asyncio.Queue(maxsize=self.concurrency * 2)
+            results = []
+            
+            async def worker():
+                while True:
+                    study = await queue.get()
+                    try:
+                        comparison_data = await self._compare_study(client, study, orthanc_plugins)
+                        comparison_data['fingerprint'] = _study_fingerprint(study)
+                        results.append((study, comparison_data))
+                    finally:
+                        queue.task_done()
+            
+            def take(pending: List) -> List:
+                # Lot retiré avant l'écriture : les workers continuent d'ajouter pendant les await
+                batch = pending[:]
+                pending.clear()
+                return batch
+            
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            # Comparaison limitée aux études indiquées (synchronisation ciblée)
+            scope = [Study.id.in_(study_ids)] if study_ids is not None else []
+            if study_ids is None and not all_shards and self.shards > 1:
+                # Shard du patient évalué par la base (shard_key stocké) : chaque worker ne lit que sa part
+                scope.append(func.coalesce(Patient.shard_key, 0) % self.shards == shard)
+            try:
+                last_id = ''
+                while True:
+                    # Parcours par clé (Study.id) avec la comparaison existante en jointure
+                    studies = (await db.execute(
+                        select(
+                            Study.id, Study.patient_id, Study.study_uid, Study.dcm4chee_id, Study.orthanc_id,
+                            Study.image_count, Study.series_count, Study.orthanc_last_update,
+                            Comparison.id.label('comparison_id'), Comparison.sync_status,
+                            Comparison.fingerprint
+                        )
+                        .outerjoin(Comparison, Comparison.study_id == Study.id)
+                        .outerjoin(Patient, Patient.id == Study.patient_id)
+                        .where(Study.id > last_id, *scope)
+                        .order_by(Study.id)
+                        .limit(self.batch_size)
+                    )).all()
+                    if not studies:
+                        break
+                    last_id = studies[-1].id
                     
-                    if not existing or existing.sync_status == "pending":
-                        comparison_data = await self._compare_study(client, study)
-                        
-                        if not existing:
-                            comparison = Comparison(
-                                id=str(uuid4()),
-                                study_id=study.id,
-                                **comparison_data
-                            )
-                            db.add(comparison)
+                    for study in studies:
+                        unchanged = (
+                            study.comparison_id is not None
+                            and study.sync_status == 'completed'
+                            and study.fingerprint == _study_fingerprint(study)
+                        )
+                        if unchanged:
+                            skipped += 1
                         else:
-                            for key, value in comparison_data.items():
-                                setattr(existing, key, value)
-                        
-                        comparison_count += 1
-                
-                db.commit()
+                            await queue.put(study)
+                    
+                    comparison_count += await self._store_comparisons(db, take(results))
+                    self._publish_comparisons(comparison_count, skipped, start)
                 
+                await queue.join()
+                comparison_count += await self._store_comparisons(db, take(results))
+                self._publish_comparisons(comparison_count, skipped, start, done=True)
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+            
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"{comparison_count} comparaisons générées, {skipped} études inchangées en {elapsed:.2f}s "
+                f"({_throughput(comparison_count, elapsed):.1f} études/s)"
+            )
+            
         except Exception as e:
             logger.error(f"Erreur lors de la génération des comparaisons: {e}")
+            await db.rollback()
         finally:
-            db.close()
+            await db.close()
+            self._invalidate_cache()
         
         return comparison_count
     
+    def _publish_comparisons(self, compared: int, skipped: int, start: float, done: bool = False):
+        """Progression de la passe de comparaison"""
+        elapsed = time.perf_counter() - start
+        self.events.publish(
+            'phase_completed' if done else 'comparisons', phase='comparisons', compared=compared,
+            skipped=skipped, studies_per_second=round(_throughput(compared, elapsed), 1),
+            seconds=round(elapsed, 3)
+        )
+    
     async def anonymize_study(self, study_id: str) -> str:
-        """Router une étude vers XNAT pour anonymisation"""
-        db = SessionLocal()
+        """Router une étude vers XNAT pour anonymisation (flux WADO-RS -> import XNAT)"""
+        db = self.session_factory()
         
         try:
-            study = db.query(Study).filter(Study.id == study_id).first()
+            study = await db.scalar(select(Study).where(Study.id == study_id).limit(1))
             if not study:
                 raise ValueError(f"Study {study_id} not found")
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Récupérer l'étude depuis DCM4CHEE
-                study_data = await self._fetch_study_from_dcm4chee(client, study.dcm4chee_id)
-                
-                # Envoyer vers XNAT pour anonymisation
-                response = await client.post(
-                    f"{self.xnat_url}/xapi/import",
-                    json=study_data,
-                    headers={"Content-Type": "application/json"}
-                )
-                
-                if response.status_code not in [200, 201]:
-                    raise ValueError(f"XNAT import failed: {response.text}")
-                
-                anonymized_id = response.json().get('id')
-                
-                # Log
-                db_log = SyncLog(
-                    service='xnat',
-                    action='anonymize',
-                    status='success',
-                    message=f'Study {study_id} anonymized as {anonymized_id}'
-                )
-                db.add(db_log)
-                db.commit()
-                
-                return anonymized_id
+            transfer = StudyTransfer(
+                self._get_client(),
+                f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs",
+                self.xnat_url,
+                **self.transfer
+            )
+            # Point de reprise conservé jusqu'au succès : un nouvel appel ne renvoie que le reste
+            checkpoint = self._transfer_checkpoints.setdefault(study.study_uid, {})
+            # Identifiants internes comme sujet/session XNAT : aucune donnée patient dans les libellés
+            result = await transfer.run(study.study_uid, subject=study.patient_id, session=study.id,
+                                        checkpoint=checkpoint)
+            result.pop('details')
+            if result['failed_series']:
+                raise ValueError(f"XNAT transfer incomplete: {len(result['failed_series'])} series failed")
+            del self._transfer_checkpoints[study.study_uid]
+            
+            anonymized_id = result['xnat_session'] or study.id
+            
+            # Log
+            self.log_writer.log(
+                service='xnat',
+                action='anonymize',
+                status='success',
+                message=f'Study {study_id} anonymized as {anonymized_id}',
+                details=result
+            )
+            
+            return anonymized_id
         
         except Exception as e:
             logger.error(f"Erreur lors de l'anonymisation: {e}")
-            db_log = SyncLog(
+            self.log_writer.log(
                 service='xnat',
                 action='anonymize',
                 status='error',
                 message=str(e)
             )
-            db.add(db_log)
-            db.commit()
             raise
         finally:
-            db.close()
+            await db.close()
     
     # Méthodes privées
     
     async def _fetch_dcm4chee_patients(self, client: httpx.AsyncClient) -> List[Dict]:
-        """Récupérer les patients de DCM4CHEE"""
+        """Récupérer les patients de DCM4CHEE (QIDO-RS paginé)"""
         try:
-            response = await client.get(f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/patients")
-            if response.status_code == 200:
-                return response.json()
-            return []
+            patients = []
+            async for page in self._qido_pages(client, 'patients', PATIENT_FIELDS):
+                patients.extend(self._format_dcm4chee_patient(item) for item in page)
+            return patients
         except Exception as e:
             logger.error(f"Erreur DCM4CHEE patients: {e}")
             return []
     
+    @staticmethod
+    def _format_dcm4chee_patient(item: Dict) -> Dict:
+        """Formater un patient QIDO-RS (DICOM JSON)"""
+        patient_id = _dicom_value(item, '00100020')
+        return {
+            'id': patient_id,
+            'patient_id': patient_id,
+            'name': _dicom_value(item, '00100010'),
+            'birth_date': _dicom_value(item, '00100030'),
+            'sex': _dicom_value(item, '00100040')
+        }
+    
+    async def _paginate(self, fetch_page):
+        """Itérer sur des pages successives en préchargeant la page suivante"""
+        offset = 0
+        pending = asyncio.ensure_future(fetch_page(offset))
+        try:
+            while True:
+                page = await pending
+                if len(page) < self.page_size:
+                    if page:
+                        yield page
+                    return
+                offset += self.page_size
+                pending = asyncio.ensure_future(fetch_page(offset))
+                yield page
+        finally:
+            if not pending.done():
+                pending.cancel()
+    
+    def _qido_pages(self, client: httpx.AsyncClient, level: str, fields: List[str]):
+        """Pages QIDO-RS DCM4CHEE (limit/offset) d'un niveau patients/studies/series/instances"""
+        async def fetch_page(offset: int) -> List[Dict]:
+            response = await client.get(
+                f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/{level}",
+                params={'limit': self.page_size, 'offset': offset, 'includefield': fields}
+            )
+            if response.status_code == 204:
+                return []
+            response.raise_for_status()
+            return response.json()
+        return self._paginate(fetch_page)
+    
+    def _orthanc_pages(self, client: httpx.AsyncClient, resource: str):
+        """Pages étendues Orthanc (since/limit) d'une ressource"""
+        return self._paginate(lambda since: self._fetch_orthanc_page(client, resource, since))
+    
     async def _fetch_orthanc_patients(self, client: httpx.AsyncClient) -> List[Dict]:
-        """Récupérer les patients d'Orthanc"""
+        """Récupérer les patients d'Orthanc par pages étendues (?expand) en parallèle"""
         try:
-            response = await client.get(f"{self.orthanc_url}/patients")
-            if response.status_code == 200:
-                patients = response.json()
-                # Formater les réponses Orthanc
-                formatted = []
-                for patient_id in patients:
-                    patient_data = await client.get(f"{self.orthanc_url}/patients/{patient_id}")
-                    if patient_data.status_code == 200:
-                        formatted.append({
-                            'id': patient_id,
-                            'patient_id': patient_data.json().get('PatientID'),
-                            'name': patient_data.json().get('PatientName'),
-                            'birth_date': patient_data.json().get('PatientBirthDate'),
-                            'sex': patient_data.json().get('PatientSex')
-                        })
-                return formatted
-            return []
+            formatted = []
+            since = 0
+            done = False
+            while not done:
+                # Une vague de `concurrency` pages en vol sur le client keep-alive
+                offsets = [since + i * self.page_size for i in range(self.concurrency)]
+                pages = await asyncio.gather(
+                    *(self._fetch_orthanc_page(client, '/patients', offset) for offset in offsets)
+                )
+                for page in pages:
+                    formatted.extend(self._format_orthanc_patient(p) for p in page)
+                    if len(page) < self.page_size:
+                        done = True
+                        break
+                since += self.concurrency * self.page_size
+            return formatted
         except Exception as e:
             logger.error(f"Erreur Orthanc patients: {e}")
             return []
     
-    async def _compare_study(self, client: httpx.AsyncClient, study: Study) -> Dict:
+    async def _fetch_orthanc_page(self, client: httpx.AsyncClient, resource: str, since: int) -> List[Dict]:
+        """Récupérer une page de ressources Orthanc avec leurs tags principaux"""
+        response = await client.get(
+            f"{self.orthanc_url}{resource}",
+            params={'expand': 'true', 'since': since, 'limit': self.page_size}
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    @staticmethod
+    def _format_orthanc_patient(patient: Dict) -> Dict:
+        """Formater un patient Orthanc étendu"""
+        tags = patient.get('MainDicomTags', {})
+        return {
+            'id': patient.get('ID'),
+            'patient_id': tags.get('PatientID'),
+            'name': tags.get('PatientName'),
+            'birth_date': tags.get('PatientBirthDate'),
+            'sex': tags.get('PatientSex')
+        }
+    
+    @staticmethod
+    def _supports_upsert(db) -> bool:
+        """INSERT ... ON CONFLICT DO UPDATE disponible (SQLite, PostgreSQL)"""
+        return db.get_bind().dialect.name in ('sqlite', 'postgresql')
+    
+    async def _bulk_upsert(self, db, model, rows: List[Dict], conflict_column: Optional[str] = None,
+                           update_columns=None) -> List[Dict]:
+        """Insérer des lignes par lots (executemany), en INSERT ... ON CONFLICT si le dialecte le permet
+        En conflit, `update_columns` (par défaut toutes les colonnes fournies) sont mises à jour."""
+        if not rows:
+            return []
+        table = model.__table__
+        dialect = db.get_bind().dialect.name
+        if conflict_column and self._supports_upsert(db):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            statement = dialect_insert(table)
+            if update_columns is None:
+                update_columns = [
+                    column for column in rows[0].keys() if column not in ('id', conflict_column, 'created_at')
+                ]
+            # Une insertion concurrente de la même clé devient une mise à jour
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c[conflict_column]],
+                set_={column: statement.excluded[column] for column in update_columns}
+            )
+        else:
+            statement = insert(table)
+        return await self._run_batches(db, 'insert', statement, rows)
+    
+    async def _bulk_update(self, db, model, rows: List[Dict]) -> List[Dict]:
+        """Mettre à jour des lignes par clé primaire, par lots (executemany)"""
+        return await self._run_batches(db, 'update', update(model), rows)
+    
+    async def _run_batches(self, db, operation: str, statement, rows: List[Dict]) -> List[Dict]:
+        """Exécuter une instruction par lots de `batch_size` lignes en mesurant chaque lot"""
+        timings = []
+        for offset in range(0, len(rows), self.batch_size):
+            batch = rows[offset:offset + self.batch_size]
+            start = time.perf_counter()
+            await db.execute(statement, batch)
+            elapsed = time.perf_counter() - start
+            logger.debug(f"Lot {operation} de {len(batch)} lignes en {elapsed * 1000:.1f}ms")
+            timings.append({'operation': operation, 'rows': len(batch), 'seconds': round(elapsed, 4)})
+        return timings
+    
+    async def _id_map(self, db, model, column: str, keys) -> Dict:
+        """Index clé -> id des lignes existantes, en une requête"""
+        keys = [key for key in set(keys) if key is not None]
+        if not keys:
+            return {}
+        key_column = model.__table__.c[column]
+        result = await db.execute(select(key_column, model.id).where(key_column.in_(keys)))
+        return dict(result.all())
+    
+    async def _upsert_page(self, db, model, key: str, rows: List[Dict], update_columns) -> int:
+        """Insérer ou mettre à jour une page de lignes identifiées par `key` (colonne unique)
+        En INSERT ... ON CONFLICT DO UPDATE si le dialecte le permet : la synchronisation ciblée
+        (notifications) et la boucle peuvent écrire la même clé en même temps."""
+        if self._supports_upsert(db):
+            # Une ligne par clé et par instruction (dernière occurrence de la page)
+            page = {row[key]: row for row in rows if row[key] is not None}
+            await self._bulk_upsert(
+                db, model, [{'id': str(uuid4()), **row} for row in page.values()],
+                conflict_column=key, update_columns=update_columns
+            )
+            return len(page)
+        existing = await self._id_map(db, model, key, [row[key] for row in rows])
+        inserts = []
+        updates = []
+        for row in rows:
+            if row[key] is None:
+                continue
+            row_id = existing.get(row[key])
+            if row_id is None:
+                existing[row[key]] = row_id = str(uuid4())
+                inserts.append({'id': row_id, **row})
+            else:
+                updates.append({'id': row_id, **{column: row[column] for column in update_columns}})
+        await self._bulk_upsert(db, model, inserts)
+        await self._bulk_update(db, model, updates)
+        return len(inserts) + len(updates)
+    
+    async def _ensure_patients(self, db, patients: List[Dict]) -> Dict:
+        """Index patient_id -> id, en créant les patients absents"""
+        ids = await self._id_map(db, Patient, 'patient_id', [p['patient_id'] for p in patients])
+        missing = [p for p in patients if p['patient_id'] is not None and p['patient_id'] not in ids]
+        for patient in missing:
+            ids[patient['patient_id']] = patient['id'] = str(uuid4())
+        await self._bulk_upsert(db, Patient, missing, conflict_column='patient_id')
+        return ids
+    
+    async def _store_dcm4chee_studies(self, db, page: List[Dict]) -> int:
+        """Enregistrer une page d'études QIDO-RS"""
+        patients = {}
+        rows = []
+        for item in page:
+            patient = self._format_dcm4chee_patient(item)
+            patients.setdefault(patient['patient_id'], {
+                'patient_id': patient['patient_id'],
+                'name': patient['name'],
+                'birth_date': patient['birth_date'],
+                'sex': patient['sex'],
+                'dcm4chee_id': patient['id']
+            })
+            study_uid = _dicom_value(item, '0020000D')
+            rows.append({
+                'study_uid': study_uid,
+                'patient_id': patient['patient_id'],
+                'study_date': _parse_dicom_date(_dicom_value(item, '00080020')),
+                'study_time': _dicom_value(item, '00080030'),
+                'study_description': _dicom_value(item, '00081030'),
+                'dcm4chee_id': study_uid,
+                'image_count': int(_dicom_value(item, '00201208') or 0),
+                'series_count': int(_dicom_value(item, '00201206') or 0)
+            })
+        patient_ids = await self._ensure_patients(db, list(patients.values()))
+        for row in rows:
+            row['patient_id'] = patient_ids.get(row['patient_id'])
+        return await self._upsert_page(db, Study, 'study_uid', rows, (
+            'patient_id', 'study_date', 'study_time', 'study_description', 'dcm4chee_id', 'image_count',
+            'series_count'
+        ))
+    
+    async def _store_dcm4chee_series(self, db, page: List[Dict]) -> int:
+        """Enregistrer une page de séries QIDO-RS"""
+        study_ids = await self._id_map(db, Study, 'study_uid', [_dicom_value(item, '0020000D') for item in page])
+        rows = []
+        for item in page:
+            study_id = study_ids.get(_dicom_value(item, '0020000D'))
+            if study_id is None:
+                continue
+            series_uid = _dicom_value(item, '0020000E')
+            series_number = _dicom_value(item, '00200011')
+            rows.append({
+                'series_uid': series_uid,
+                'study_id': study_id,
+                'series_number': str(series_number) if series_number is not None else None,
+                'modality': _dicom_value(item, '00080060'),
+                'series_description': _dicom_value(item, '0008103E'),
+                'dcm4chee_id': series_uid,
+                'instance_count': int(_dicom_value(item, '00201209') or 0)
+            })
+        return await self._upsert_page(db, Series, 'series_uid', rows, (
+            'study_id', 'series_number', 'modality', 'series_description', 'dcm4chee_id', 'instance_count'
+        ))
+    
+    async def _store_dcm4chee_instances(self, db, page: List[Dict], seen_at: Optional[datetime] = None) -> int:
+        """Enregistrer une page d'instances QIDO-RS (listées à `seen_at`)"""
+        series_ids = await self._id_map(db, Series, 'series_uid', [_dicom_value(item, '0020000E') for item in page])
+        rows = []
+        for item in page:
+            series_id = series_ids.get(_dicom_value(item, '0020000E'))
+            if series_id is None:
+                continue
+            sop_uid = _dicom_value(item, '00080018')
+            rows.append({
+                'sop_instance_uid': sop_uid,
+                'series_id': series_id,
+                'dcm4chee_id': sop_uid,
+                'dcm4chee_seen_at': seen_at or datetime.utcnow()
+            })
+        await mark_dirty(db, (row['series_id'] for row in rows))
+        return await self._upsert_page(db, Instance, 'sop_instance_uid', rows, (
+            'series_id', 'dcm4chee_id', 'dcm4chee_seen_at'
+        ))
+    
+    async def _store_orthanc_studies(self, db, page: List[Dict]) -> int:
+        """Enregistrer une page d'études Orthanc étendues"""
+        patients = {}
+        rows = []
+        for study_json in page:
+            patient = self._format_orthanc_patient({
+                'ID': study_json.get('ParentPatient'),
+                'MainDicomTags': study_json.get('PatientMainDicomTags', {})
+            })
+            patients.setdefault(patient['patient_id'], {
+                'patient_id': patient['patient_id'],
+                'name': patient['name'],
+                'birth_date': patient['birth_date'],
+                'sex': patient['sex'],
+                'orthanc_id': patient['id']
+            })
+            tags = study_json.get('MainDicomTags', {})
+            rows.append({
+                'study_uid': tags.get('StudyInstanceUID'),
+                'patient_id': patient['patient_id'],
+                'study_date': _parse_dicom_date(tags.get('StudyDate')),
+                'study_time': tags.get('StudyTime'),
+                'study_description': tags.get('StudyDescription'),
+                'orthanc_id': study_json.get('ID'),
+                'orthanc_last_update': study_json.get('LastUpdate')
+            })
+        patient_ids = await self._ensure_patients(db, list(patients.values()))
+        for row in rows:
+            row['patient_id'] = patient_ids.get(row['patient_id'])
+        return await self._upsert_page(db, Study, 'study_uid', rows, ('orthanc_id', 'orthanc_last_update'))
+    
+    async def _store_orthanc_series(self, db, page: List[Dict]) -> int:
+        """Enregistrer une page de séries Orthanc étendues"""
+        study_ids = await self._id_map(db, Study, 'orthanc_id', [s.get('ParentStudy') for s in page])
+        rows = []
+        for series_json in page:
+            study_id = study_ids.get(series_json.get('ParentStudy'))
+            if study_id is None:
+                continue
+            tags = series_json.get('MainDicomTags', {})
+            rows.append({
+                'series_uid': tags.get('SeriesInstanceUID'),
+                'study_id': study_id,
+                'series_number': tags.get('SeriesNumber'),
+                'modality': tags.get('Modality'),
+                'series_description': tags.get('SeriesDescription'),
+                'orthanc_id': series_json.get('ID'),
+                'instance_count': len(series_json.get('Instances', []))
+            })
+        return await self._upsert_page(db, Series, 'series_uid', rows, ('orthanc_id',))
+    
+    async def _store_orthanc_instances(self, db, page: List[Dict], seen_at: Optional[datetime] = None) -> int:
+        """Enregistrer une page d'instances Orthanc étendues (listées à `seen_at`)"""
+        series_ids = await self._id_map(db, Series, 'orthanc_id', [i.get('ParentSeries') for i in page])
+        rows = []
+        for instance_json in page:
+            series_id = series_ids.get(instance_json.get('ParentSeries'))
+            if series_id is None:
+                continue
+            rows.append({
+                'sop_instance_uid': instance_json.get('MainDicomTags', {}).get('SOPInstanceUID'),
+                'series_id': series_id,
+                'orthanc_id': instance_json.get('ID'),
+                'orthanc_seen_at': seen_at or datetime.utcnow()
+            })
+        await mark_dirty(db, (row['series_id'] for row in rows))
+        return await self._upsert_page(db, Instance, 'sop_instance_uid', rows, ('orthanc_id', 'orthanc_seen_at'))
+    
+    async def _apply_orthanc_change(self, db, client: httpx.AsyncClient, change: Dict):
+        """Appliquer un changement Orthanc aux tables Patient/Study/Series/Instance"""
+        change_type = change.get('ChangeType')
+        resource_id = change.get('ID')
+        
+        if change_type == 'NewPatient':
+            response = await client.get(f"{self.orthanc_url}/patients/{resource_id}")
+            if response.status_code == 200:
+                await self._upsert_orthanc_patient(db, response.json())
+        elif change_type == 'NewStudy':
+            await self._sync_orthanc_study(db, client, resource_id)
+        elif change_type == 'NewSeries':
+            await self._sync_orthanc_series(db, client, resource_id)
+        elif change_type == 'StableStudy':
+            await self._sync_stable_study(db, client, resource_id)
+        await db.flush()
+    
+    async def _upsert_orthanc_patient(self, db, patient_json: Dict) -> Patient:
+        """Créer ou mettre à jour un patient depuis sa représentation Orthanc"""
+        data = self._format_orthanc_patient(patient_json)
+        patient = await db.scalar(select(Patient).where(Patient.patient_id == data['patient_id']).limit(1))
+        if patient is None:
+            patient = Patient(
+                id=str(uuid4()),
+                name=data['name'],
+                birth_date=data['birth_date'],
+                sex=data['sex'],
+                patient_id=data['patient_id'],
+                synchronized=False
+            )
+            db.add(patient)
+        patient.orthanc_id = data['id']
+        patient.synchronized = patient.dcm4chee_id is not None
+        return patient
+    
+    async def _sync_orthanc_study(self, db, client: httpx.AsyncClient, orthanc_id: str) -> Optional[Study]:
+        """Créer ou mettre à jour une étude depuis Orthanc"""
+        response = await client.get(f"{self.orthanc_url}/studies/{orthanc_id}")
+        if response.status_code != 200:
+            return None
+        study_json = response.json()
+        tags = study_json.get('MainDicomTags', {})
+        
+        patient = await db.scalar(select(Patient).where(Patient.orthanc_id == study_json.get('ParentPatient')).limit(1))
+        if patient is None:
+            patient = await self._upsert_orthanc_patient(db, {
+                'ID': study_json.get('ParentPatient'),
+                'MainDicomTags': study_json.get('PatientMainDicomTags', {})
+            })
+            await db.flush()
+        
+        study = await db.scalar(select(Study).where(Study.study_uid == tags.get('StudyInstanceUID')).limit(1))
+        if study is None:
+            study = Study(id=str(uuid4()), study_uid=tags.get('StudyInstanceUID'))
+            db.add(study)
+        study.patient_id = patient.id
+        study.orthanc_id = orthanc_id
+        study.study_date = _parse_dicom_date(tags.get('StudyDate'))
+        study.study_time = tags.get('StudyTime')
+        study.study_description = tags.get('StudyDescription')
+        study.orthanc_last_update = study_json.get('LastUpdate')
+        return study
+    
+    async def _sync_orthanc_series(self, db, client: httpx.AsyncClient, orthanc_id: str) -> Optional[Series]:
+        """Créer ou mettre à jour une série depuis Orthanc"""
+        response = await client.get(f"{self.orthanc_url}/series/{orthanc_id}")
+        if response.status_code != 200:
+            return None
+        series_json = response.json()
+        tags = series_json.get('MainDicomTags', {})
+        
+        study = await db.scalar(select(Study).where(Study.orthanc_id == series_json.get('ParentStudy')).limit(1))
+        if study is None:
+            study = await self._sync_orthanc_study(db, client, series_json.get('ParentStudy'))
+            if study is None:
+                return None
+            await db.flush()
+        
+        series = await db.scalar(select(Series).where(Series.series_uid == tags.get('SeriesInstanceUID')).limit(1))
+        if series is None:
+            series = Series(id=str(uuid4()), series_uid=tags.get('SeriesInstanceUID'))
+            db.add(series)
+        series.study_id = study.id
+        series.orthanc_id = orthanc_id
+        series.series_number = tags.get('SeriesNumber')
+        series.modality = tags.get('Modality')
+        series.series_description = tags.get('SeriesDescription')
+        series.instance_count = len(series_json.get('Instances', []))
+        return series
+    
+    async def _sync_stable_study(self, db, client: httpx.AsyncClient, orthanc_id: str) -> Optional[Study]:
+        """Étude stable : enregistrer ses instances par lots et invalider sa comparaison"""
+        # Métadonnées Orthanc (LastUpdate) rafraîchies : l'empreinte de l'étude change
+        study = await self._sync_orthanc_study(db, client, orthanc_id)
+        if study is None:
+            return None
+        await db.flush()
+        
+        response = await client.get(f"{self.orthanc_url}/studies/{orthanc_id}/instances")
+        if response.status_code != 200:
+            return study
+        instances = response.json()
+        
+        parents = {instance_json.get('ParentSeries') for instance_json in instances}
+        series_ids = await self._id_map(db, Series, 'orthanc_id', parents)
+        for parent_series in parents - set(series_ids):
+            series = await self._sync_orthanc_series(db, client, parent_series)
+            if series is not None:
+                await db.flush()
+                series_ids[parent_series] = series.id
+        
+        rows = []
+        for instance_json in instances:
+            series_id = series_ids.get(instance_json.get('ParentSeries'))
+            if series_id is None:
+                continue
+            rows.append({
+                'sop_instance_uid': instance_json.get('MainDicomTags', {}).get('SOPInstanceUID'),
+                'series_id': series_id,
+                'orthanc_id': instance_json.get('ID'),
+                'orthanc_seen_at': datetime.utcnow()
+            })
+        # image_count reste celui de DCM4CHEE (synchronisation complète) : l'empreinte garde sa définition
+        await mark_dirty(db, (row['series_id'] for row in rows))
+        await self._upsert_page(db, Instance, 'sop_instance_uid', rows, ('series_id', 'orthanc_id', 'orthanc_seen_at'))
+        comparison = await db.scalar(select(Comparison).where(Comparison.study_id == study.id).limit(1))
+        if comparison is not None:
+            comparison.sync_status = 'pending'
+        return study
+    
+    async def _store_comparisons(self, db, results: List) -> int:
+        """Écrire un lot de résultats de comparaison"""
+        inserts = []
+        updates = []
+        for study, comparison_data in results:
+            if study.comparison_id is None:
+                inserts.append({'id': str(uuid4()), 'study_id': study.id, **comparison_data})
+            else:
+                updates.append({'id': study.comparison_id, **comparison_data})
+        await self._bulk_upsert(db, Comparison, inserts)
+        await self._bulk_update(db, Comparison, updates)
+        await db.commit()
+        return len(inserts) + len(updates)
+    
+    def _pacs_limit(self, pacs: str) -> asyncio.Semaphore:
+        """Sémaphore limitant les requêtes simultanées vers un PACS"""
+        if pacs not in self._pacs_semaphores:
+            self._pacs_semaphores[pacs] = asyncio.Semaphore(self.pacs_concurrency.get(pacs, self.concurrency))
+        return self._pacs_semaphores[pacs]
+    
+    async def _fetch_orthanc_plugins(self, client: httpx.AsyncClient) -> List:
+        """Plugins installés (Orthanc), lus une fois par passe de comparaison"""
+        try:
+            response = await client.get(f"{self.orthanc_url}/plugins")
+            if response.status_code == 200:
+                return response.json()
+        except Exception:
+            pass
+        return []
+    
+    async def _benchmark_study(self, study) -> Dict:
+        """Mesurer les latences DICOMweb d'une étude sur chaque PACS qui la détient"""
+        bench = PacsBenchmark(self._get_benchmark_client(), **self.benchmark)
+        targets = []
+        if study.dcm4chee_id:
+            targets.append(('dcm4chee', f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs"))
+        if study.orthanc_id:
+            targets.append(('orthanc', f"{self.orthanc_url}{self.orthanc_dicomweb_root}"))
+        
+        results = {}
+        for pacs, dicomweb_root in targets:
+            try:
+                # Niveaux de concurrence mesurés seuls : pas d'autre mesure simultanée sur ce PACS
+                async with self._benchmark_locks.setdefault(pacs, asyncio.Lock()):
+                    results[pacs] = await bench.run(dicomweb_root, study.study_uid)
+            except Exception as e:
+                # Échec de la mesure seule : la comparaison de l'étude reste valable
+                logger.warning(f"Mesure {pacs} impossible pour {study.study_uid}: {e}")
+                results[pacs] = {'error': str(e)}
+        return results
+    
+    def _benchmark_due(self, study) -> bool:
+        """Étude retenue dans l'échantillon mesuré (hachage stable de son UID)"""
+        return zlib.crc32((study.study_uid or '').encode()) % 1000 < self.benchmark_sample * 1000
+    
+    async def _compare_study(self, client: httpx.AsyncClient, study, orthanc_plugins: Optional[List] = None) -> Dict:
         """Comparer une étude entre les deux PACS"""
         comparison_data = {
             'dcm4chee_images': 0,
@@ -243,64 +1238,58 @@ class SyncService:
             'orthanc_response_time': 0.0,
             'dcm4chee_success': False,
             'orthanc_success': False,
-            'differences': {}
+            'differences': {},
+            'benchmark': None
         }
         
         try:
             # Interroger DCM4CHEE
+            rtstruct_dcm4chee = False
             if study.dcm4chee_id:
-                start = time.time()
-                response = await client.get(
-                    f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/studies/{study.study_uid}/series"
-                )
-                response_time = time.time() - start
+                async with self._pacs_limit('dcm4chee'):
+                    start = time.time()
+                    response = await client.get(
+                        f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/studies/{study.study_uid}/series"
+                    )
+                    response_time = time.time() - start
                 if response.status_code == 200:
                     series_list = response.json()
-                    image_count = sum(len(s.get('Instances', [])) for s in series_list)
+                    image_count = sum(int(_dicom_value(s, '00201209') or 0) for s in series_list)
                     comparison_data['dcm4chee_images'] = image_count
                     comparison_data['dcm4chee_response_time'] = response_time
                     comparison_data['dcm4chee_success'] = True
                     # RTSTRUCT support (dcm4chee)
-                    rtstruct_dcm4chee = any(s.get('Modality') == 'RTSTRUCT' for s in series_list)
-                else:
-                    rtstruct_dcm4chee = False
-            else:
-                rtstruct_dcm4chee = False
+                    rtstruct_dcm4chee = any(_dicom_value(s, '00080060') == 'RTSTRUCT' for s in series_list)
 
-            # Interroger Orthanc
+            # Interroger Orthanc (/studies/{id}/series renvoie les séries complètes)
+            rtstruct_orthanc = False
             if study.orthanc_id:
-                start = time.time()
-                response = await client.get(
-                    f"{self.orthanc_url}/studies/{study.orthanc_id}/series"
-                )
-                response_time = time.time() - start
+                async with self._pacs_limit('orthanc'):
+                    start = time.time()
+                    response = await client.get(
+                        f"{self.orthanc_url}/studies/{study.orthanc_id}/series"
+                    )
+                    response_time = time.time() - start
                 if response.status_code == 200:
                     series_list = response.json()
-                    image_count = 0
-                    rtstruct_orthanc = False
-                    for series_id in series_list:
-                        series_data = await client.get(f"{self.orthanc_url}/series/{series_id}")
-                        if series_data.status_code == 200:
-                            series_json = series_data.json()
-                            image_count += len(series_json.get('Instances', []))
-                            if series_json.get('MainDicomTags', {}).get('Modality') == 'RTSTRUCT':
-                                rtstruct_orthanc = True
-                    comparison_data['orthanc_images'] = image_count
+                    comparison_data['orthanc_images'] = sum(len(s.get('Instances', [])) for s in series_list)
                     comparison_data['orthanc_response_time'] = response_time
                     comparison_data['orthanc_success'] = True
-                else:
-                    rtstruct_orthanc = False
-            else:
-                rtstruct_orthanc = False
+                    rtstruct_orthanc = any(
+                        s.get('MainDicomTags', {}).get('Modality') == 'RTSTRUCT' for s in series_list
+                    )
+
+            # Latences mesurées : distributions répétées plutôt qu'un échantillon unique
+            if self.benchmark is not None and self._benchmark_due(study):
+                comparison_data['benchmark'] = await self._benchmark_study(study)
+                for pacs, results in comparison_data['benchmark'].items():
+                    latency = _reference_latency(results)
+                    if latency is not None:
+                        comparison_data[f'{pacs}_response_time'] = latency
 
             # Plugins installés (Orthanc)
-            orthanc_plugins = []
-            try:
-                resp = await client.get(f"{self.orthanc_url}/plugins")
-                if resp.status_code == 200:
-                    orthanc_plugins = resp.json()
-            except Exception:
-                pass
+            if orthanc_plugins is None:
+                orthanc_plugins = await self._fetch_orthanc_plugins(client)
 
             # Plugins installés (dcm4chee) - statique ou à améliorer
             dcm4chee_plugins = ['dcm4chee-arc', 'dcm4chee-webui']
@@ -340,10 +1329,3 @@ class SyncService:
             comparison_data['sync_status'] = 'error'
 
         return comparison_data
-    
-    async def _fetch_study_from_dcm4chee(self, client: httpx.AsyncClient, study_id: str) -> Dict:
-        """Récupérer les données d'une étude de DCM4CHEE"""
-        response = await client.get(f"{self.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/studies/{study_id}")
-        if response.status_code == 200:
-            return response.json()
-        return {}
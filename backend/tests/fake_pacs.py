@@ -0,0 +1,303 @@
+"""
+PACS simulés pour les tests et mesures de charge de SyncService
+Une archive synthétique (patients > études > séries > instances) est calculée à la
+demande à partir des index : une page ne matérialise que ses propres éléments, ce qui
+permet de simuler 10k à 1M instances sans les garder en mémoire. FakePacs expose cette
+archive sous forme d'API REST Orthanc et QIDO-RS DCM4CHEE via un transport httpx
+en mémoire, avec latence et erreurs injectables.
+"""
+import asyncio
+import random
+from collections import Counter
+from typing import Dict, List, Optional
+import httpx
+
+UID_ROOT = '1.2.826.0.1.3680043.9.7433'
+QIDO_PREFIX = '/dcm4chee-arc/aets/DCM4CHEE/rs'
+
+def qido_value(value, vr: str = 'LO') -> Dict:
+    """Attribut DICOM JSON"""
+    return {'vr': vr, 'Value': [value]}
+
+class SyntheticArchive:
+    """Hiérarchie synthétique déterministe adressée par index"""
+
+    def __init__(self, patients: int = 10, studies_per_patient: int = 2, series_per_study: int = 4,
+                 instances_per_series: int = 25, rtstruct: bool = True):
+        self.patients = patients
+        self.studies_per_patient = studies_per_patient
+        self.series_per_study = series_per_study
+        self.instances_per_series = instances_per_series
+        self.rtstruct = rtstruct  # Dernière série de chaque étude en RTSTRUCT
+
+    @classmethod
+    def with_instances(cls, instances: int, **kwargs) -> 'SyntheticArchive':
+        """Archive d'au moins `instances` instances (forme par défaut de l'arborescence)"""
+        archive = cls(patients=1, **kwargs)
+        per_patient = archive.studies_per_patient * archive.series_per_study * archive.instances_per_series
+        archive.patients = max(1, -(-instances // per_patient))
+        return archive
+
+    @property
+    def studies(self) -> int:
+        return self.patients * self.studies_per_patient
+
+    @property
+    def series(self) -> int:
+        return self.studies * self.series_per_study
+
+    @property
+    def instances(self) -> int:
+        return self.series * self.instances_per_series
+
+    def count(self, level: str) -> int:
+        return getattr(self, level)
+
+    # Identifiants
+    def patient_id(self, p: int) -> str:
+        return f"PAT{p:07d}"
+
+    def study_uid(self, s: int) -> str:
+        return f"{UID_ROOT}.1.{s}"
+
+    def series_uid(self, r: int) -> str:
+        return f"{UID_ROOT}.2.{r}"
+
+    def sop_uid(self, i: int) -> str:
+        return f"{UID_ROOT}.3.{i}"
+
+    @staticmethod
+    def orthanc_id(level: str, index: int) -> str:
+        return f"{level[0]}-{index:08d}"
+
+    @staticmethod
+    def orthanc_index(orthanc_id: str) -> int:
+        return int(orthanc_id.split('-', 1)[1])
+
+    def modality(self, r: int) -> str:
+        last = r % self.series_per_study == self.series_per_study - 1
+        return 'RTSTRUCT' if self.rtstruct and last and self.series_per_study > 1 else 'CT'
+
+    # DICOM JSON (QIDO-RS)
+    def qido_patient(self, p: int) -> Dict:
+        return {
+            '00100020': qido_value(self.patient_id(p)),
+            '00100010': qido_value({'Alphabetic': f'Synthetic^{p}'}, 'PN'),
+            '00100030': qido_value('19700101', 'DA'),
+            '00100040': qido_value('O', 'CS')
+        }
+
+    def qido_study(self, s: int) -> Dict:
+        return {
+            **self.qido_patient(s // self.studies_per_patient),
+            '0020000D': qido_value(self.study_uid(s), 'UI'),
+            '00080020': qido_value('20240101', 'DA'),
+            '00080030': qido_value('120000', 'TM'),
+            '00081030': qido_value(f'Study {s}'),
+            '00201206': qido_value(self.series_per_study, 'IS'),
+            '00201208': qido_value(self.series_per_study * self.instances_per_series, 'IS')
+        }
+
+    def qido_series(self, r: int) -> Dict:
+        return {
+            '0020000D': qido_value(self.study_uid(r // self.series_per_study), 'UI'),
+            '0020000E': qido_value(self.series_uid(r), 'UI'),
+            '00200011': qido_value(r % self.series_per_study + 1, 'IS'),
+            '00080060': qido_value(self.modality(r), 'CS'),
+            '0008103E': qido_value(f'Series {r}'),
+            '00201209': qido_value(self.instances_per_series, 'IS')
+        }
+
+    def qido_instance(self, i: int) -> Dict:
+        return {
+            '0020000E': qido_value(self.series_uid(i // self.instances_per_series), 'UI'),
+            '00080018': qido_value(self.sop_uid(i), 'UI')
+        }
+
+    # Ressources Orthanc étendues
+    def orthanc_patient(self, p: int) -> Dict:
+        return {
+            'ID': self.orthanc_id('patients', p),
+            'MainDicomTags': {
+                'PatientID': self.patient_id(p),
+                'PatientName': f'Synthetic^{p}',
+                'PatientBirthDate': '19700101',
+                'PatientSex': 'O'
+            }
+        }
+
+    def orthanc_study(self, s: int) -> Dict:
+        p = s // self.studies_per_patient
+        return {
+            'ID': self.orthanc_id('studies', s),
+            'ParentPatient': self.orthanc_id('patients', p),
+            'PatientMainDicomTags': self.orthanc_patient(p)['MainDicomTags'],
+            'MainDicomTags': {
+                'StudyInstanceUID': self.study_uid(s),
+                'StudyDate': '20240101',
+                'StudyTime': '120000',
+                'StudyDescription': f'Study {s}'
+            },
+            'LastUpdate': '20240101T120000'
+        }
+
+    def orthanc_series(self, r: int) -> Dict:
+        first = r * self.instances_per_series
+        return {
+            'ID': self.orthanc_id('series', r),
+            'ParentStudy': self.orthanc_id('studies', r // self.series_per_study),
+            'MainDicomTags': {
+                'SeriesInstanceUID': self.series_uid(r),
+                'SeriesNumber': str(r % self.series_per_study + 1),
+                'Modality': self.modality(r),
+                'SeriesDescription': f'Series {r}'
+            },
+            'Instances': [self.orthanc_id('instances', i) for i in range(first, first + self.instances_per_series)]
+        }
+
+    def orthanc_instance(self, i: int) -> Dict:
+        return {
+            'ID': self.orthanc_id('instances', i),
+            'ParentSeries': self.orthanc_id('series', i // self.instances_per_series),
+            'MainDicomTags': {'SOPInstanceUID': self.sop_uid(i)}
+        }
+
+    def study_series(self, s: int) -> range:
+        return range(s * self.series_per_study, (s + 1) * self.series_per_study)
+
+    def study_instances(self, s: int) -> range:
+        per_study = self.series_per_study * self.instances_per_series
+        return range(s * per_study, (s + 1) * per_study)
+
+    def study_index(self, study_uid: str) -> Optional[int]:
+        prefix = f"{UID_ROOT}.1."
+        if not study_uid.startswith(prefix):
+            return None
+        s = int(study_uid[len(prefix):])
+        return s if s < self.studies else None
+
+class FakePacs:
+    """Orthanc REST et DCM4CHEE QIDO-RS simulés sur une même archive synthétique"""
+    dcm4chee_url = 'http://dcm4chee.fake:8080'
+    orthanc_url = 'http://orthanc.fake:8042'
+
+    def __init__(self, archive: SyntheticArchive, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.archive = archive
+        self.latency = latency  # Délai ajouté à chaque requête (secondes)
+        self.jitter = jitter  # Délai aléatoire supplémentaire, uniforme sur [0, jitter]
+        self.error_rate = error_rate  # Proportion de réponses 503
+        self._random = random.Random(seed)
+        self.requests = Counter()  # (pacs, route) -> nombre de requêtes
+        self.errors = 0
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handler)
+
+    def client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=self.transport(), **kwargs)
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        pacs = 'orthanc' if request.url.host == httpx.URL(self.orthanc_url).host else 'dcm4chee'
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            self.requests[(pacs, 'error')] += 1
+            return httpx.Response(503, json={'error': 'injected'})
+        if pacs == 'orthanc':
+            return self._orthanc(request)
+        return self._dcm4chee(request)
+
+    @staticmethod
+    def _window(total: int, offset: int, limit: int) -> range:
+        return range(max(0, offset), min(total, max(0, offset) + limit))
+
+    def _dcm4chee(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if not path.startswith(QIDO_PREFIX):
+            return httpx.Response(404)
+        parts = path[len(QIDO_PREFIX):].strip('/').split('/')
+        archive = self.archive
+        builders = {
+            'patients': archive.qido_patient,
+            'studies': archive.qido_study,
+            'series': archive.qido_series,
+            'instances': archive.qido_instance
+        }
+        if len(parts) == 1 and parts[0] in builders:
+            self.requests[('dcm4chee', parts[0])] += 1
+            params = request.url.params
+            window = self._window(
+                archive.count(parts[0]), int(params.get('offset', 0)), int(params.get('limit', 1000))
+            )
+            if not window:
+                return httpx.Response(204)
+            return httpx.Response(200, json=[builders[parts[0]](index) for index in window])
+        if len(parts) == 3 and parts[0] == 'studies' and parts[2] == 'series':
+            self.requests[('dcm4chee', 'study_series')] += 1
+            s = archive.study_index(parts[1])
+            if s is None:
+                return httpx.Response(204)
+            return httpx.Response(200, json=[archive.qido_series(r) for r in archive.study_series(s)])
+        return httpx.Response(404)
+
+    def _orthanc(self, request: httpx.Request) -> httpx.Response:
+        parts = request.url.path.strip('/').split('/')
+        params = request.url.params
+        archive = self.archive
+        builders = {
+            'patients': archive.orthanc_patient,
+            'studies': archive.orthanc_study,
+            'series': archive.orthanc_series,
+            'instances': archive.orthanc_instance
+        }
+        if parts == ['plugins']:
+            self.requests[('orthanc', 'plugins')] += 1
+            return httpx.Response(200, json=[])
+        if parts == ['changes']:
+            self.requests[('orthanc', 'changes')] += 1
+            return httpx.Response(200, json=self._changes(params))
+        if len(parts) == 1 and parts[0] in builders:
+            self.requests[('orthanc', parts[0])] += 1
+            window = self._window(
+                archive.count(parts[0]), int(params.get('since', 0)), int(params.get('limit', 1000))
+            )
+            if params.get('expand') is None:
+                return httpx.Response(200, json=[archive.orthanc_id(parts[0], index) for index in window])
+            return httpx.Response(200, json=[builders[parts[0]](index) for index in window])
+        if len(parts) >= 2 and parts[0] in builders:
+            self.requests[('orthanc', '/'.join([parts[0], '{id}', *parts[2:]]))] += 1
+            try:
+                index = archive.orthanc_index(parts[1])
+            except (IndexError, ValueError):
+                return httpx.Response(404)
+            if index >= archive.count(parts[0]):
+                return httpx.Response(404)
+            if len(parts) == 2:
+                return httpx.Response(200, json=builders[parts[0]](index))
+            if parts[0] == 'studies' and parts[2:] == ['series']:
+                return httpx.Response(200, json=[archive.orthanc_series(r) for r in archive.study_series(index)])
+            if parts[0] == 'studies' and parts[2:] == ['instances']:
+                return httpx.Response(200, json=[archive.orthanc_instance(i) for i in archive.study_instances(index)])
+        return httpx.Response(404)
+
+    def _changes(self, params) -> Dict:
+        """Flux /changes : une notification StableStudy par étude (Seq = index + 1)"""
+        total = self.archive.studies
+        if params.get('last') is not None:
+            return {'Changes': [], 'Done': True, 'Last': total}
+        since = int(params.get('since', 0))
+        window = self._window(total, since, int(params.get('limit', 100)))
+        changes: List[Dict] = [
+            {
+                'Seq': s + 1,
+                'ChangeType': 'StableStudy',
+                'ID': self.archive.orthanc_id('studies', s),
+                'ResourceType': 'Study'
+            }
+            for s in window
+        ]
+        last = window[-1] + 1 if window else max(since, 0)
+        return {'Changes': changes, 'Done': last >= total, 'Last': last}
@@ -0,0 +1,61 @@
+"""
+Tests pour le banc de mesure DICOMweb
+"""
+import asyncio
+import httpx
+import pytest
+from benchmark import PacsBenchmark, percentile, summarize
+
+def test_percentile():
+    """Test percentiles par interpolation"""
+    samples = [float(i) for i in range(1, 101)]
+    assert percentile(samples, 50) == pytest.approx(50.5)
+    assert percentile(samples, 99) == pytest.approx(99.01)
+    assert percentile([], 95) == 0.0
+
+def test_summarize():
+    """Test résumé d'une distribution"""
+    summary = summarize([0.1, 0.2, 0.3], total_bytes=3000, wall_seconds=1.5, errors=1)
+    assert summary['count'] == 3
+    assert summary['errors'] == 1
+    assert summary['p50'] == pytest.approx(0.2)
+    assert summary['bytes_per_second'] == pytest.approx(2000.0)
+
+def test_benchmark_run():
+    """Test mesures répétées avec préchauffage et niveaux de concurrence"""
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        if request.url.path.endswith('/instances'):
+            return httpx.Response(200, json=[{
+                '0020000E': {'vr': 'UI', 'Value': ['1.2.3.1']},
+                '00080018': {'vr': 'UI', 'Value': ['1.2.3.1.1']}
+            }])
+        return httpx.Response(200, content=b'x' * 1024)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            bench = PacsBenchmark(client, repetitions=3, warmup=1, concurrency=[1, 2])
+            return await bench.run('http://pacs/dicom-web', '1.2.3')
+
+    results = asyncio.run(run())
+    assert set(results) == {'qido', 'metadata', 'retrieve'}
+    assert results['metadata']['1']['count'] == 3
+    assert results['metadata']['2']['count'] == 6
+    assert results['retrieve']['1']['bytes_per_second'] > 0
+    assert '/dicom-web/studies/1.2.3/series/1.2.3.1/instances/1.2.3.1.1' in seen
+    # 1 préchauffage + 3 + 6 mesures par opération
+    assert seen.count('/dicom-web/studies/1.2.3/metadata') == 10
+
+def test_benchmark_errors_counted():
+    """Test erreurs HTTP comptées sans interrompre la mesure"""
+    async def run():
+        transport = httpx.MockTransport(lambda request: httpx.Response(503))
+        async with httpx.AsyncClient(transport=transport) as client:
+            bench = PacsBenchmark(client, repetitions=2, operations=['metadata'])
+            return await bench.run('http://pacs/rs', '1.2.3')
+
+    results = asyncio.run(run())
+    assert results['metadata']['1']['errors'] == 2
+    assert results['metadata']['1']['count'] == 0
@@ -0,0 +1,53 @@
+"""
+Tests pour le cache à durée de vie
+"""
+import asyncio
+from cache import TTLCache
+
+def test_single_flight_load():
+    """Un seul chargement pour des appels concurrents"""
+    cache = TTLCache(ttl=60)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return {'total': 3}
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_load('stats', loader) for _ in range(10)))
+
+    results = asyncio.run(run())
+    assert len(loads) == 1
+    assert all(result == {'total': 3} for result in results)
+
+def test_expiry_and_invalidation():
+    """Valeur rechargée après expiration ou invalidation"""
+    cache = TTLCache(ttl=60)
+    values = iter(range(10))
+
+    async def loader():
+        return next(values)
+
+    async def run():
+        first = await cache.get_or_load('stats', loader)
+        cached = await cache.get_or_load('stats', loader)
+        cache.invalidate()
+        reloaded = await cache.get_or_load('stats', loader)
+        cache.ttl = 0
+        cache.invalidate()
+        uncached = [await cache.get_or_load('stats', loader) for _ in range(2)]
+        return first, cached, reloaded, uncached
+
+    assert asyncio.run(run()) == (0, 0, 1, [2, 3])
+
+def test_invalidation_during_load_not_cached():
+    """Une invalidation pendant le chargement empêche de mettre en cache une valeur périmée"""
+    cache = TTLCache(ttl=60)
+
+    async def loader():
+        cache.invalidate()
+        return 'stale'
+
+    asyncio.run(cache.get_or_load('stats', loader))
+    assert cache.get('stats') is None
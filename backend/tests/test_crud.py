@@ -1,33 +1,121 @@
 """
 Tests pour les opérations CRUD
 """
+import asyncio
+from datetime import datetime, timedelta
 import pytest
-from crud import get_patients, get_studies, get_comparisons
-from database import SessionLocal
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from crud import (
+    get_patients, get_studies, get_comparisons, get_sync_status, get_sync_logs, get_aggregates, next_cursor
+)
+from database import AsyncSessionLocal, Base
+from models import Patient, Study, Comparison, SyncLog, SyncServiceStatus
+
+def run_with_session(operation):
+    """Exécuter une opération CRUD dans une session asynchrone"""
+    async def run():
+        async with AsyncSessionLocal() as db:
+            return await operation(db)
+    return asyncio.run(run())
 
 def test_get_patients():
     """Test récupération patients"""
-    db = SessionLocal()
-    try:
-        patients = get_patients(db, skip=0, limit=10)
-        assert isinstance(patients, list)
-    finally:
-        db.close()
+    patients = run_with_session(lambda db: get_patients(db, limit=10))
+    assert isinstance(patients, list)
 
 def test_get_studies():
     """Test récupération études"""
-    db = SessionLocal()
-    try:
-        studies = get_studies(db, skip=0, limit=10)
-        assert isinstance(studies, list)
-    finally:
-        db.close()
+    studies = run_with_session(lambda db: get_studies(db, limit=10))
+    assert isinstance(studies, list)
 
 def test_get_comparisons():
     """Test récupération comparaisons"""
-    db = SessionLocal()
-    try:
-        comparisons = get_comparisons(db, skip=0, limit=10)
-        assert isinstance(comparisons, list)
-    finally:
-        db.close()
+    comparisons = run_with_session(lambda db: get_comparisons(db, limit=10))
+    assert isinstance(comparisons, list)
+
+def test_get_sync_status():
+    """Test statut de synchronisation"""
+    status = run_with_session(get_sync_status)
+    assert status.pending_patients == status.total_patients - status.synchronized_patients
+
+@pytest.fixture
+def seeded_session_factory(tmp_path):
+    """Base isolée : 5 patients, 5 études du patient p0, 5 logs de même horodatage"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'crud.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    timestamp = datetime(2024, 1, 1)
+    for i in range(5):
+        db.add(Patient(id=f'p{i}', patient_id=f'P{i}'))
+        db.add(Study(id=f's{i}', patient_id='p0' if i < 3 else 'p1'))
+        db.add(SyncLog(service='patients', status='success', timestamp=timestamp - timedelta(days=i // 2)))
+    db.commit()
+    db.close()
+    return async_sessionmaker(create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'crud.db'}"))
+
+def read_all_pages(session_factory, fetch, limit, *columns):
+    """Parcourir toutes les pages d'une liste paginée par clé"""
+    async def run():
+        pages = []
+        cursor = None
+        async with session_factory() as db:
+            while True:
+                items = await fetch(db, cursor, limit)
+                pages.append(items)
+                cursor = next_cursor(items, limit, *columns)
+                if cursor is None:
+                    return pages
+    return asyncio.run(run())
+
+def test_get_patients_keyset_pages(seeded_session_factory):
+    """Test pagination par clé sans doublon ni trou"""
+    pages = read_all_pages(seeded_session_factory, get_patients, 2, 'id')
+    assert [[p.id for p in page] for page in pages] == [['p0', 'p1'], ['p2', 'p3'], ['p4']]
+
+def test_get_studies_keyset_filtered(seeded_session_factory):
+    """Test pagination par clé des études d'un patient"""
+    pages = read_all_pages(
+        seeded_session_factory, lambda db, cursor, limit: get_studies(db, 'p0', cursor, limit), 2, 'id'
+    )
+    assert [[s.id for s in page] for page in pages] == [['s0', 's1'], ['s2']]
+
+def test_get_sync_logs_keyset_ties(seeded_session_factory):
+    """Test historique paginé par (timestamp, id) avec horodatages égaux"""
+    pages = read_all_pages(seeded_session_factory, get_sync_logs, 2, 'timestamp', 'id')
+    logs = [log for page in pages for log in page]
+    assert [log.id for log in logs] == [2, 1, 4, 3, 5]
+
+def test_invalid_cursor():
+    """Test curseur invalide"""
+    with pytest.raises(ValueError):
+        run_with_session(lambda db: get_patients(db, after='not-a-cursor'))
+
+def test_get_aggregates_single_query(tmp_path):
+    """Test compteurs du statut calculés en une requête"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Patient(id='p0', synchronized=True), Patient(id='p1'), Study(id='s0'), Study(id='s1')])
+    db.add_all([Comparison(id='c0', sync_status='completed'), Comparison(id='c1', sync_status='error')])
+    db.add(SyncServiceStatus(service='patients', last_sync=datetime(2024, 3, 1)))
+    db.commit()
+    db.close()
+
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    statements = []
+
+    async def run():
+        async with async_sessionmaker(async_engine)() as session:
+            aggregates = await get_aggregates(session)
+            return aggregates, await get_sync_status(session, aggregates)
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    aggregates, status = asyncio.run(run())
+    assert len(statements) == 1
+    assert aggregates['total_comparisons'] == 2
+    assert status.total_patients == 2
+    assert status.pending_patients == 1
+    assert status.synced_studies == 1
+    assert status.last_sync == datetime(2024, 3, 1)
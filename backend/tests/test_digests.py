@@ -0,0 +1,177 @@
+"""
+Tests pour les empreintes de contenu par PACS
+"""
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import Patient, Study, Series, Instance
+from crud import get_diverging_studies
+from digests import diff_study, mark_dirty, merkle_digest, refresh_digests, refresh_dirty
+from sync_service import SyncService
+from tests.fake_pacs import FakePacs, SyntheticArchive
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Base SQLite isolée par test (sessions synchrones pour préparer et vérifier)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'digests.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def async_session_factory(tmp_path, session_factory):
+    """Sessions asynchrones sur la même base"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'digests.db'}")
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+def test_merkle_digest():
+    """Empreinte indépendante de l'ordre, None pour un ensemble vide"""
+    assert merkle_digest(['1.2', '1.1']) == merkle_digest(['1.1', '1.2'])
+    assert merkle_digest(['1.1']) != merkle_digest(['1.1', '1.2'])
+    assert merkle_digest([]) is None
+
+def test_hierarchical_divergence(session_factory, async_session_factory):
+    """Seules l'étude et la série divergentes sont remontées, avec les instances manquantes"""
+    db = session_factory()
+    db.add(Patient(id='p', patient_id='P001'))
+    for study in ('same', 'diff'):
+        db.add(Study(id=study, patient_id='p', study_uid=f'1.{study}'))
+        for series in ('a', 'b'):
+            db.add(Series(id=f'{study}-{series}', study_id=study, series_uid=f'1.{study}.{series}'))
+            for i in range(3):
+                uid = f'1.{study}.{series}.{i}'
+                db.add(Instance(id=uid, series_id=f'{study}-{series}', sop_instance_uid=uid,
+                                dcm4chee_id=uid, orthanc_id=f'o-{uid}'))
+    db.get(Instance, '1.diff.b.1').dcm4chee_id = None
+    db.get(Instance, '1.diff.b.2').orthanc_id = None
+    db.commit()
+    db.close()
+
+    async def run():
+        async with async_session_factory() as session:
+            refreshed = await refresh_digests(session, ['same-a', 'same-b', 'diff-a', 'diff-b'], batch_size=3)
+            await session.commit()
+            studies = await get_diverging_studies(session)
+            return refreshed, [await diff_study(session, study) for study in studies]
+
+    refreshed, diffs = asyncio.run(run())
+    assert refreshed == 4
+    assert len(diffs) == 1
+    assert diffs[0]['study_id'] == 'diff'
+    assert diffs[0]['dcm4chee_digest'] != diffs[0]['orthanc_digest']
+    assert [s['series_uid'] for s in diffs[0]['series']] == ['1.diff.b']
+    assert diffs[0]['series'][0]['missing_in_dcm4chee'] == ['1.diff.b.1']
+    assert diffs[0]['series'][0]['missing_in_orthanc'] == ['1.diff.b.2']
+
+def test_sync_maintains_digests(session_factory, async_session_factory):
+    """La synchronisation tient les empreintes à jour ; la vérification ne détaille que l'écart"""
+    archive = SyntheticArchive(patients=4, studies_per_patient=2, series_per_study=2, instances_per_series=5)
+    pacs = FakePacs(archive)
+    service = SyncService(dcm4chee_url=pacs.dcm4chee_url, orthanc_url=pacs.orthanc_url, xnat_url='http://xnat',
+                          session_factory=async_session_factory, page_size=7)
+    service.client = pacs.client()
+
+    async def run():
+        try:
+            hierarchy = await service.sync_hierarchy()
+            clean = await service.check_consistency()
+            async with async_session_factory() as session:
+                instance = await session.scalar(select(Instance).order_by(Instance.id).limit(1))
+                instance.orthanc_id = None
+                await session.flush()
+                await refresh_digests(session, [instance.series_id])
+                await session.commit()
+            return hierarchy, clean, await service.check_consistency()
+        finally:
+            await service.close()
+
+    hierarchy, clean, diverged = asyncio.run(run())
+    assert hierarchy['digests'] == archive.series
+    db = session_factory()
+    try:
+        # Toutes les empreintes renseignées ; seules la série modifiée et son étude diffèrent
+        for model, total in ((Series, archive.series), (Study, archive.studies)):
+            rows = db.query(model).all()
+            assert len(rows) == total
+            assert all(row.dcm4chee_digest and row.orthanc_digest for row in rows)
+            assert sum(row.dcm4chee_digest != row.orthanc_digest for row in rows) == 1
+    finally:
+        db.close()
+    assert clean['diverging_studies'] == 0
+    assert diverged['diverging_studies'] == 1
+    assert diverged['diverging_series'] == 1
+    assert diverged['missing_in_orthanc'] == 1
+    assert diverged['missing_in_dcm4chee'] == 0
+
+def test_full_listing_detects_deleted_instances(session_factory, async_session_factory):
+    """Instance supprimée d'Orthanc : présence retirée au listage complet suivant, série divergente"""
+    archive = SyntheticArchive(patients=2, studies_per_patient=1, series_per_study=2, instances_per_series=3)
+    pacs = FakePacs(archive)
+    deleted = archive.sop_uid(archive.instances - 1)
+    drop = [False]
+
+    async def handler(request):
+        response = await pacs.handler(request)
+        if drop[0] and request.url.host == 'orthanc.fake' and request.url.path == '/instances':
+            # Dernière instance supprimée d'Orthanc (dernière page : la pagination est inchangée)
+            instances = [i for i in response.json() if i['MainDicomTags']['SOPInstanceUID'] != deleted]
+            return httpx.Response(200, json=instances)
+        return response
+
+    service = SyncService(dcm4chee_url=pacs.dcm4chee_url, orthanc_url=pacs.orthanc_url, xnat_url='http://xnat',
+                          session_factory=async_session_factory, page_size=4)
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def run():
+        try:
+            await service.sync_hierarchy()
+            drop[0] = True
+            hierarchy = await service.sync_hierarchy()
+            return hierarchy, await service.check_consistency()
+        finally:
+            await service.close()
+
+    hierarchy, report = asyncio.run(run())
+    assert hierarchy['orthanc_removed'] == 1
+    assert hierarchy['dcm4chee_removed'] == 0
+    assert report['diverging_series'] == 1
+    assert report['missing_in_orthanc'] == 1
+    db = session_factory()
+    try:
+        instance = db.query(Instance).filter(Instance.sop_instance_uid == deleted).one()
+        assert instance.orthanc_id is None
+        assert instance.dcm4chee_id is not None
+        assert db.query(Series).filter(Series.digest_dirty.is_(True)).count() == 0
+    finally:
+        db.close()
+
+def test_dirty_marks_survive_failed_pass(session_factory, async_session_factory):
+    """Marques de séries à recalculer en base : une passe interrompue est reprise par la suivante"""
+    db = session_factory()
+    db.add(Series(id='s', study_id='st', series_uid='1.1'))
+    db.add(Study(id='st', study_uid='1'))
+    db.add(Instance(id='i', series_id='s', sop_instance_uid='1.1.1', dcm4chee_id='1.1.1'))
+    db.commit()
+    db.close()
+
+    async def run():
+        async with async_session_factory() as session:
+            await mark_dirty(session, ['s'])
+            await session.commit()
+        # Nouvelle session (passe suivante) : la marque est relue en base
+        async with async_session_factory() as session:
+            refreshed = await refresh_dirty(session)
+            await session.commit()
+            return refreshed
+
+    assert asyncio.run(run()) == 1
+    db = session_factory()
+    try:
+        series = db.get(Series, 's')
+        assert series.dcm4chee_digest == merkle_digest(['1.1.1'])
+        assert series.digest_dirty is False
+    finally:
+        db.close()
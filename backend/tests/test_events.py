@@ -0,0 +1,72 @@
+"""
+Tests pour le bus d'événements de progression
+"""
+import asyncio
+import json
+from events import EventBus, format_sse
+
+def test_publish_to_subscribers():
+    """Chaque abonné reçoit les événements publiés après son abonnement"""
+    bus = EventBus()
+
+    async def run():
+        first = bus.subscribe()
+        second = bus.subscribe()
+        pending = [asyncio.ensure_future(first.__anext__()), asyncio.ensure_future(second.__anext__())]
+        await asyncio.sleep(0)
+        bus.publish('page', phase='orthanc_studies', rows=10)
+        events = await asyncio.gather(*pending)
+        subscribed = bus.subscribers
+        await first.aclose()
+        await second.aclose()
+        return events, subscribed
+
+    events, subscribed = asyncio.run(run())
+    assert subscribed == 2
+    assert events[0] == events[1]
+    assert events[0]['type'] == 'page'
+    assert events[0]['rows'] == 10
+    assert bus.subscribers == 0
+
+def test_replay_after_last_event_id():
+    """Reprise après un identifiant : seuls les événements suivants sont rejoués"""
+    bus = EventBus(history=3)
+    for i in range(5):
+        bus.publish('page', rows=i)
+
+    async def run():
+        subscription = bus.subscribe(after=3)
+        events = [await subscription.__anext__(), await subscription.__anext__()]
+        await subscription.aclose()
+        return events
+
+    assert [e['rows'] for e in asyncio.run(run())] == [3, 4]
+    assert [e['id'] for e in bus.recent()] == [3, 4, 5]
+
+def test_slow_subscriber_drops_oldest():
+    """Abonné lent : file bornée aux événements les plus récents, publication jamais bloquée"""
+    bus = EventBus(queue_size=2)
+
+    async def run():
+        subscription = bus.subscribe(keepalive=0.05)
+        first = asyncio.ensure_future(subscription.__anext__())
+        await asyncio.sleep(0)
+        for i in range(5):
+            bus.publish('page', rows=i)
+        received = [await first, await subscription.__anext__()]
+        keepalive = await subscription.__anext__()
+        await subscription.aclose()
+        return received, keepalive
+
+    received, keepalive = asyncio.run(run())
+    assert [e['rows'] for e in received] == [3, 4]
+    assert bus.dropped == 3
+    assert keepalive is None
+
+def test_format_sse():
+    """Trame SSE : identifiant pour Last-Event-ID, données JSON"""
+    frame = format_sse({'id': 7, 'type': 'page', 'rows': 3})
+    assert frame.startswith('id: 7\ndata: ')
+    assert frame.endswith('\n\n')
+    assert json.loads(frame.split('data: ', 1)[1]) == {'id': 7, 'type': 'page', 'rows': 3}
+    assert format_sse(None) == ': keepalive\n\n'
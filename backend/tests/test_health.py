@@ -0,0 +1,64 @@
+"""
+Tests pour la surveillance de la santé des services
+"""
+import asyncio
+import time
+import httpx
+from health import HealthMonitor
+
+def make_monitor(handler, **kwargs):
+    """Moniteur branché sur un transport HTTP simulé"""
+    monitor = HealthMonitor(
+        targets={'dcm4chee': 'http://dcm4chee/ui', 'orthanc': 'http://orthanc/system', 'xnat': 'http://xnat/'},
+        **kwargs
+    )
+    monitor.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return monitor
+
+def test_probes_run_concurrently():
+    """Les sondes lentes s'exécutent en parallèle"""
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200)
+
+    async def run():
+        monitor = make_monitor(handler)
+        start = time.perf_counter()
+        snapshot = await monitor.refresh()
+        return snapshot, time.perf_counter() - start
+
+    snapshot, elapsed = asyncio.run(run())
+    assert elapsed < 0.5
+    assert snapshot['status'] == 'healthy'
+    assert snapshot['services']['database'].startswith('healthy')
+    assert snapshot['services']['orthanc'] == 'healthy'
+
+def test_snapshot_served_with_age():
+    """/health sert l'instantané mémorisé sans nouvelle sonde"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.host)
+        return httpx.Response(503 if request.url.host == 'xnat' else 200)
+
+    async def run():
+        monitor = make_monitor(handler)
+        first = await monitor.snapshot()
+        await asyncio.sleep(0.01)
+        second = await monitor.snapshot()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 3
+    assert first['status'] == 'degraded'
+    assert first['services']['xnat'] == 'unhealthy'
+    assert second['timestamp'] == first['timestamp']
+    assert second['age_us'] >= 10_000
+
+def test_probe_error_reported():
+    """Une erreur de connexion est rapportée par son type"""
+    def handler(request):
+        raise httpx.ConnectError('refused', request=request)
+
+    snapshot = asyncio.run(make_monitor(handler).refresh())
+    assert snapshot['services']['dcm4chee'] == 'unhealthy: ConnectError'
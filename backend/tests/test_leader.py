@@ -0,0 +1,170 @@
+"""
+Tests pour l'élection du worker de synchronisation
+"""
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import SyncLease, shard_key
+from leader import LeaderElection, shard_of
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Base SQLite isolée par test (sessions synchrones pour préparer et vérifier)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'leases.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def async_session_factory(tmp_path, session_factory):
+    """Sessions asynchrones partagées par les workers simulés"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'leases.db'}")
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+def test_single_leader(async_session_factory):
+    """Un seul worker obtient le bail ; il est repris après libération"""
+    first = LeaderElection(async_session_factory, holder='worker-1')
+    second = LeaderElection(async_session_factory, holder='worker-2')
+
+    async def run():
+        assert await first.try_acquire() == 0
+        assert await second.try_acquire() is None
+        assert await first.renew()
+        await first.release()
+        assert await second.try_acquire() == 0
+
+    asyncio.run(run())
+    assert not first.is_leader
+    assert second.is_leader
+
+def test_expired_lease_taken_over(session_factory, async_session_factory):
+    """Un bail expiré (worker bloqué) est repris et l'ancien détenteur le perd"""
+    first = LeaderElection(async_session_factory, holder='worker-1')
+    second = LeaderElection(async_session_factory, holder='worker-2')
+
+    async def acquire(election):
+        return await election.try_acquire()
+
+    assert asyncio.run(acquire(first)) == 0
+    db = session_factory()
+    try:
+        db.get(SyncLease, 'sync:0').expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+
+    assert asyncio.run(acquire(second)) == 0
+    assert not asyncio.run(first.renew())
+    assert not first.is_leader
+
+def test_shards_assigned_to_distinct_workers(async_session_factory):
+    """Chaque shard est détenu par un worker différent"""
+    workers = [LeaderElection(async_session_factory, shards=2, holder=f'worker-{i}') for i in range(3)]
+
+    async def run():
+        return [await worker.try_acquire() for worker in workers]
+
+    assert asyncio.run(run()) == [0, 1, None]
+
+def test_worker_takes_every_free_shard(async_session_factory):
+    """Moins de workers que de shards : un worker détient et renouvelle tous les shards libres"""
+    election = LeaderElection(async_session_factory, shards=3, holder='worker-1')
+    other = LeaderElection(async_session_factory, shards=3, holder='worker-2')
+
+    async def run():
+        acquired = [await election.try_acquire() for _ in range(4)]
+        assert await election.renew()
+        assert await other.try_acquire() is None
+        return acquired
+
+    assert asyncio.run(run()) == [0, 1, 2, None]
+    assert set(election.held) == {0, 1, 2}
+    assert election.holds(0)
+
+def test_run_starts_work_for_every_shard(async_session_factory):
+    """Un seul worker : une boucle par shard, tous les shards couverts"""
+    election = LeaderElection(async_session_factory, shards=3, ttl=0.06, holder='worker-1')
+    started = []
+
+    async def work(shard, shards):
+        started.append((shard, shards))
+        await asyncio.Event().wait()
+
+    async def run():
+        task = asyncio.create_task(election.run(work))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert sorted(started) == [(0, 3), (1, 3), (2, 3)]
+    assert not election.is_leader
+
+def test_run_stops_work_when_lease_lost(session_factory, async_session_factory):
+    """Le travail démarre avec le bail et s'arrête dès qu'un autre worker le détient"""
+    election = LeaderElection(async_session_factory, ttl=0.3, holder='worker-1')
+    started = []
+    cancelled = []
+
+    async def work(shard, shards):
+        started.append((shard, shards))
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(shard)
+            raise
+
+    async def run():
+        task = asyncio.create_task(election.run(work))
+        await asyncio.sleep(0.05)
+        db = session_factory()
+        try:
+            lease = db.get(SyncLease, 'sync:0')
+            lease.holder = 'worker-2'
+            lease.expires_at = datetime.utcnow() + timedelta(seconds=60)
+            db.commit()
+        finally:
+            db.close()
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert started == [(0, 1)]
+    assert cancelled == [0]
+    db = session_factory()
+    try:
+        # Le bail d'un autre worker n'est pas libéré à l'arrêt
+        assert db.get(SyncLease, 'sync:0').holder == 'worker-2'
+    finally:
+        db.close()
+
+def test_shard_of_stable():
+    """Répartition stable et couvrant tous les shards"""
+    assert shard_of('patient-1', 1) == 0
+    assert shard_of('patient-1', 4) == shard_of('patient-1', 4)
+    assert {shard_of(f'patient-{i}', 4) for i in range(100)} == {0, 1, 2, 3}
+    # Même répartition que le filtre SQL sur la clé stockée
+    assert all(shard_of(f'patient-{i}', 4) == shard_key(f'patient-{i}') % 4 for i in range(100))
+
+def test_claim_held_lease_without_insert(async_session_factory, monkeypatch):
+    """Bail détenu ailleurs : aucune insertion tentée (pas d'erreur d'intégrité)"""
+    first = LeaderElection(async_session_factory, holder='worker-1')
+    second = LeaderElection(async_session_factory, holder='worker-2')
+    inserted = []
+    original_add = async_session_factory.class_.add
+
+    def add(self, instance, *args, **kwargs):
+        inserted.append(instance)
+        return original_add(self, instance, *args, **kwargs)
+
+    async def run():
+        assert await first.try_acquire() == 0
+        monkeypatch.setattr(async_session_factory.class_, 'add', add)
+        assert await second.try_acquire() is None
+
+    asyncio.run(run())
+    assert inserted == []
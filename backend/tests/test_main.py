@@ -35,3 +35,53 @@ def test_metrics_endpoint():
     """Test du endpoint /metrics"""
     response = client.get("/metrics")
     assert response.status_code == 200
+
+def test_list_invalid_cursor():
+    """Test curseur de pagination invalide"""
+    response = client.get("/api/patients", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_list_cursor_wrong_shape():
+    """Test curseur décodable mais de forme inattendue (historique : horodatage et id)"""
+    from crud import encode_cursor
+    response = client.get("/api/sync/history", params={"cursor": encode_cursor('not-a-date', 3)})
+    assert response.status_code == 400
+    response = client.get("/api/patients", params={"cursor": encode_cursor(1, 2)})
+    assert response.status_code == 400
+
+def test_list_query_error_not_reported_as_cursor(monkeypatch):
+    """Test erreur de la requête (pilote, sérialisation) : 500, pas « Invalid cursor »"""
+    import main
+    from crud import encode_cursor
+
+    async def failing(db, after=None, limit=100):
+        raise ValueError("driver failure")
+
+    monkeypatch.setattr(main, 'get_patients', failing)
+    failing_client = TestClient(app, raise_server_exceptions=False)
+    response = failing_client.get("/api/patients", params={"cursor": encode_cursor('p1')})
+    assert response.status_code == 500
+
+def test_orthanc_webhook_requires_started_service():
+    """Test webhook Orthanc avant le démarrage du service de synchronisation"""
+    response = client.post("/api/webhooks/orthanc/studies", json={"events": [{"ID": "st-1", "Type": "StableStudy"}]})
+    assert response.status_code == 503
+
+def test_sync_events_stream():
+    """Flux SSE : reprise des événements après l'identifiant demandé"""
+    import asyncio
+    from main import stream_sync_events, sync_events
+    last = sync_events.publish('page', phase='test', rows=1)['id']
+    sync_events.publish('page', phase='test', rows=2)
+
+    async def first_frame():
+        response = await stream_sync_events(since=last, last_event_id=None)
+        try:
+            return response.media_type, await response.body_iterator.__anext__()
+        finally:
+            await response.body_iterator.aclose()
+
+    media_type, frame = asyncio.run(first_frame())
+    assert media_type == "text/event-stream"
+    assert frame.startswith(f"id: {last + 1}\n")
+    assert '"rows": 2' in frame
@@ -0,0 +1,61 @@
+"""
+Tests pour l'instrumentation Prometheus
+"""
+import asyncio
+import httpx
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from main import app
+from metrics import upstream_event_hooks, instrument_engine
+
+client = TestClient(app)
+
+def sample(name, **labels):
+    """Valeur courante d'une série (0 si absente)"""
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_middleware_records_route_template():
+    """Latence et statut enregistrés par modèle de route, pas par URL"""
+    labels = {'method': 'GET', 'endpoint': '/api/studies/{study_id}/comparison', 'status': '404'}
+    before = sample('pacs_request_duration_seconds_count', **labels)
+    client.get("/api/studies/unknown-study/comparison")
+    assert sample('pacs_request_duration_seconds_count', **labels) == before + 1
+    assert sample('pacs_requests_total', **labels) >= 1
+
+def test_middleware_unmatched_route():
+    """Les URL inconnues partagent une seule série"""
+    labels = {'method': 'GET', 'endpoint': '<unmatched>', 'status': '404'}
+    before = sample('pacs_requests_total', **labels)
+    client.get("/api/invalid_endpoint_xyz")
+    assert sample('pacs_requests_total', **labels) == before + 1
+
+def test_metrics_content_type():
+    """Le format d'exposition Prometheus est annoncé"""
+    response = client.get("/metrics")
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    assert 'pacs_response_size_bytes' in response.text
+
+def test_upstream_hooks():
+    """Les appels amont sont mesurés par service"""
+    labels = {'service': 'orthanc', 'method': 'GET', 'status': '200'}
+    before = sample('pacs_upstream_request_duration_seconds_count', **labels)
+
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, json={})),
+            event_hooks=upstream_event_hooks({'dcm4chee': 'http://dcm4chee', 'orthanc': 'http://orthanc'})
+        ) as upstream:
+            await upstream.get('http://orthanc/system')
+
+    asyncio.run(run())
+    assert sample('pacs_upstream_request_duration_seconds_count', **labels) == before + 1
+
+def test_db_query_duration():
+    """Les requêtes SQL sont mesurées par opération"""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    before = sample('pacs_db_query_duration_seconds_count', operation='select')
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert sample('pacs_db_query_duration_seconds_count', operation='select') == before + 1
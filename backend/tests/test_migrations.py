@@ -0,0 +1,78 @@
+"""
+Tests pour les migrations du schéma
+"""
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from database import Base
+from migrations import run_migrations
+from models import shard_key
+
+def test_run_migrations_adds_missing_columns(tmp_path):
+    """Test ajout des colonnes absentes d'une table existante"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE comparisons (id VARCHAR PRIMARY KEY, study_id VARCHAR)"))
+    run_migrations(engine)
+    columns = {column['name'] for column in inspect(engine).get_columns('comparisons')}
+    assert 'fingerprint' in columns
+    assert 'sync_status' in columns
+
+def test_run_migrations_idempotent(tmp_path):
+    """Test migrations rejouables sans erreur"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE studies (id VARCHAR PRIMARY KEY)"))
+    run_migrations(engine)
+    run_migrations(engine)
+    columns = {column['name'] for column in inspect(engine).get_columns('studies')}
+    assert 'orthanc_last_update' in columns
+
+def test_run_migrations_creates_indexes(tmp_path):
+    """Test création des index absents d'une table existante"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE sync_logs (id INTEGER PRIMARY KEY, timestamp DATETIME)"))
+    run_migrations(engine)
+    run_migrations(engine)
+    indexes = {index['name'] for index in inspect(engine).get_indexes('sync_logs')}
+    assert {'ix_sync_logs_timestamp_id', 'ix_sync_logs_service_timestamp'} <= indexes
+
+def test_run_migrations_backfills_shard_keys(tmp_path):
+    """Test clé de shard calculée pour les patients existants"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE patients (id VARCHAR PRIMARY KEY, patient_id VARCHAR)"))
+        connection.execute(text("INSERT INTO patients (id, patient_id) VALUES ('p1', 'P001'), ('p2', 'P002')"))
+    run_migrations(engine)
+    with engine.connect() as connection:
+        keys = dict(connection.execute(text("SELECT id, shard_key FROM patients")).all())
+    assert keys == {'p1': shard_key('p1'), 'p2': shard_key('p2')}
+
+def test_run_migrations_unique_uids_merge_duplicates(tmp_path):
+    """Test index UID rendus uniques : doublons fusionnés, enfants rattachés à la ligne conservée"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table, column in (('studies', 'study_uid'), ('series', 'series_uid'), ('instances', 'sop_instance_uid')):
+            connection.execute(text(f"DROP INDEX ix_{table}_{column}"))
+            connection.execute(text(f"CREATE INDEX ix_{table}_{column} ON {table} ({column})"))
+        connection.execute(text("INSERT INTO studies (id, study_uid) VALUES ('a', '1.2'), ('b', '1.2'), ('c', '1.3')"))
+        connection.execute(text(
+            "INSERT INTO series (id, study_id, series_uid) VALUES ('s1', 'a', '1.2.1'), ('s2', 'b', '1.2.2')"
+        ))
+        connection.execute(text("INSERT INTO comparisons (id, study_id) VALUES ('c1', 'a'), ('c2', 'b')"))
+        connection.execute(text(
+            "INSERT INTO instances (id, series_id, sop_instance_uid) VALUES ('i1', 's1', '9'), ('i2', 's2', '9')"
+        ))
+    run_migrations(engine)
+    run_migrations(engine)
+    indexes = {index['name']: index['unique'] for index in inspect(engine).get_indexes('studies')}
+    assert indexes['ix_studies_study_uid']
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT id FROM studies ORDER BY id")).scalars().all() == ['a', 'c']
+        assert dict(connection.execute(text("SELECT id, study_id FROM series")).all()) == {'s1': 'a', 's2': 'a'}
+        assert connection.execute(text("SELECT id FROM comparisons")).scalars().all() == ['c1']
+        assert connection.execute(text("SELECT id FROM instances")).scalars().all() == ['i1']
+        with pytest.raises(IntegrityError):
+            connection.execute(text("INSERT INTO studies (id, study_uid) VALUES ('d', '1.3')"))
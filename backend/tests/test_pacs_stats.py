@@ -0,0 +1,72 @@
+"""
+Tests pour le proxy des statistiques PACS
+"""
+import asyncio
+import httpx
+from pacs_stats import PacsStatsProxy
+
+def make_proxy(handler, **kwargs):
+    """Proxy branché sur un transport HTTP simulé"""
+    proxy = PacsStatsProxy(orthanc_url='http://orthanc', dcm4chee_url='http://dcm4chee', **kwargs)
+    proxy.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return proxy
+
+def test_dcm4chee_counts_endpoints():
+    """Compteurs DCM4CHEE lus via /count, sans télécharger les listes"""
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        counts = {'patients': 12, 'studies': 30, 'instances': 4500}
+        level = request.url.path.split('/')[-2]
+        return httpx.Response(200, json={'count': counts[level]})
+
+    stats = asyncio.run(make_proxy(handler).dcm4chee_statistics())
+    assert stats == {'CountPatients': 12, 'CountStudies': 30, 'CountInstances': 4500, 'TotalDiskSizeMB': 0}
+    assert all(path.endswith('/count') for path in paths)
+    assert len(paths) == 3
+
+def test_concurrent_requests_coalesced():
+    """Appels concurrents : une seule requête amont, puis réponse servie depuis le cache"""
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={'CountPatients': 3})
+
+    async def run():
+        proxy = make_proxy(handler)
+        results = await asyncio.gather(*(proxy.orthanc_statistics() for _ in range(20)))
+        results.append(await proxy.orthanc_statistics())
+        return results
+
+    results = asyncio.run(run())
+    assert calls == ['/statistics']
+    assert all(r == {'CountPatients': 3} for r in results)
+
+def test_ttl_per_endpoint():
+    """Durée de vie propre à chaque endpoint ; erreurs non mises en cache"""
+    calls = []
+    status = {'code': 503}
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == '/statistics':
+            return httpx.Response(200, json={'CountStudies': len(calls)})
+        return httpx.Response(status['code'], json=['dicom-web'])
+
+    async def run():
+        proxy = make_proxy(handler, ttls={'orthanc_statistics': 0})
+        await proxy.orthanc_statistics()
+        await proxy.orthanc_statistics()
+        try:
+            await proxy.orthanc_plugins()
+        except httpx.HTTPStatusError:
+            pass
+        status['code'] = 200
+        await proxy.orthanc_plugins()
+        return await proxy.orthanc_plugins()
+
+    assert asyncio.run(run()) == ['dicom-web']
+    assert calls == ['/statistics', '/statistics', '/plugins', '/plugins']
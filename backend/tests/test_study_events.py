@@ -0,0 +1,71 @@
+"""
+Tests pour les notifications de changement d'études
+"""
+import asyncio
+from study_events import StudyEventDispatcher
+
+def test_duplicates_coalesced_within_debounce():
+    """Les notifications répétées d'une étude donnent une seule synchronisation"""
+    batches = []
+
+    async def sync_studies(study_ids):
+        batches.append(sorted(study_ids))
+
+    async def run():
+        dispatcher = StudyEventDispatcher(sync_studies, debounce=0.05)
+        task = asyncio.create_task(dispatcher.run())
+        queued = dispatcher.submit(['st-1', 'st-2', 'st-1'])
+        queued += dispatcher.submit(['st-2'])
+        pending = dispatcher.pending
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return queued, pending
+
+    queued, pending = asyncio.run(run())
+    assert (queued, pending) == (2, 2)
+    assert batches == [['st-1', 'st-2']]
+
+def test_batches_bounded_and_errors_isolated():
+    """Lots bornés ; une erreur de synchronisation n'arrête pas le répartiteur"""
+    batches = []
+
+    async def sync_studies(study_ids):
+        batches.append(list(study_ids))
+        if len(batches) == 1:
+            raise RuntimeError('orthanc unavailable')
+
+    async def run():
+        dispatcher = StudyEventDispatcher(sync_studies, debounce=0.01, max_batch=2)
+        task = asyncio.create_task(dispatcher.run())
+        dispatcher.submit(['a', 'b', 'c'])
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return dispatcher.pending
+
+    assert asyncio.run(run()) == 0
+    assert batches == [['a', 'b'], ['c']]
+
+def test_inactive_worker_ignores_notifications():
+    """Worker sans bail : notifications ignorées, le leader les reprend via /changes"""
+    batches = []
+    active = [True]
+
+    async def sync_studies(study_ids):
+        batches.append(list(study_ids))
+
+    async def run():
+        dispatcher = StudyEventDispatcher(sync_studies, debounce=0.05, active=lambda: active[0])
+        task = asyncio.create_task(dispatcher.run())
+        queued = dispatcher.submit(['st-1'])
+        # Bail perdu pendant l'anti-rebond
+        active[0] = False
+        queued += dispatcher.submit(['st-2'])
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return queued, dispatcher.pending
+
+    assert asyncio.run(run()) == (1, 0)
+    assert batches == []
@@ -0,0 +1,200 @@
+"""
+Mesures de charge de la synchronisation sur PACS simulés (tests/fake_pacs.py)
+La taille de l'archive est réglée par SYNC_BENCH_INSTANCES (défaut : 2000, de 10k à
+1M pour une mesure représentative). SYNC_BENCH_MIN_RATE (instances/s) et
+SYNC_BENCH_MIN_COMPARISONS (études/s) font échouer la mesure sous ces débits.
+"""
+import asyncio
+import os
+import time
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import Patient, Study, Series, Instance, Comparison, SyncCursor
+from sync_service import SyncService
+from tests.fake_pacs import FakePacs, SyntheticArchive
+
+BENCH_INSTANCES = int(os.getenv('SYNC_BENCH_INSTANCES', '2000'))
+MIN_RATE = float(os.getenv('SYNC_BENCH_MIN_RATE', '0'))
+MIN_COMPARISONS = float(os.getenv('SYNC_BENCH_MIN_COMPARISONS', '0'))
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Base SQLite isolée par test (sessions synchrones pour vérifier)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'bench.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def async_session_factory(tmp_path, session_factory):
+    """Sessions asynchrones du service sur la même base"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bench.db'}")
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+def make_service(pacs: FakePacs, **kwargs) -> SyncService:
+    """Service branché sur les PACS simulés"""
+    service = SyncService(
+        dcm4chee_url=pacs.dcm4chee_url,
+        orthanc_url=pacs.orthanc_url,
+        xnat_url='http://xnat.fake',
+        **kwargs
+    )
+    service.client = pacs.client()
+    return service
+
+def counts(session_factory):
+    db = session_factory()
+    try:
+        return {
+            model.__tablename__: db.scalar(select(func.count()).select_from(model))
+            for model in (Patient, Study, Series, Instance, Comparison)
+        }
+    finally:
+        db.close()
+
+def test_archive_pages_consistent():
+    """Pages QIDO-RS et Orthanc contiguës, identifiants cohérents entre les deux PACS"""
+    archive = SyntheticArchive(patients=3, studies_per_patient=2, series_per_study=2, instances_per_series=3)
+    pacs = FakePacs(archive)
+
+    async def run():
+        async with pacs.client() as client:
+            qido = await client.get(
+                f"{pacs.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/instances",
+                params={'offset': 30, 'limit': 10}
+            )
+            empty = await client.get(
+                f"{pacs.dcm4chee_url}/dcm4chee-arc/aets/DCM4CHEE/rs/instances",
+                params={'offset': 36, 'limit': 10}
+            )
+            series = await client.get(f"{pacs.orthanc_url}/series", params={'expand': '', 'since': 11, 'limit': 5})
+            study = await client.get(f"{pacs.orthanc_url}/studies/{archive.orthanc_id('studies', 5)}/series")
+            changes = await client.get(f"{pacs.orthanc_url}/changes", params={'since': 4, 'limit': 10})
+            return qido, empty, series, study, changes
+
+    qido, empty, series, study, changes = asyncio.run(run())
+    assert archive.instances == 36
+    assert [i['00080018']['Value'][0] for i in qido.json()] == [archive.sop_uid(i) for i in range(30, 36)]
+    assert empty.status_code == 204
+    assert [s['ID'] for s in series.json()] == [archive.orthanc_id('series', 11)]
+    assert [s['MainDicomTags']['SeriesInstanceUID'] for s in study.json()] == [
+        archive.series_uid(10), archive.series_uid(11)
+    ]
+    assert study.json()[1]['MainDicomTags']['Modality'] == 'RTSTRUCT'
+    assert changes.json() == {
+        'Changes': [
+            {'Seq': 5, 'ChangeType': 'StableStudy', 'ID': archive.orthanc_id('studies', 4), 'ResourceType': 'Study'},
+            {'Seq': 6, 'ChangeType': 'StableStudy', 'ID': archive.orthanc_id('studies', 5), 'ResourceType': 'Study'}
+        ],
+        'Done': True,
+        'Last': 6
+    }
+
+def test_error_injection_and_latency():
+    """Erreurs 503 injectées dans la proportion demandée, latence appliquée à chaque requête"""
+    pacs = FakePacs(SyntheticArchive(patients=1), latency=0.002, error_rate=0.25, seed=1)
+
+    async def run():
+        async with pacs.client() as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(client.get(f"{pacs.orthanc_url}/plugins") for _ in range(200)))
+            return responses, time.perf_counter() - start
+
+    responses, elapsed = asyncio.run(run())
+    failed = sum(1 for r in responses if r.status_code == 503)
+    assert failed == pacs.errors
+    assert 25 <= failed <= 75
+    assert elapsed >= 0.002
+
+def test_full_sync_throughput(session_factory, async_session_factory):
+    """Réconciliation complète puis comparaisons : volumes exacts et débits mesurés"""
+    archive = SyntheticArchive.with_instances(BENCH_INSTANCES)
+    pacs = FakePacs(archive)
+    service = make_service(pacs, session_factory=async_session_factory, concurrency=8, page_size=500)
+
+    async def run():
+        try:
+            start = time.perf_counter()
+            await service.sync_patients()
+            hierarchy = await service.sync_hierarchy()
+            sync_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+            comparisons = await service.generate_comparisons()
+            compare_seconds = time.perf_counter() - start
+            # Seconde passe : études inchangées ignorées
+            start = time.perf_counter()
+            second = await service.generate_comparisons()
+            second_seconds = time.perf_counter() - start
+            return hierarchy, sync_seconds, comparisons, compare_seconds, second, second_seconds
+        finally:
+            await service.close()
+
+    hierarchy, sync_seconds, comparisons, compare_seconds, second, second_seconds = asyncio.run(run())
+    instance_rate = 2 * archive.instances / sync_seconds
+    comparison_rate = comparisons / compare_seconds
+    print(
+        f"\n{archive.instances} instances x 2 PACS synchronisées en {sync_seconds:.2f}s "
+        f"({instance_rate:.0f} instances/s) ; {comparisons} comparaisons en {compare_seconds:.2f}s "
+        f"({comparison_rate:.1f} études/s) ; seconde passe {second_seconds:.2f}s"
+    )
+
+    assert hierarchy['dcm4chee_instances'] == archive.instances
+    assert hierarchy['orthanc_instances'] == archive.instances
+    assert counts(session_factory) == {
+        'patients': archive.patients,
+        'studies': archive.studies,
+        'series': archive.series,
+        'instances': archive.instances,
+        'comparisons': archive.studies
+    }
+    assert comparisons == archive.studies
+    assert second == 0
+    assert instance_rate >= MIN_RATE
+    assert comparison_rate >= MIN_COMPARISONS
+
+def test_incremental_sync_throughput(session_factory, async_session_factory):
+    """Flux /changes (une étude stable par changement) appliqué depuis le curseur"""
+    archive = SyntheticArchive.with_instances(min(BENCH_INSTANCES, 20000))
+    pacs = FakePacs(archive)
+    service = make_service(pacs, session_factory=async_session_factory, page_size=100)
+    db = session_factory()
+    db.add(SyncCursor(source='orthanc', last_seq=0))
+    db.commit()
+    db.close()
+
+    async def run():
+        try:
+            start = time.perf_counter()
+            applied = await service.sync_changes()
+            return applied, time.perf_counter() - start
+        finally:
+            await service.close()
+
+    applied, seconds = asyncio.run(run())
+    print(f"\n{applied} changements appliqués en {seconds:.2f}s ({applied / seconds:.1f} études/s)")
+
+    assert applied == archive.studies
+    result = counts(session_factory)
+    assert result['studies'] == archive.studies
+    assert result['instances'] == archive.instances
+
+def test_sync_under_latency_and_errors(session_factory, async_session_factory):
+    """Erreurs amont : la passe en échec est journalisée, les pages déjà validées sont conservées"""
+    archive = SyntheticArchive(patients=20, studies_per_patient=1, series_per_study=2, instances_per_series=5)
+    pacs = FakePacs(archive, latency=0.001, jitter=0.002, error_rate=0.2, seed=3)
+    service = make_service(pacs, session_factory=async_session_factory, page_size=10)
+
+    async def run():
+        try:
+            return await service.sync_hierarchy()
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+    assert pacs.errors > 0
+    entry = service.log_writer._buffer[-1]
+    assert entry['service'] == 'hierarchy'
+    assert entry['status'] == 'error'
+    assert counts(session_factory)['studies'] <= archive.studies
@@ -0,0 +1,153 @@
+"""
+Tests pour l'écriture des logs de synchronisation
+"""
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import SyncLog, SyncServiceStatus
+from sync_log import SyncLogWriter
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Base SQLite isolée par test (sessions synchrones pour préparer et vérifier)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'logs.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+@pytest.fixture
+def async_session_factory(tmp_path, session_factory):
+    """Sessions asynchrones de l'écrivain sur la même base"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'logs.db'}")
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+def test_flush_writes_batch_and_status(session_factory, async_session_factory):
+    """Les logs en tampon sont écrits en un lot et le statut par service est tenu à jour"""
+    writer = SyncLogWriter(session_factory=async_session_factory)
+    writer.log('patients', 'sync', 'success', 'Synced 3 patients')
+    writer.log('orthanc', 'changes', 'success', 'Applied 2 changes')
+    writer.log('patients', 'sync', 'error', 'timeout')
+
+    assert asyncio.run(writer.flush()) == 3
+
+    db = session_factory()
+    try:
+        assert db.query(SyncLog).count() == 3
+        status = db.get(SyncServiceStatus, 'patients')
+        assert status.status == 'error'
+        assert status.message == 'timeout'
+        assert status.last_success is not None
+        assert status.last_success <= status.last_sync
+        assert db.query(SyncServiceStatus).count() == 2
+    finally:
+        db.close()
+
+def test_background_flush_on_batch_size(session_factory, async_session_factory):
+    """La tâche de fond écrit dès qu'un lot est complet, puis le reliquat à l'arrêt"""
+    writer = SyncLogWriter(session_factory=async_session_factory, flush_interval=60, batch_size=2)
+
+    async def run():
+        task = asyncio.create_task(writer.run())
+        await asyncio.sleep(0.05)
+        writer.log('hierarchy', 'sync', 'success', 'a')
+        writer.log('hierarchy', 'sync', 'success', 'b')
+        await asyncio.sleep(0.2)
+        db = session_factory()
+        written = db.query(SyncLog).count()
+        db.close()
+        writer.log('hierarchy', 'sync', 'success', 'c')
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return written
+
+    assert asyncio.run(run()) == 2
+    db = session_factory()
+    try:
+        assert db.query(SyncLog).count() == 3
+    finally:
+        db.close()
+
+def test_prune_by_age_and_row_count(session_factory, async_session_factory):
+    """Rétention : logs trop anciens puis au-delà du nombre maximal de lignes"""
+    db = session_factory()
+    now = datetime.utcnow()
+    db.add(SyncLog(service='patients', status='success', timestamp=now - timedelta(days=40)))
+    for i in range(5):
+        db.add(SyncLog(service='patients', status='success', timestamp=now - timedelta(minutes=5 - i)))
+    db.commit()
+    db.close()
+
+    writer = SyncLogWriter(session_factory=async_session_factory, retention_days=30, max_rows=3)
+    assert asyncio.run(writer.prune()) == 3
+
+    db = session_factory()
+    try:
+        assert [log.id for log in db.query(SyncLog).order_by(SyncLog.id)] == [4, 5, 6]
+    finally:
+        db.close()
+
+def test_backfill_status_from_existing_logs(session_factory, async_session_factory):
+    """Le statut par service est initialisé depuis les logs existants"""
+    db = session_factory()
+    db.add(SyncLog(service='orthanc', status='success', timestamp=datetime(2024, 1, 1)))
+    db.add(SyncLog(service='orthanc', status='success', timestamp=datetime(2024, 2, 1)))
+    db.commit()
+    db.close()
+
+    asyncio.run(SyncLogWriter(session_factory=async_session_factory)._backfill_status())
+
+    db = session_factory()
+    try:
+        assert db.get(SyncServiceStatus, 'orthanc').last_sync == datetime(2024, 2, 1)
+    finally:
+        db.close()
+
+def test_status_upsert_from_concurrent_writers(session_factory, async_session_factory):
+    """Deux écrivains (workers) sur le même service : une seule ligne de statut"""
+    writers = [SyncLogWriter(session_factory=async_session_factory) for _ in range(2)]
+    writers[0].log('patients', 'sync', 'success', 'ok')
+    writers[1].log('patients', 'sync', 'error', 'timeout')
+
+    async def run():
+        await asyncio.gather(*(writer.flush() for writer in writers))
+
+    asyncio.run(run())
+    db = session_factory()
+    try:
+        assert db.query(SyncServiceStatus).count() == 1
+        status = db.get(SyncServiceStatus, 'patients')
+        assert status.last_sync is not None
+    finally:
+        db.close()
+
+    # Un log en erreur ne remet pas à zéro la dernière réussite
+    writers[0].log('patients', 'sync', 'success', 'ok')
+    asyncio.run(writers[0].flush())
+    writers[0].log('patients', 'sync', 'error', 'timeout')
+    asyncio.run(writers[0].flush())
+    db = session_factory()
+    try:
+        status = db.get(SyncServiceStatus, 'patients')
+        assert status.status == 'error'
+        assert status.last_success is not None
+    finally:
+        db.close()
+
+def test_flush_cancelled_keeps_buffer(async_session_factory):
+    """Annulation pendant l'écriture : le lot reste en tampon"""
+    class CancelledSession:
+        async def __aenter__(self):
+            raise asyncio.CancelledError()
+
+        async def __aexit__(self, *exc):
+            return False
+
+    writer = SyncLogWriter(session_factory=CancelledSession)
+    writer.log('patients', 'sync', 'success', 'ok')
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(writer.flush())
+    assert [entry['message'] for entry in writer._buffer] == ['ok']
@@ -0,0 +1,683 @@
+"""
+Tests pour le service de synchronisation
+"""
+import asyncio
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from models import Patient, Study, Series, Instance, Comparison, SyncCursor, SyncLog, shard_key
+from sync_service import SyncService
+from leader import shard_of
+from cache import TTLCache
+
+ORTHANC_PATIENTS = [
+    {
+        'ID': f'orthanc-{i}',
+        'MainDicomTags': {
+            'PatientID': f'P{i:03d}',
+            'PatientName': f'Patient^{i}',
+            'PatientBirthDate': '19700101',
+            'PatientSex': 'O'
+        }
+    }
+    for i in range(23)
+]
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Base SQLite isolée par test (sessions synchrones pour préparer et vérifier)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'sync.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture
+def async_session_factory(tmp_path, session_factory):
+    """Sessions asynchrones du service sur la même base"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'sync.db'}")
+    return async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+def qido_value(value, vr='LO'):
+    """Attribut DICOM JSON"""
+    return {'vr': vr, 'Value': [value]}
+
+def qido_page(request, items):
+    """Réponse QIDO-RS paginée (limit/offset)"""
+    offset = int(request.url.params.get('offset', 0))
+    limit = int(request.url.params.get('limit', len(items)))
+    page = items[offset:offset + limit]
+    return httpx.Response(200, json=page) if page else httpx.Response(204)
+
+def make_service(handler, **kwargs):
+    """Service branché sur un transport HTTP simulé"""
+    service = SyncService(
+        dcm4chee_url='http://dcm4chee',
+        orthanc_url='http://orthanc',
+        xnat_url='http://xnat',
+        **kwargs
+    )
+    service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service.benchmark_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+def orthanc_handler(requests_seen):
+    def handler(request):
+        requests_seen.append(request)
+        if request.url.path == '/patients':
+            since = int(request.url.params['since'])
+            limit = int(request.url.params['limit'])
+            return httpx.Response(200, json=ORTHANC_PATIENTS[since:since + limit])
+        return httpx.Response(404)
+    return handler
+
+def test_fetch_orthanc_patients_paginated():
+    """Test énumération Orthanc par pages étendues"""
+    requests_seen = []
+    service = make_service(orthanc_handler(requests_seen), concurrency=2, page_size=5)
+
+    async def run():
+        try:
+            return await service._fetch_orthanc_patients(service.client)
+        finally:
+            await service.close()
+
+    patients = asyncio.run(run())
+    assert [p['patient_id'] for p in patients] == [f'P{i:03d}' for i in range(23)]
+    assert patients[0]['id'] == 'orthanc-0'
+    assert patients[0]['name'] == 'Patient^0'
+    assert all('expand' in r.url.params for r in requests_seen)
+    # 23 patients en pages de 5 : 5 pages utiles, arrêt à la première page incomplète
+    assert len(requests_seen) == 6
+
+def test_fetch_orthanc_patients_error():
+    """Test erreur Orthanc : liste vide"""
+    service = make_service(lambda request: httpx.Response(500))
+
+    async def run():
+        try:
+            return await service._fetch_orthanc_patients(service.client)
+        finally:
+            await service.close()
+
+    assert asyncio.run(run()) == []
+
+def test_shared_client_reused():
+    """Test réutilisation du client keep-alive"""
+    service = SyncService('http://dcm4chee', 'http://orthanc', 'http://xnat', concurrency=4)
+
+    async def run():
+        first = service._get_client()
+        second = service._get_client()
+        await service.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert service.client is None
+
+ORTHANC_RESOURCES = {
+    '/patients/pat-1': {
+        'ID': 'pat-1',
+        'MainDicomTags': {'PatientID': 'P001', 'PatientName': 'Doe^John'}
+    },
+    '/studies/st-1': {
+        'ID': 'st-1',
+        'ParentPatient': 'pat-1',
+        'MainDicomTags': {'StudyInstanceUID': '1.2.3', 'StudyDate': '20240101'},
+        'PatientMainDicomTags': {'PatientID': 'P001'},
+        'LastUpdate': '20240101T120000'
+    },
+    '/series/se-1': {
+        'ID': 'se-1',
+        'ParentStudy': 'st-1',
+        'MainDicomTags': {'SeriesInstanceUID': '1.2.3.1', 'Modality': 'CT'},
+        'Instances': ['in-1', 'in-2']
+    },
+    '/studies/st-1/instances': [
+        {'ID': 'in-1', 'ParentSeries': 'se-1', 'MainDicomTags': {'SOPInstanceUID': '1.2.3.1.1'}},
+        {'ID': 'in-2', 'ParentSeries': 'se-1', 'MainDicomTags': {'SOPInstanceUID': '1.2.3.1.2'}}
+    ]
+}
+
+ORTHANC_CHANGES = [
+    {'Seq': 1, 'ChangeType': 'NewPatient', 'ID': 'pat-1'},
+    {'Seq': 2, 'ChangeType': 'NewStudy', 'ID': 'st-1'},
+    {'Seq': 3, 'ChangeType': 'NewSeries', 'ID': 'se-1'},
+    {'Seq': 4, 'ChangeType': 'NewInstance', 'ID': 'in-1'},
+    {'Seq': 5, 'ChangeType': 'StableStudy', 'ID': 'st-1'}
+]
+
+def changes_handler(request):
+    if request.url.path == '/changes':
+        if 'last' in request.url.params:
+            return httpx.Response(200, json={'Changes': [], 'Done': True, 'Last': 42})
+        since = int(request.url.params['since'])
+        limit = int(request.url.params['limit'])
+        page = [c for c in ORTHANC_CHANGES if c['Seq'] > since][:limit]
+        last = page[-1]['Seq'] if page else since
+        return httpx.Response(200, json={'Changes': page, 'Done': last == 5, 'Last': last})
+    if request.url.path in ORTHANC_RESOURCES:
+        return httpx.Response(200, json=ORTHANC_RESOURCES[request.url.path])
+    return httpx.Response(404)
+
+def test_sync_changes_applies_deltas(session_factory, async_session_factory):
+    """Test synchronisation incrémentale depuis /changes"""
+    db = session_factory()
+    db.add(SyncCursor(source='orthanc', last_seq=0))
+    db.commit()
+    db.close()
+    service = make_service(changes_handler, page_size=2, session_factory=async_session_factory)
+
+    async def run():
+        try:
+            return await service.sync_changes()
+        finally:
+            await service.close()
+
+    assert asyncio.run(run()) == 4
+
+    db = session_factory()
+    try:
+        patient = db.query(Patient).one()
+        study = db.query(Study).one()
+        series = db.query(Series).one()
+        assert patient.patient_id == 'P001'
+        assert patient.orthanc_id == 'pat-1'
+        assert study.patient_id == patient.id
+        assert study.orthanc_last_update == '20240101T120000'
+        assert series.study_id == study.id
+        assert series.modality == 'CT'
+        assert db.query(Instance).filter(Instance.series_id == series.id).count() == 2
+        assert db.query(SyncCursor).one().last_seq == 5
+    finally:
+        db.close()
+
+def test_sync_studies_targeted(session_factory, async_session_factory):
+    """Test synchronisation ciblée d'une étude notifiée puis de sa seule comparaison"""
+    db = session_factory()
+    db.add(Study(id='other', study_uid='9.9.9', orthanc_id='st-9'))
+    db.add(Study(id='known', study_uid='1.2.3', dcm4chee_id='1.2.3', image_count=3))
+    db.commit()
+    db.close()
+    service = make_service(changes_handler, session_factory=async_session_factory, benchmark=None)
+
+    async def run():
+        try:
+            return await service.sync_studies(['st-1'])
+        finally:
+            await service.log_writer.flush()
+            await service.close()
+
+    assert asyncio.run(run()) == {'studies_synced': 1, 'comparisons_generated': 1}
+
+    db = session_factory()
+    try:
+        study = db.query(Study).filter(Study.orthanc_id == 'st-1').one()
+        # Nombre d'images de la synchronisation complète (DCM4CHEE) conservé
+        assert study.id == 'known'
+        assert study.image_count == 3
+        assert db.query(Instance).count() == 2
+        assert [c.study_id for c in db.query(Comparison)] == [study.id]
+        assert db.query(SyncLog).filter(SyncLog.action == 'notify').one().status == 'success'
+    finally:
+        db.close()
+
+def test_sync_changes_bootstrap(session_factory, async_session_factory):
+    """Test premier démarrage : curseur en tête du flux puis réconciliation"""
+    service = make_service(changes_handler, session_factory=async_session_factory)
+    reconciled = []
+
+    async def fake_reconcile():
+        reconciled.append(True)
+        return {'completed': True}
+
+    service.reconcile = fake_reconcile
+
+    async def run():
+        try:
+            return await service.sync_changes()
+        finally:
+            await service.close()
+
+    assert asyncio.run(run()) == 0
+    assert reconciled == [True]
+    db = session_factory()
+    try:
+        assert db.query(SyncCursor).one().last_seq == 42
+    finally:
+        db.close()
+
+def test_sync_changes_bootstrap_retried_after_failed_reconcile(session_factory, async_session_factory):
+    """Test réconciliation initiale en échec : pas de curseur, nouvel essai au cycle suivant"""
+    service = make_service(changes_handler, session_factory=async_session_factory)
+    results = [{'completed': False}, {'completed': True}]
+    reconciled = []
+
+    async def fake_reconcile():
+        reconciled.append(True)
+        return results.pop(0)
+
+    service.reconcile = fake_reconcile
+
+    async def run():
+        try:
+            await service.sync_changes()
+            db = session_factory()
+            try:
+                assert db.query(SyncCursor).count() == 0
+            finally:
+                db.close()
+            await service.sync_changes()
+        finally:
+            await service.close()
+
+    asyncio.run(run())
+    assert reconciled == [True, True]
+    db = session_factory()
+    try:
+        assert db.query(SyncCursor).one().last_seq == 42
+    finally:
+        db.close()
+
+def test_sync_patients_bulk_reconciliation(session_factory, async_session_factory):
+    """Test réconciliation des patients par lots"""
+    db = session_factory()
+    db.add(Patient(id='existing', name='Patient^1', patient_id='P001', dcm4chee_id='old'))
+    db.commit()
+    db.close()
+
+    dcm4chee_patients = [
+        {'00100020': qido_value(f'P{i:03d}'), '00100010': {'vr': 'PN', 'Value': [{'Alphabetic': f'Patient^{i}'}]}}
+        for i in range(1, 8)
+    ]
+
+    def handler(request):
+        if request.url.path.endswith('/rs/patients'):
+            return qido_page(request, dcm4chee_patients)
+        return orthanc_handler([])(request)
+
+    service = make_service(handler, batch_size=3, page_size=10, session_factory=async_session_factory)
+
+    async def run():
+        try:
+            return await service.sync_patients()
+        finally:
+            await service.log_writer.flush()
+            await service.close()
+
+    assert asyncio.run(run()) == 6
+
+    db = session_factory()
+    try:
+        assert db.query(Patient).count() == 7
+        existing = db.query(Patient).filter(Patient.patient_id == 'P001').one()
+        assert existing.id == 'existing'
+        assert existing.dcm4chee_id == 'P001'
+        assert db.query(Patient).filter(Patient.patient_id == 'P002').one().name == 'Patient^2'
+        assert existing.orthanc_id == 'orthanc-1'
+        assert existing.synchronized
+        created = db.query(Patient).filter(Patient.patient_id == 'P007').one()
+        assert created.orthanc_id == 'orthanc-7'
+        # Clé de shard calculée aussi pour les insertions par lots
+        assert all(p.shard_key == shard_key(p.id) for p in db.query(Patient))
+        log = db.query(SyncLog).filter(SyncLog.service == 'patients').one()
+        assert log.status == 'success'
+        assert [b['rows'] for b in log.details['batches']] == [3, 3, 1]
+    finally:
+        db.close()
+
+def test_upsert_page_concurrent_insert(session_factory, async_session_factory):
+    """Étude insérée par un autre écrivain pendant la page : mise à jour, aucun doublon"""
+    service = make_service(lambda request: httpx.Response(404), session_factory=async_session_factory)
+
+    async def stale_id_map(db, model, column, keys):
+        return {}  # Lecture faite avant l'insertion concurrente
+
+    service._id_map = stale_id_map
+
+    async def run():
+        async with async_session_factory() as db:
+            # Écriture concurrente (synchronisation ciblée) pendant le traitement de la page
+            db_sync = session_factory()
+            db_sync.add(Study(id='first', study_uid='1.2.3', study_description='Scanner'))
+            db_sync.commit()
+            db_sync.close()
+            count = await service._upsert_page(db, Study, 'study_uid', [
+                {'study_uid': '1.2.3', 'orthanc_id': 'st-1', 'study_description': None},
+                {'study_uid': '1.2.4', 'orthanc_id': 'st-2', 'study_description': None},
+            ], ('orthanc_id',))
+            await db.commit()
+        await service.close()
+        return count
+
+    assert asyncio.run(run()) == 2
+    db = session_factory()
+    try:
+        studies = {s.study_uid: s for s in db.query(Study)}
+        assert len(studies) == 2
+        assert studies['1.2.3'].id == 'first'
+        assert studies['1.2.3'].orthanc_id == 'st-1'
+        assert studies['1.2.3'].study_description == 'Scanner'
+    finally:
+        db.close()
+
+def test_sync_hierarchy_paginated(session_factory, async_session_factory):
+    """Test synchronisation études/séries/instances par pages QIDO-RS et Orthanc"""
+    qido = {
+        'studies': [{
+            '00100020': qido_value('P001'),
+            '0020000D': qido_value('1.2.3', 'UI'),
+            '00080020': qido_value('20240101', 'DA'),
+            '00201208': qido_value(3, 'IS')
+        }],
+        'series': [{
+            '0020000D': qido_value('1.2.3', 'UI'),
+            '0020000E': qido_value('1.2.3.1', 'UI'),
+            '00080060': qido_value('CT', 'CS'),
+            '00200011': qido_value(1, 'IS'),
+            '00201209': qido_value(3, 'IS')
+        }],
+        'instances': [
+            {'0020000E': qido_value('1.2.3.1', 'UI'), '00080018': qido_value(f'1.2.3.1.{i}', 'UI')}
+            for i in range(3)
+        ]
+    }
+    orthanc = {
+        '/studies': [{
+            'ID': 'st-1', 'ParentPatient': 'pat-1',
+            'MainDicomTags': {'StudyInstanceUID': '1.2.3'},
+            'PatientMainDicomTags': {'PatientID': 'P001'}
+        }],
+        '/series': [{
+            'ID': 'se-1', 'ParentStudy': 'st-1',
+            'MainDicomTags': {'SeriesInstanceUID': '1.2.3.1'},
+            'Instances': ['in-0', 'in-1']
+        }],
+        '/instances': [
+            {'ID': f'in-{i}', 'ParentSeries': 'se-1', 'MainDicomTags': {'SOPInstanceUID': f'1.2.3.1.{i}'}}
+            for i in range(2)
+        ]
+    }
+
+    def handler(request):
+        level = request.url.path.rsplit('/', 1)[-1]
+        if '/rs/' in request.url.path:
+            return qido_page(request, qido[level])
+        since = int(request.url.params['since'])
+        limit = int(request.url.params['limit'])
+        return httpx.Response(200, json=orthanc[request.url.path][since:since + limit])
+
+    cache = TTLCache(ttl=60)
+    invalidations = []
+    cache.invalidate = lambda key=None: invalidations.append(key)
+    service = make_service(handler, page_size=2, session_factory=async_session_factory, cache=cache)
+
+    async def run():
+        try:
+            return await service.sync_hierarchy()
+        finally:
+            await service.close()
+
+    counts = asyncio.run(run())
+    assert counts['dcm4chee_instances'] == 3
+    assert counts['orthanc_instances'] == 2
+    # Compteurs en cache invalidés une fois pour la passe, pas à chaque page
+    assert invalidations == [None]
+    # Progression publiée page par page puis par phase
+    events = service.events.recent()
+    pages = [e for e in events if e['type'] == 'page' and e['phase'] == 'dcm4chee_instances']
+    assert sum(e['rows'] for e in pages) == 3
+    assert pages[-1]['total'] == 3
+    assert any(e['type'] == 'phase_completed' and e['phase'] == 'orthanc_instances' for e in events)
+
+    db = session_factory()
+    try:
+        study = db.query(Study).one()
+        series = db.query(Series).one()
+        assert study.dcm4chee_id == '1.2.3'
+        assert study.orthanc_id == 'st-1'
+        assert study.image_count == 3
+        assert study.patient_id == db.query(Patient).filter(Patient.patient_id == 'P001').one().id
+        assert series.study_id == study.id
+        assert series.orthanc_id == 'se-1'
+        assert series.series_number == '1'
+        instances = db.query(Instance).order_by(Instance.sop_instance_uid).all()
+        assert [i.dcm4chee_id is not None for i in instances] == [True, True, True]
+        assert [i.orthanc_id for i in instances] == ['in-0', 'in-1', None]
+    finally:
+        db.close()
+
+def test_generate_comparisons_skips_unchanged(session_factory, async_session_factory):
+    """Test comparaisons parallèles : études inchangées ignorées, limite par PACS"""
+    db = session_factory()
+    db.add(Patient(id='p', patient_id='P001'))
+    for i in range(6):
+        db.add(Study(
+            id=f'study-{i}', patient_id='p', study_uid=f'1.2.{i}',
+            dcm4chee_id=f'1.2.{i}', orthanc_id=f'st-{i}',
+            image_count=2, series_count=1, orthanc_last_update='20240101T000000'
+        ))
+    # Comparaison à jour : ignorée ; comparaison obsolète : recalculée
+    db.add(Comparison(id='c0', study_id='study-0', sync_status='completed',
+                      fingerprint='20240101T000000|1|2'))
+    db.add(Comparison(id='c1', study_id='study-1', sync_status='completed', fingerprint='old'))
+    db.commit()
+    db.close()
+
+    in_flight = {'orthanc': 0}
+    peak = {'orthanc': 0}
+
+    async def handler(request):
+        if request.url.path == '/plugins':
+            return httpx.Response(200, json=['dicom-web'])
+        if request.url.path.startswith('/studies/'):
+            in_flight['orthanc'] += 1
+            peak['orthanc'] = max(peak['orthanc'], in_flight['orthanc'])
+            await asyncio.sleep(0.01)
+            in_flight['orthanc'] -= 1
+            return httpx.Response(200, json=[
+                {'MainDicomTags': {'Modality': 'CT'}, 'Instances': ['a', 'b']}
+            ])
+        return httpx.Response(200, json=[
+            {'00080060': qido_value('CT', 'CS'), '00201209': qido_value(2, 'IS')}
+        ])
+
+    service = make_service(
+        handler, concurrency=4, batch_size=2,
+        pacs_concurrency={'orthanc': 2}, session_factory=async_session_factory
+    )
+
+    async def run():
+        try:
+            return await service.generate_comparisons()
+        finally:
+            await service.close()
+
+    assert asyncio.run(run()) == 5
+    assert peak['orthanc'] <= 2
+
+    db = session_factory()
+    try:
+        comparisons = {c.study_id: c for c in db.query(Comparison).all()}
+        assert len(comparisons) == 6
+        assert comparisons['study-0'].dcm4chee_images == 0
+        assert comparisons['study-1'].fingerprint == '20240101T000000|1|2'
+        assert all(c.sync_status == 'completed' for c in comparisons.values())
+        assert comparisons['study-5'].orthanc_images == 2
+        assert comparisons['study-5'].dcm4chee_images == 2
+        assert 'image_count_diff' not in comparisons['study-5'].differences
+    finally:
+        db.close()
+
+def test_generate_comparisons_sharded(session_factory, async_session_factory):
+    """Chaque shard compare les seules études de ses patients ; les shards couvrent toutes les études"""
+    db = session_factory()
+    for i in range(8):
+        db.add(Patient(id=f'p{i}', patient_id=f'P{i:03d}'))
+        db.add(Study(id=f'study-{i}', patient_id=f'p{i}', study_uid=f'1.3.{i}', orthanc_id=f'st-{i}'))
+    db.commit()
+    db.close()
+
+    def handler(request):
+        return httpx.Response(200, json=[])
+
+    compared = []
+    for shard in range(2):
+        service = make_service(handler, session_factory=async_session_factory)
+        service.shards = 2
+
+        async def run():
+            try:
+                return await service.generate_comparisons(shard=shard)
+            finally:
+                await service.close()
+
+        compared.append(asyncio.run(run()))
+
+    expected = [sum(1 for i in range(8) if shard_of(f'p{i}', 2) == shard) for shard in range(2)]
+    assert compared == expected
+    assert sum(compared) == 8
+
+    # Déclenchement manuel : toutes les études, quel que soit le shard du worker
+    db = session_factory()
+    db.query(Comparison).delete()
+    db.commit()
+    db.close()
+    service = make_service(handler, session_factory=async_session_factory)
+    service.shards = 2
+
+    async def run_all():
+        try:
+            return await service.generate_comparisons(all_shards=True, shard=1)
+        finally:
+            await service.close()
+
+    assert asyncio.run(run_all()) == 8
+
+def test_compare_study_with_benchmark():
+    """Test comparaison avec distributions de latence par PACS"""
+    def handler(request):
+        if request.url.path.endswith('/instances'):
+            return httpx.Response(200, json=[])
+        if request.url.path.endswith('/metadata') or request.url.path.endswith('/rs/studies'):
+            return httpx.Response(200, json=[{}])
+        return httpx.Response(200, json=[])
+
+    service = make_service(handler, benchmark={'repetitions': 3, 'warmup': 1, 'concurrency': [1]},
+                           benchmark_sample=1.0)
+    study = Study(id='s', study_uid='1.2.3', dcm4chee_id='1.2.3', orthanc_id='st-1')
+
+    async def run():
+        try:
+            return await service._compare_study(service.client, study, orthanc_plugins=[])
+        finally:
+            await service.close()
+
+    data = asyncio.run(run())
+    assert set(data['benchmark']) == {'dcm4chee', 'orthanc'}
+    assert set(data['benchmark']['orthanc']) == {'qido', 'metadata'}
+    assert data['benchmark']['orthanc']['metadata']['1']['count'] == 3
+    assert data['orthanc_response_time'] == data['benchmark']['orthanc']['metadata']['1']['p50']
+
+def test_compare_study_benchmark_failure_keeps_comparison():
+    """Test mesure en échec : benchmark marqué en erreur, comparaison terminée"""
+    def handler(request):
+        if request.url.path.endswith('/instances'):
+            return httpx.Response(200, content=b'not json')
+        return httpx.Response(200, json=[])
+
+    service = make_service(handler, benchmark={'repetitions': 1, 'warmup': 0, 'concurrency': [1],
+                                               'operations': ['retrieve']}, benchmark_sample=1.0)
+    study = Study(id='s', study_uid='1.2.3', orthanc_id='st-1')
+
+    async def run():
+        try:
+            return await service._compare_study(service.client, study, orthanc_plugins=[])
+        finally:
+            await service.close()
+
+    data = asyncio.run(run())
+    assert data['sync_status'] == 'completed'
+    assert data['orthanc_success'] is True
+    assert 'error' in data['benchmark']['orthanc']
+
+def test_compare_study_benchmark_sampled():
+    """Test échantillonnage : aucune étude mesurée avec une part nulle"""
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json=[])
+
+    service = make_service(handler, benchmark={'repetitions': 1, 'warmup': 0, 'concurrency': [1]},
+                           benchmark_sample=0.0)
+    study = Study(id='s', study_uid='1.2.3', orthanc_id='st-1')
+
+    async def run():
+        try:
+            return await service._compare_study(service.client, study, orthanc_plugins=[])
+        finally:
+            await service.close()
+
+    data = asyncio.run(run())
+    assert data['benchmark'] is None
+    assert requests == ['/studies/st-1/series']
+
+def test_benchmark_bypasses_resilient_client():
+    """Mesures sur un client direct : aucune requête de benchmark par le client de synchronisation"""
+    sync_paths = []
+    bench_paths = []
+
+    def sync_handler(request):
+        sync_paths.append(request.url.path)
+        return httpx.Response(200, json=[])
+
+    def bench_handler(request):
+        bench_paths.append(request.url.path)
+        return httpx.Response(200, json=[{}])
+
+    service = make_service(sync_handler, benchmark={'repetitions': 2, 'warmup': 0, 'concurrency': [1],
+                                                    'operations': ['qido']}, benchmark_sample=1.0)
+    service.benchmark_client = httpx.AsyncClient(transport=httpx.MockTransport(bench_handler))
+    study = Study(id='s', study_uid='1.2.3', orthanc_id='st-1')
+
+    async def run():
+        try:
+            return await service._compare_study(service.client, study, orthanc_plugins=[])
+        finally:
+            await service.close()
+
+    data = asyncio.run(run())
+    assert data['benchmark']['orthanc']['qido']['1']['count'] == 2
+    assert sync_paths == ['/studies/st-1/series']
+    assert bench_paths == ['/dicom-web/studies', '/dicom-web/studies']
+    assert service.benchmark_client is None
+
+def test_benchmarks_serialized_per_pacs():
+    """Mesures de plusieurs workers sur un même PACS : jamais simultanées"""
+    active = []
+    peak = []
+
+    async def bench_handler(request):
+        active.append(request)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(request)
+        return httpx.Response(200, json=[{}])
+
+    service = make_service(lambda request: httpx.Response(200, json=[]),
+                           benchmark={'repetitions': 2, 'warmup': 0, 'concurrency': [1], 'operations': ['qido']})
+    service.benchmark_client = httpx.AsyncClient(transport=httpx.MockTransport(bench_handler))
+    studies = [Study(id=f's{i}', study_uid=f'1.2.{i}', orthanc_id=f'st-{i}') for i in range(4)]
+
+    async def run():
+        try:
+            return await asyncio.gather(*(service._benchmark_study(study) for study in studies))
+        finally:
+            await service.close()
+
+    results = asyncio.run(run())
+    assert all(result['orthanc']['qido']['1']['count'] == 2 for result in results)
+    assert max(peak) == 1
@@ -0,0 +1,104 @@
+"""
+Tests pour le routage en flux DCM4CHEE -> XNAT
+"""
+import asyncio
+import struct
+import httpx
+from transfer import MultipartStream, StudyTransfer, file_meta_sop_uid, multipart_boundary
+
+def element(tag_element, vr, value):
+    """Élément du groupe 0002 en VR explicite little endian"""
+    if len(value) % 2:
+        value += b'\x00'
+    if vr in (b'OB',):
+        return struct.pack('<HH', 0x0002, tag_element) + vr + b'\x00\x00' + struct.pack('<I', len(value)) + value
+    return struct.pack('<HH', 0x0002, tag_element) + vr + struct.pack('<H', len(value)) + value
+
+def part10(sop_uid, size=5000):
+    """Fichier DICOM Part 10 minimal suivi de `size` octets de données"""
+    meta = (
+        element(0x0001, b'OB', b'\x00\x01')
+        + element(0x0002, b'UI', b'1.2.840.10008.5.1.4.1.1.2')
+        + element(0x0003, b'UI', sop_uid.encode())
+        + element(0x0010, b'UI', b'1.2.840.10008.1.2.1')
+    )
+    return b'\x00' * 128 + b'DICM' + meta + bytes(range(256)) * (size // 256)
+
+def multipart(parts, boundary='b0undary'):
+    """Corps multipart/related"""
+    body = b''
+    for part in parts:
+        body += f'--{boundary}\r\nContent-Type: application/dicom\r\n\r\n'.encode() + part + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode()
+
+async def pieces(data, size):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+def test_file_meta_sop_uid():
+    """Lecture du SOP Instance UID dans les méta-informations"""
+    assert file_meta_sop_uid(part10('1.2.3.4')) == '1.2.3.4'
+    assert file_meta_sop_uid(b'not dicom') is None
+
+def test_multipart_boundary():
+    """Extraction du délimiteur de Content-Type"""
+    assert multipart_boundary('multipart/related; type="application/dicom"; boundary="abc"') == b'abc'
+
+def test_multipart_stream_small_chunks():
+    """Parties reconstituées malgré un délimiteur à cheval sur plusieurs morceaux"""
+    parts = [part10('1.1'), b'short', part10('1.2', 1000)]
+
+    async def run():
+        stream = MultipartStream(pieces(multipart(parts), 7), b'b0undary', chunk_size=64)
+        result = []
+        async for headers, body in stream.parts():
+            chunks = [chunk async for chunk in body]
+            assert max(len(chunk) for chunk in chunks) <= 64
+            result.append((headers['content-type'], b''.join(chunks)))
+        return result
+
+    result = asyncio.run(run())
+    assert [body for _, body in result] == parts
+    assert result[0][0] == 'application/dicom'
+
+def test_study_transfer_resumes_after_failure():
+    """Séries en parallèle ; reprise sans renvoyer les instances déjà importées"""
+    series = {'1.9.1': [part10('1.9.1.1'), part10('1.9.1.2')], '1.9.2': [part10('1.9.2.1')]}
+    imported = []
+    failures = {'1.9.1.2': 1}
+
+    async def handler(request):
+        path = request.url.path
+        if path.endswith('/studies/1.9/series') and request.method == 'GET':
+            return httpx.Response(200, json=[{'0020000E': {'vr': 'UI', 'Value': [uid]}} for uid in series])
+        if '/series/' in path:
+            body = multipart(series[path.rsplit('/', 1)[1]])
+            return httpx.Response(
+                200, content=pieces(body, 1000),
+                headers={'Content-Type': 'multipart/related; type="application/dicom"; boundary=b0undary'}
+            )
+        if path == '/data/services/import':
+            data = await request.aread()
+            sop_uid = file_meta_sop_uid(data)
+            if failures.get(sop_uid):
+                failures[sop_uid] -= 1
+                return httpx.Response(500)
+            assert request.url.params['import-handler'] == 'gradual-DICOM'
+            imported.append((sop_uid, len(data)))
+            return httpx.Response(200, text='/prearchive/projects/PACS/1/session-1')
+        return httpx.Response(404)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            transfer = StudyTransfer(client, 'http://dcm4chee/rs', 'http://xnat', 'PACS',
+                                     chunk_size=512, retries=1, retry_delay=0)
+            return await transfer.run('1.9', subject='p-1', session='s-1')
+
+    result = asyncio.run(run())
+    assert sorted(uid for uid, _ in imported) == ['1.9.1.1', '1.9.1.2', '1.9.2.1']
+    assert all(size == len(part10(uid)) for uid, size in imported)
+    assert result['instances'] == 3
+    assert result['skipped'] == 1
+    assert result['failed_series'] == []
+    assert result['xnat_session'] == '/prearchive/projects/PACS/1/session-1'
+    assert result['bytes'] == sum(size for _, size in imported)
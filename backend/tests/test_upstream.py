@@ -0,0 +1,173 @@
+"""
+Tests pour le client amont résilient
+"""
+import asyncio
+import time
+import httpx
+import pytest
+from upstream import AdaptiveTimeout, CircuitOpenError, RateLimiter, ResilientTransport
+
+def make_client(handler, **kwargs):
+    """Client dont le transport résilient enveloppe un transport simulé"""
+    transport = ResilientTransport({'orthanc': 'http://orthanc'}, httpx.MockTransport(handler), **kwargs)
+    return httpx.AsyncClient(transport=transport, timeout=10.0)
+
+def test_retries_idempotent_reads():
+    """Lecture reprise après 503, écriture jamais rejouée"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503 if len(calls) < 3 else 200)
+
+    async def run():
+        async with make_client(handler, backoff=0) as client:
+            read = await client.get('http://orthanc/studies')
+            calls.clear()
+            write = await client.post('http://orthanc/tools/find', json={})
+            return read, write
+
+    read, write = asyncio.run(run())
+    assert read.status_code == 200
+    assert write.status_code == 503
+    assert calls == ['POST']
+
+def test_retries_exhausted():
+    """Erreur de transport persistante : levée après `retries` nouvelles tentatives"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        raise httpx.ConnectError("refused", request=request)
+
+    async def run():
+        async with make_client(handler, retries=2, backoff=0, failure_threshold=10) as client:
+            await client.get('http://orthanc/system')
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(run())
+    assert len(calls) == 3
+
+def test_circuit_breaker_opens_and_recovers():
+    """Disjoncteur ouvert après les échecs : appels refusés, puis refermé par une sonde réussie"""
+    calls = []
+    healthy = {'value': False}
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200 if healthy['value'] else 500)
+
+    async def run():
+        async with make_client(handler, retries=0, failure_threshold=3, reset_timeout=0.05) as client:
+            for _ in range(3):
+                await client.get('http://orthanc/system')
+            with pytest.raises(CircuitOpenError):
+                await client.get('http://orthanc/system')
+            rejected_calls = len(calls)
+            await asyncio.sleep(0.06)
+            healthy['value'] = True
+            probe = await client.get('http://orthanc/system')
+            return rejected_calls, probe, client._transport.breakers['orthanc'].state
+
+    rejected_calls, probe, state = asyncio.run(run())
+    assert rejected_calls == 3
+    assert probe.status_code == 200
+    assert state == 'closed'
+
+def test_hedged_read_wins():
+    """Réponse lente : la requête de couverture répond la première"""
+    calls = []
+
+    async def handler(request):
+        calls.append(time.perf_counter())
+        if len(calls) == 1:
+            await asyncio.sleep(0.5)
+        return httpx.Response(200, json={'call': len(calls)})
+
+    async def run():
+        async with make_client(handler, hedge_after=0.05) as client:
+            start = time.perf_counter()
+            response = await client.get('http://orthanc/studies')
+            return response, time.perf_counter() - start
+
+    response, elapsed = asyncio.run(run())
+    assert response.json() == {'call': 2}
+    assert elapsed < 0.4
+    assert len(calls) == 2
+
+def test_breaker_records_logical_requests():
+    """Reprises d'une même requête : un seul échec compté par le disjoncteur"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    async def run():
+        async with make_client(handler, retries=3, backoff=0, failure_threshold=2) as client:
+            response = await client.get('http://orthanc/system')
+            return response, client._transport.breakers['orthanc']
+
+    response, breaker = asyncio.run(run())
+    assert response.status_code == 503
+    assert len(calls) == 4
+    assert breaker.failures == 1
+    assert breaker.state == 'closed'
+
+def test_hedge_sends_distinct_request():
+    """Requête de couverture : objet distinct, même méthode, URL et en-têtes"""
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        if len(requests) == 1:
+            await asyncio.sleep(0.3)
+        return httpx.Response(200)
+
+    async def run():
+        async with make_client(handler, hedge_after=0.05) as client:
+            await client.get('http://orthanc/studies', headers={'Accept': 'application/json'})
+
+    asyncio.run(run())
+    assert len(requests) == 2
+    assert requests[0] is not requests[1]
+    assert requests[1].url == requests[0].url
+    assert requests[1].headers['Accept'] == 'application/json'
+
+def test_adaptive_timeout():
+    """Délai dérivé de la latence observée, borné ; délai explicite d'une requête conservé"""
+    timeout = AdaptiveTimeout('test', initial=10.0, min_timeout=0.5, max_timeout=5.0)
+    assert timeout.timeout == 10.0
+    for _ in range(20):
+        timeout.observe(0.1)
+    assert 0.5 <= timeout.timeout < 1.0
+    timeout.observe(30.0)
+    assert timeout.timeout == 5.0
+
+    seen = []
+
+    def handler(request):
+        seen.append(request.extensions['timeout']['read'])
+        return httpx.Response(200)
+
+    async def run():
+        async with make_client(handler, min_timeout=0.5) as client:
+            await client.get('http://orthanc/a')
+            await client.get('http://orthanc/b')
+            await client.get('http://orthanc/c', timeout=120.0)
+
+    asyncio.run(run())
+    assert seen[0] == 10.0
+    assert seen[1] < 10.0
+    assert seen[2] == 120.0
+
+def test_rate_limit():
+    """Débit limité par PACS"""
+    limiter = RateLimiter(rate=20, burst=1)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(limiter.acquire() for _ in range(5)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) >= 0.18
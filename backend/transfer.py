@@ -0,0 +1,255 @@
+"""
+Routage en flux d'une étude de DCM4CHEE vers XNAT
+Les instances sont lues en multipart/related (WADO-RS, une requête par série, séries en
+parallèle) et transmises une à une à l'import XNAT (gradual-DICOM) par morceaux bornés :
+la mémoire utilisée ne dépend pas de la taille de l'étude. Les instances déjà transmises
+sont mémorisées (point de reprise) et ignorées lors d'une nouvelle tentative.
+"""
+import asyncio
+import logging
+import struct
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import httpx
+from metrics import transfer_bytes, transfer_throughput
+
+logger = logging.getLogger(__name__)
+
+DICOM_ACCEPT = 'multipart/related; type="application/dicom"'
+# VR DICOM à longueur sur 4 octets (précédée de 2 octets réservés) en VR explicite
+LONG_LENGTH_VRS = {b'OB', b'OD', b'OF', b'OL', b'OW', b'SQ', b'UC', b'UN', b'UR', b'UT', b'OV', b'SV', b'UV'}
+META_PREFIX_BYTES = 4096
+
+def multipart_boundary(content_type: str) -> bytes:
+    """Délimiteur d'une réponse multipart"""
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.strip().partition('=')
+        if name.lower() == 'boundary':
+            return value.strip('"').encode()
+    raise ValueError(f"No multipart boundary in {content_type!r}")
+
+def file_meta_sop_uid(prefix: bytes) -> Optional[str]:
+    """SOP Instance UID lu dans les méta-informations (groupe 0002) d'un fichier DICOM Part 10"""
+    if len(prefix) < 132 or prefix[128:132] != b'DICM':
+        return None
+    offset = 132
+    while offset + 8 <= len(prefix):
+        group, element = struct.unpack_from('<HH', prefix, offset)
+        if group != 0x0002:
+            return None
+        vr = prefix[offset + 4:offset + 6]
+        if vr in LONG_LENGTH_VRS:
+            if offset + 12 > len(prefix):
+                return None
+            length = struct.unpack_from('<I', prefix, offset + 8)[0]
+            offset += 12
+        else:
+            length = struct.unpack_from('<H', prefix, offset + 6)[0]
+            offset += 8
+        if element == 0x0003:
+            value = prefix[offset:offset + length]
+            return value.decode('ascii', 'ignore').rstrip('\x00 ') if len(value) == length else None
+        offset += length
+    return None
+
+class MultipartStream:
+    """Lecture incrémentale d'un corps multipart/related, partie par partie"""
+
+    def __init__(self, chunks: AsyncIterator[bytes], boundary: bytes, chunk_size: int = 1 << 20):
+        self._chunks = chunks.__aiter__()
+        # CRLF initial : le premier délimiteur se cherche comme les suivants
+        self._buffer = bytearray(b'\r\n')
+        self._delimiter = b'\r\n--' + boundary
+        self.chunk_size = chunk_size
+
+    async def _fill(self) -> bool:
+        """Lire un morceau de plus ; False en fin de flux"""
+        try:
+            self._buffer += await self._chunks.__anext__()
+            return True
+        except StopAsyncIteration:
+            return False
+
+    async def parts(self):
+        """(en-têtes, corps) de chaque partie ; le corps doit être lu avant la partie suivante"""
+        keep = len(self._delimiter) - 1
+        while True:
+            # Avancer jusqu'au prochain délimiteur (reliquat d'un corps non lu compris)
+            while (index := self._buffer.find(self._delimiter)) < 0:
+                del self._buffer[:max(0, len(self._buffer) - keep)]
+                if not await self._fill():
+                    return
+            del self._buffer[:index + len(self._delimiter)]
+            while len(self._buffer) < 2:
+                if not await self._fill():
+                    return
+            if self._buffer[:2] == b'--':
+                return
+            while (end := self._buffer.find(b'\r\n\r\n')) < 0:
+                if not await self._fill():
+                    raise ValueError("Truncated multipart headers")
+            headers = {}
+            for line in bytes(self._buffer[:end]).decode('latin-1').split('\r\n'):
+                name, _, value = line.partition(':')
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            del self._buffer[:end + 4]
+            yield headers, self._body()
+
+    async def _body(self):
+        """Corps de la partie courante, en morceaux d'au plus `chunk_size` octets"""
+        keep = len(self._delimiter) - 1
+        while True:
+            index = self._buffer.find(self._delimiter)
+            available = index if index >= 0 else len(self._buffer) - keep
+            while available > 0:
+                size = min(available, self.chunk_size)
+                chunk = bytes(self._buffer[:size])
+                del self._buffer[:size]
+                available -= size
+                yield chunk
+            if index >= 0:
+                return
+            if not await self._fill():
+                raise ValueError("Truncated multipart body")
+
+class StudyTransfer:
+    """Routage d'une étude DICOMweb vers l'import XNAT"""
+
+    def __init__(self, client: httpx.AsyncClient, dicomweb_root: str, xnat_url: str, project: str,
+                 auth: Optional[Tuple[str, str]] = None, chunk_size: int = 1 << 20,
+                 series_concurrency: int = 4, retries: int = 3, retry_delay: float = 1.0, timeout: float = 120.0):
+        self.client = client
+        self.dicomweb_root = dicomweb_root
+        self.xnat_url = xnat_url
+        self.project = project
+        self.auth = auth
+        self.chunk_size = chunk_size
+        self.series_concurrency = max(1, series_concurrency)
+        self.retries = max(0, retries)
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+    async def run(self, study_uid: str, subject: str, session: str,
+                  checkpoint: Optional[Dict[str, Set[str]]] = None) -> Dict:
+        """Transférer toutes les séries ; `checkpoint` (série -> SOP UID transmis) permet la reprise"""
+        checkpoint = checkpoint if checkpoint is not None else {}
+        series_uids = await self._list_series(study_uid)
+        semaphore = asyncio.Semaphore(self.series_concurrency)
+        start = time.perf_counter()
+
+        async def one(series_uid: str) -> Dict:
+            async with semaphore:
+                return await self._transfer_series(
+                    study_uid, series_uid, subject, session, checkpoint.setdefault(series_uid, set())
+                )
+
+        results = await asyncio.gather(*(one(uid) for uid in series_uids))
+        elapsed = time.perf_counter() - start
+        total = sum(r['bytes'] for r in results)
+        return {
+            'series': len(results),
+            'instances': sum(r['instances'] for r in results),
+            'skipped': sum(r['skipped'] for r in results),
+            'bytes': total,
+            'seconds': round(elapsed, 3),
+            'bytes_per_second': round(total / elapsed, 1) if elapsed > 0 else 0.0,
+            'failed_series': [r['series_uid'] for r in results if r['error']],
+            'xnat_session': next((r['xnat_session'] for r in results if r['xnat_session']), None),
+            'details': results
+        }
+
+    async def _list_series(self, study_uid: str) -> List[str]:
+        """Séries de l'étude (QIDO-RS)"""
+        response = await self.client.get(
+            f"{self.dicomweb_root}/studies/{study_uid}/series",
+            params={'includefield': '0020000E'},
+            headers={'Accept': 'application/dicom+json'}
+        )
+        if response.status_code == 204:
+            return []
+        response.raise_for_status()
+        return [uid for uid in ((s.get('0020000E', {}).get('Value') or [None])[0] for s in response.json()) if uid]
+
+    async def _transfer_series(self, study_uid: str, series_uid: str, subject: str, session: str,
+                               sent: Set[str]) -> Dict:
+        """Transférer une série, avec reprise après les instances déjà transmises"""
+        result = {'series_uid': series_uid, 'instances': 0, 'skipped': 0, 'bytes': 0,
+                  'xnat_session': None, 'error': None}
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                await self._stream_series(study_uid, series_uid, subject, session, sent, result)
+                result['error'] = None
+                break
+            except (httpx.HTTPError, ValueError) as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+                logger.warning(
+                    f"Transfert de la série {series_uid} interrompu (tentative {attempt + 1}): {result['error']}"
+                )
+                if attempt < self.retries:
+                    await asyncio.sleep(min(self.retry_delay * 2 ** attempt, 30))
+        elapsed = time.perf_counter() - start
+        if result['bytes'] and elapsed > 0:
+            transfer_throughput.observe(result['bytes'] / elapsed)
+        return result
+
+    async def _stream_series(self, study_uid: str, series_uid: str, subject: str, session: str,
+                             sent: Set[str], result: Dict):
+        """Une tentative : lire le flux multipart de la série et transmettre chaque instance"""
+        url = f"{self.dicomweb_root}/studies/{study_uid}/series/{series_uid}"
+        async with self.client.stream('GET', url, headers={'Accept': DICOM_ACCEPT}, timeout=self.timeout) as response:
+            response.raise_for_status()
+            stream = MultipartStream(
+                response.aiter_bytes(), multipart_boundary(response.headers.get('content-type', '')),
+                self.chunk_size
+            )
+            async for _, body in stream.parts():
+                # Début de la partie : méta-informations DICOM pour identifier l'instance
+                prefix = b''
+                async for chunk in body:
+                    prefix += chunk
+                    if len(prefix) >= META_PREFIX_BYTES:
+                        break
+                sop_uid = file_meta_sop_uid(prefix)
+                if sop_uid is not None and sop_uid in sent:
+                    result['skipped'] += 1
+                    continue
+                size = await self._upload_instance(prefix, body, subject, session, result)
+                result['instances'] += 1
+                result['bytes'] += size
+                if sop_uid is not None:
+                    sent.add(sop_uid)
+
+    async def _upload_instance(self, prefix: bytes, body, subject: str, session: str, result: Dict) -> int:
+        """Envoyer une instance à l'import XNAT sans la charger entièrement en mémoire"""
+        size = 0
+
+        async def content():
+            nonlocal size
+            size += len(prefix)
+            yield prefix
+            async for chunk in body:
+                size += len(chunk)
+                transfer_bytes.inc(len(chunk))
+                yield chunk
+
+        transfer_bytes.inc(len(prefix))
+        response = await self.client.post(
+            f"{self.xnat_url}/data/services/import",
+            params={
+                'import-handler': 'gradual-DICOM',
+                'inbody': 'true',
+                'PROJECT_ID': self.project,
+                'SUBJECT_ID': subject,
+                'EXPT_LABEL': session
+            },
+            content=content(),
+            headers={'Content-Type': 'application/dicom'},
+            auth=self.auth,
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        # L'import renvoie l'URI de la session XNAT (préarchive)
+        result['xnat_session'] = response.text.strip() or result['xnat_session']
+        return size
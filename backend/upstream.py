@@ -0,0 +1,289 @@
+"""
+Client amont résilient pour les PACS
+Transport httpx qui enveloppe le transport réel : disjoncteur par service, délai de
+lecture adapté à la latence observée, nouvelles tentatives bornées avec backoff
+exponentiel, requêtes de couverture (hedging) optionnelles pour les lectures
+idempotentes et limite de débit par PACS. Le code appelant (client.get, client.stream)
+reste inchangé ; l'état est exporté en métriques Prometheus (voir metrics.py).
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional
+import httpx
+from metrics import (
+    upstream_circuit_state, upstream_hedges, upstream_rejected, upstream_retries,
+    upstream_throttle_wait, upstream_timeout
+)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUSES = {429, 502, 503, 504}
+CIRCUIT_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+class CircuitOpenError(httpx.TransportError):
+    """Requête refusée sans appel : le disjoncteur du service est ouvert"""
+
+class CircuitBreaker:
+    """Disjoncteur : ouvert après `failure_threshold` échecs consécutifs, une sonde après `reset_timeout`"""
+
+    def __init__(self, service: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.service = service
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._set_state('closed')
+
+    def _set_state(self, state: str):
+        self.state = state
+        upstream_circuit_state.labels(service=self.service).set(CIRCUIT_STATES[state])
+
+    def allow(self) -> bool:
+        """Autoriser un appel ; une seule sonde à la fois en demi-ouverture"""
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state('half_open')
+        if self.state == 'half_open':
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == 'closed'
+
+    def cancel(self):
+        """Appel autorisé puis annulé : sans effet sur le compte d'échecs"""
+        self._probing = False
+
+    def record(self, success: bool):
+        """Résultat d'un appel autorisé"""
+        self._probing = False
+        if success:
+            self.failures = 0
+            if self.state != 'closed':
+                logger.info(f"Disjoncteur {self.service} refermé")
+                self._set_state('closed')
+            return
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                logger.warning(f"Disjoncteur {self.service} ouvert après {self.failures} échecs")
+            self.opened_at = time.monotonic()
+            self._set_state('open')
+
+class AdaptiveTimeout:
+    """Délai de lecture dérivé de la latence lissée (estimateur RTO de la RFC 6298)"""
+
+    def __init__(self, service: str, initial: float = 10.0, min_timeout: float = 2.0,
+                 max_timeout: float = 60.0, factor: float = 3.0):
+        self.service = service
+        self.initial = initial
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.factor = factor
+        self.srtt = None
+        self.rttvar = None
+        upstream_timeout.labels(service=service).set(self.timeout)
+
+    def observe(self, seconds: float):
+        if self.srtt is None:
+            self.srtt, self.rttvar = seconds, seconds / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+            self.srtt = 0.875 * self.srtt + 0.125 * seconds
+        upstream_timeout.labels(service=self.service).set(self.timeout)
+
+    @property
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return self.initial
+        return min(self.max_timeout, max(self.min_timeout, self.factor * (self.srtt + 4 * self.rttvar)))
+
+    @property
+    def hedge_delay(self) -> float:
+        """Latence au-delà de laquelle une réponse est anormalement lente (0 sans mesure)"""
+        if self.srtt is None:
+            return 0.0
+        return self.srtt + 2 * self.rttvar
+
+class RateLimiter:
+    """Seau à jetons : `rate` requêtes par seconde, rafales de `burst` requêtes"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Attendre un jeton ; durée d'attente"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, services: Dict[str, str], transport: Optional[httpx.AsyncBaseTransport] = None,
+                 default_timeout: float = 10.0, retries: int = 3, backoff: float = 0.2, max_backoff: float = 5.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, min_timeout: float = 2.0,
+                 max_timeout: float = 60.0, hedge_after: Optional[float] = None,
+                 rate_limits: Optional[Dict[str, float]] = None):
+        self.services = services  # nom du service -> URL de base
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.default_timeout = default_timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.hedge_after = hedge_after  # Délai minimal avant la requête de couverture ; None : désactivé
+        self.rate_limits = {name: rate for name, rate in (rate_limits or {}).items() if rate and rate > 0}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.timeouts: Dict[str, AdaptiveTimeout] = {}
+        self.limiters: Dict[str, RateLimiter] = {}
+
+    def _service(self, request: httpx.Request) -> str:
+        """Service d'une requête (URL de base configurée), à défaut l'hôte"""
+        url = str(request.url)
+        for name, base_url in self.services.items():
+            if base_url and url.startswith(base_url):
+                return name
+        return request.url.netloc.decode()
+
+    def _state(self, service: str):
+        if service not in self.breakers:
+            self.breakers[service] = CircuitBreaker(service, self.failure_threshold, self.reset_timeout)
+            self.timeouts[service] = AdaptiveTimeout(
+                service, self.default_timeout, self.min_timeout, self.max_timeout
+            )
+            if service in self.rate_limits:
+                self.limiters[service] = RateLimiter(self.rate_limits[service])
+        return self.breakers[service], self.timeouts[service], self.limiters.get(service)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        service = self._service(request)
+        breaker, timeout, limiter = self._state(service)
+        if not breaker.allow():
+            upstream_rejected.labels(service=service).inc()
+            raise CircuitOpenError(f"Circuit open for {service}", request=request)
+        # Disjoncteur consulté et alimenté une fois par requête logique, reprises comprises
+        try:
+            response = await self._attempts(request, service, timeout, limiter)
+        except httpx.TransportError:
+            breaker.record(False)
+            raise
+        except BaseException:
+            breaker.cancel()
+            raise
+        breaker.record(response.status_code < 500)
+        return response
+
+    async def _attempts(self, request: httpx.Request, service: str, timeout: AdaptiveTimeout,
+                        limiter: Optional[RateLimiter]) -> httpx.Response:
+        """Envoi avec reprises bornées (lectures idempotentes) ; dernière réponse ou exception"""
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if limiter is not None:
+                upstream_throttle_wait.labels(service=service).observe(await limiter.acquire())
+            self._apply_timeout(request, timeout)
+            try:
+                if idempotent and self.hedge_after is not None:
+                    response = await self._hedged(request, service, timeout)
+                else:
+                    response = await self._send(request, timeout)
+            except httpx.TransportError as e:
+                if isinstance(e, httpx.TimeoutException):
+                    # Délai dépassé : l'estimation remonte comme après une réponse aussi lente
+                    timeout.observe(timeout.timeout)
+                if attempt + 1 >= attempts:
+                    raise
+                upstream_retries.labels(service=service, reason=type(e).__name__).inc()
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt + 1 >= attempts:
+                return response
+            upstream_retries.labels(service=service, reason=str(response.status_code)).inc()
+            delay = self._backoff(attempt, response.headers.get('Retry-After'))
+            await response.aclose()
+            await asyncio.sleep(delay)
+
+    def _apply_timeout(self, request: httpx.Request, timeout: AdaptiveTimeout):
+        """Délai de lecture adaptatif, sauf pour les requêtes à délai explicite (transferts longs)"""
+        timeouts = dict(request.extensions.get('timeout') or {})
+        if timeouts.get('read') == self.default_timeout:
+            timeouts['read'] = timeout.timeout
+            request.extensions['timeout'] = timeouts
+
+    async def _send(self, request: httpx.Request, timeout: AdaptiveTimeout) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        if response.status_code < 500:
+            timeout.observe(time.perf_counter() - start)
+        return response
+
+    async def _hedged(self, request: httpx.Request, service: str, timeout: AdaptiveTimeout) -> httpx.Response:
+        """Lecture couverte : seconde requête si la première tarde, la plus rapide l'emporte"""
+        # Corps lu en mémoire avant l'envoi : la requête de couverture en est une copie indépendante
+        await request.aread()
+        primary = asyncio.ensure_future(self._send(request, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=max(self.hedge_after, timeout.hedge_delay))
+        if done:
+            return primary.result()
+        upstream_hedges.labels(service=service, outcome='sent').inc()
+        # Requête distincte : le flux d'une requête ne se consomme qu'une fois
+        hedge = asyncio.ensure_future(self._send(self._copy(request), timeout))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                for other in pending:
+                    other.cancel()
+                    other.add_done_callback(self._close_response)
+                if task is hedge:
+                    upstream_hedges.labels(service=service, outcome='won').inc()
+                return task.result()
+        raise error
+
+    @staticmethod
+    def _copy(request: httpx.Request) -> httpx.Request:
+        """Nouvelle requête identique (corps déjà lu, extensions copiées)"""
+        return httpx.Request(
+            request.method, request.url, headers=request.headers, content=request.content,
+            extensions=dict(request.extensions)
+        )
+
+    @staticmethod
+    def _close_response(task: asyncio.Task):
+        """Réponse perdante arrivée malgré l'annulation : libérer sa connexion"""
+        if not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(task.result().aclose())
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Backoff exponentiel plafonné avec gigue ; Retry-After respecté dans la limite du plafond"""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def aclose(self):
+        await self.transport.aclose()
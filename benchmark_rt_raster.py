@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Mesure de la rastérisation RT-STRUCT : moteur NumPy (shared/rt_raster.py) contre
+l'ancien remplissage PIL d'extract_rt_robust.py et, s'il est installé, rt_utils.
+
+Usage:
+    python benchmark_rt_raster.py                    # Série synthétique 512x512x200, 40 ROIs
+    python benchmark_rt_raster.py dossier_dicom      # CT + RT-STRUCT réels d'un dossier
+"""
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.errors import InvalidDicomError
+from pydicom.sequence import Sequence
+
+from shared.rt_raster import CtGeometry, rasterize_rois, roi_contours
+
+def legacy_pil_masks(rtstruct, ct_slices, names):
+    """Ancien chemin d'extract_rt_robust.py : coupe par z, troncature int(), orientation ignorée"""
+    from PIL import Image, ImageDraw
+    rows, cols = ct_slices[0].Rows, ct_slices[0].Columns
+    z_positions = np.array([float(ds.ImagePositionPatient[2]) for ds in ct_slices])
+    masks = {}
+    for name, polygons in roi_contours(rtstruct, names).items():
+        mask = np.zeros((rows, cols, len(ct_slices)), dtype=np.uint8)
+        for points in polygons:
+            slice_idx = int(np.argmin(np.abs(z_positions - points[0, 2])))
+            ds = ct_slices[slice_idx]
+            origin = np.array(ds.ImagePositionPatient, dtype=float)
+            spacing = [float(ds.PixelSpacing[0]), float(ds.PixelSpacing[1])]
+            pixels = [(int((p[0] - origin[0]) / spacing[0]), int((p[1] - origin[1]) / spacing[1])) for p in points]
+            img = Image.new('L', (cols, rows), 0)
+            ImageDraw.Draw(img).polygon(pixels, outline=1, fill=1)
+            mask[:, :, slice_idx] = np.maximum(mask[:, :, slice_idx], np.array(img))
+        masks[name] = mask
+    return masks
+
+def synthetic_series(rows=512, cols=512, slices=200, rois=40, points=120):
+    """En-têtes CT et RT-STRUCT synthétiques : anneaux (contour + trou) sur chaque coupe"""
+    ct_slices = []
+    for k in range(slices):
+        ds = Dataset()
+        ds.Rows, ds.Columns = rows, cols
+        ds.PixelSpacing = [0.9765625, 0.9765625]
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.ImagePositionPatient = [-250.0, -250.0, -300.0 + 2.5 * k]
+        ds.SOPInstanceUID = f'1.2.826.0.1.3680043.8.498.{k + 1}'
+        ct_slices.append(ds)
+
+    rtstruct = Dataset()
+    rtstruct.StructureSetROISequence = Sequence()
+    rtstruct.ROIContourSequence = Sequence()
+    angles = np.linspace(0, 2 * np.pi, points, endpoint=False)
+    rng = np.random.default_rng(0)
+    for number in range(1, rois + 1):
+        roi = Dataset()
+        roi.ROINumber, roi.ROIName = number, f'ROI_{number:02d}'
+        rtstruct.StructureSetROISequence.append(roi)
+        contour_roi = Dataset()
+        contour_roi.ReferencedROINumber = number
+        contour_roi.ContourSequence = Sequence()
+        cx, cy = rng.uniform(-150, 150, 2)
+        radius = rng.uniform(10, 60)
+        first = int(rng.integers(0, slices // 2))
+        for k in range(first, first + slices // 2):
+            z = -300.0 + 2.5 * k
+            for r in (radius, radius / 2):  # Contour extérieur puis trou
+                contour = Dataset()
+                contour.ContourGeometricType = 'CLOSED_PLANAR'
+                contour.ContourData = np.stack(
+                    [cx + r * np.cos(angles), cy + r * np.sin(angles), np.full(points, z)], axis=1
+                ).ravel().tolist()
+                contour_roi.ContourSequence.append(contour)
+        rtstruct.ROIContourSequence.append(contour_roi)
+    return ct_slices, rtstruct
+
+def load_folder(folder):
+    ct_slices, rtstruct = [], None
+    for file in sorted(f for f in Path(folder).rglob('*') if f.is_file()):
+        try:
+            ds = pydicom.dcmread(str(file), stop_before_pixels=True)
+        except InvalidDicomError:
+            continue
+        modality = getattr(ds, 'Modality', None)
+        if modality == 'CT':
+            ct_slices.append(ds)
+        elif modality == 'RTSTRUCT':
+            rtstruct = ds
+    ct_slices.sort(key=lambda ds: float(ds.ImagePositionPatient[2]))
+    return ct_slices, rtstruct
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print(f'{label:<12} {time.perf_counter() - start:8.2f}s')
+    return result
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    ct_slices, rtstruct = load_folder(folder) if folder else synthetic_series()
+    names = [str(roi.ROIName) for roi in rtstruct.StructureSetROISequence]
+    print(f'{len(ct_slices)} coupes {ct_slices[0].Rows}x{ct_slices[0].Columns}, {len(names)} ROIs')
+
+    masks = timed('numpy', lambda: rasterize_rois(rtstruct, CtGeometry.from_datasets(ct_slices)))
+    legacy = timed('pil', lambda: legacy_pil_masks(rtstruct, ct_slices, names))
+
+    if folder:
+        try:
+            from rt_utils import RTStructBuilder
+        except ImportError:
+            print('rt_utils        non installé')
+        else:
+            rtstruct_path = rtstruct.filename
+            builder = RTStructBuilder.create_from(dicom_series_path=folder, rt_struct_path=rtstruct_path)
+            timed('rt_utils', lambda: {name: builder.get_roi_mask_by_name(name) for name in names})
+
+    # Accord entre chemins (Dice moyen) ; sur les anneaux synthétiques, le trou n'est pas vidé par PIL
+    dice = []
+    for name in names:
+        a, b = masks[name], legacy.get(name, np.zeros_like(masks[name])).astype(bool)
+        total = a.sum() + b.sum()
+        if total:
+            dice.append(2 * np.logical_and(a, b).sum() / total)
+    print(f'Dice numpy/pil moyen : {np.mean(dice):.3f}')
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,7 @@ import requests
 import io
 import logging
 from datetime import datetime
+from dicom_cache import DicomCache
 
 app = Flask(__name__)
 CORS(app)
@@ -26,6 +27,18 @@ logger = logging.getLogger(__name__)
 
 ORTHANC_URL = "http://orthanc-admin:8042"
 
+dicom_cache = DicomCache.from_env(ORTHANC_URL)
+
+# Catch up on Orthanc /changes, then keep following it, before serving the first request
+dicom_cache.start()
+
+def fetch_instance(instance_id):
+    """DICOM file of an instance (shared disk cache); None if Orthanc does not know it"""
+    try:
+        return dicom_cache.get(instance_id)
+    except requests.HTTPError:
+        return None
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy", "features": [
@@ -34,7 +47,7 @@ def health():
         "Pixel manipulation",
         "Voxel extraction",
         "Slice masking"
-    ]})
+    ], "dicom_cache": dicom_cache.stats()})
 
 @app.route('/api/studies/<study_id>/create-rtstruct', methods=['POST'])
 def create_rtstruct(study_id):
@@ -90,13 +103,12 @@ def segment_instance(instance_id):
         threshold = data.get('threshold', 128)
         
         # Fetch instance from Orthanc
-        instance_url = f"{ORTHANC_URL}/instances/{instance_id}/file"
-        response = requests.get(instance_url)
-        if response.status_code != 200:
+        content = fetch_instance(instance_id)
+        if content is None:
             return jsonify({"error": "Instance not found"}), 404
         
         # Load DICOM
-        dicom_data = pydicom.dcmread(io.BytesIO(response.content))
+        dicom_data = pydicom.dcmread(io.BytesIO(content))
         
         # Extract pixels
         pixels = dicom_data.pixel_array
@@ -128,13 +140,12 @@ def extract_voxels(instance_id):
         roi = data.get('roi', None)  # Region of interest [x, y, z, width, height, depth]
         
         # Fetch instance from Orthanc
-        instance_url = f"{ORTHANC_URL}/instances/{instance_id}/file"
-        response = requests.get(instance_url)
-        if response.status_code != 200:
+        content = fetch_instance(instance_id)
+        if content is None:
             return jsonify({"error": "Instance not found"}), 404
         
         # Load DICOM
-        dicom_data = pydicom.dcmread(io.BytesIO(response.content))
+        dicom_data = pydicom.dcmread(io.BytesIO(content))
         pixels = dicom_data.pixel_array
         
         # Extract ROI if specified
@@ -174,12 +185,11 @@ def create_slice_mask(instance_id):
         params = data.get('params', {})
         
         # Fetch instance
-        instance_url = f"{ORTHANC_URL}/instances/{instance_id}/file"
-        response = requests.get(instance_url)
-        if response.status_code != 200:
+        content = fetch_instance(instance_id)
+        if content is None:
             return jsonify({"error": "Instance not found"}), 404
         
-        dicom_data = pydicom.dcmread(io.BytesIO(response.content))
+        dicom_data = pydicom.dcmread(io.BytesIO(content))
         pixels = dicom_data.pixel_array
         
         # Create mask based on type
@@ -3,11 +3,14 @@
 Extraction RT-STRUCT robuste avec pydicom pur
 """
 import os
+import sys
 import numpy as np
 import pydicom
 from pathlib import Path
 import zipfile
 
+from shared.rt_raster import CtGeometry, iter_roi_masks, roi_names
+
 def extract_rt_robust(dicom_folder, output_dir="extracted_rois_robust"):
     print(f"\n=== Extraction Robuste RT-STRUCT ===")
     print(f"Dossier: {dicom_folder}\n")
@@ -36,8 +39,10 @@ def extract_rt_robust(dicom_folder, output_dir="extracted_rois_robust"):
         print(f"❌ Insuffisant CTs ({len(ct_slices)})")
         return False
     
-    # 2. Trier CTs par position Z
-    ct_slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))
+    # 2. Trier CTs le long de la normale aux coupes (même ordre que les masques)
+    orientation = np.array(ct_slices[0].ImageOrientationPatient, dtype=float)
+    normal = np.cross(orientation[:3], orientation[3:])
+    ct_slices.sort(key=lambda x: float(np.dot(np.array(x.ImagePositionPatient, dtype=float), normal)))
     
     # 3. Créer volume CT
     print("\n=== Construction volume CT ===")
@@ -55,66 +60,24 @@ def extract_rt_robust(dicom_folder, output_dir="extracted_rois_robust"):
     print("\n=== Extraction ROIs ===")
     os.makedirs(output_dir, exist_ok=True)
     
+    geometry = CtGeometry.from_datasets(ct_slices)
+    names = roi_names(rtstruct_ds)
+    contour_counts = {
+        names.get(int(roi_contour.ReferencedROINumber)): len(getattr(roi_contour, 'ContourSequence', []))
+        for roi_contour in rtstruct_ds.ROIContourSequence
+    }
+    
     roi_count = 0
-    for roi_contour in rtstruct_ds.ROIContourSequence:
+    # Masques de toutes les ROIs : affine patient -> voxel complète, trous et contours multiples
+    for roi_name, mask in iter_roi_masks(rtstruct_ds, geometry):
         try:
-            # Trouver nom ROI
-            roi_number = roi_contour.ReferencedROINumber
-            roi_name = "Unknown"
-            for struct_roi in rtstruct_ds.StructureSetROISequence:
-                if struct_roi.ROINumber == roi_number:
-                    roi_name = struct_roi.ROIName
-                    break
-            
             print(f"\nROI: {roi_name}")
             
-            # Créer masque 3D
-            mask = np.zeros((rows, cols, num_slices), dtype=np.uint8)
-            
-            if not hasattr(roi_contour, 'ContourSequence'):
+            contour_count = contour_counts.get(roi_name, 0)
+            if not contour_count:
                 print(f"  Pas de contours")
                 continue
             
-            contour_count = 0
-            for contour in roi_contour.ContourSequence:
-                # Obtenir points contour
-                points = np.array(contour.ContourData).reshape(-1, 3)
-                
-                # Trouver slice correspondante
-                z_pos = points[0, 2]
-                slice_idx = np.argmin([abs(float(ds.ImagePositionPatient[2]) - z_pos) for ds in ct_slices])
-                
-                if slice_idx < num_slices:
-                    # Convertir points 3D en pixels 2D
-                    ds = ct_slices[slice_idx]
-                    origin = np.array(ds.ImagePositionPatient) if hasattr(ds, 'ImagePositionPatient') else np.array([0, 0, 0])
-                    
-                    # Essayer plusieurs attributs pour spacing
-                    if hasattr(ds, 'PixelSpacing'):
-                        spacing = np.array([float(ds.PixelSpacing[0]), float(ds.PixelSpacing[1]), 1.0])
-                    elif hasattr(ds, 'ImagerPixelSpacing'):
-                        spacing = np.array([float(ds.ImagerPixelSpacing[0]), float(ds.ImagerPixelSpacing[1]), 1.0])
-                    else:
-                        # Valeur par défaut: 1mm x 1mm
-                        spacing = np.array([1.0, 1.0, 1.0])
-                    
-                    pixels = []
-                    for point in points:
-                        # Conversion monde → pixel
-                        rel = point - origin
-                        px = int(rel[0] / spacing[0])
-                        py = int(rel[1] / spacing[1])
-                        pixels.append([py, px])  # Attention: row, col
-                    
-                    # Remplir polygone
-                    pixels = np.array(pixels)
-                    from PIL import Image, ImageDraw
-                    img = Image.new('L', (cols, rows), 0)
-                    draw = ImageDraw.Draw(img)
-                    draw.polygon([tuple(p[::-1]) for p in pixels], outline=1, fill=1)
-                    mask[:, :, slice_idx] = np.maximum(mask[:, :, slice_idx], np.array(img))
-                    contour_count += 1
-            
             print(f"  {contour_count} contours, {np.sum(mask)} voxels actifs")
             
             # Sauver masque
@@ -1,6 +1,26 @@
 -- Orthanc Lua Script for Auto-Forwarding to DCM4CHEE
 -- This script automatically sends received DICOM instances to DCM4CHEE
 
+-- Notify the PACS backend so it syncs the study right away
+local BACKEND_URL = os.getenv("PACS_BACKEND_URL") or "http://host.docker.internal:8000"
+local WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN")
+
+function NotifyBackend(studyId, changeType)
+  local headers = { ["Content-Type"] = "application/json" }
+  if WEBHOOK_TOKEN then
+    headers["X-Webhook-Token"] = WEBHOOK_TOKEN
+  end
+  local payload = { events = { { ID = studyId, Type = changeType } } }
+
+  local success, response = pcall(function()
+    return HttpPost(BACKEND_URL .. "/api/webhooks/orthanc/studies", DumpJson(payload, true), headers)
+  end)
+
+  if not success then
+    print("ERROR: Failed to notify backend: " .. tostring(response))
+  end
+end
+
 function OnStoredInstance(instanceId, tags, metadata, origin)
   -- Extract study information
   local studyInstanceUid = tags["StudyInstanceUID"]
@@ -22,4 +42,8 @@ function OnStoredInstance(instanceId, tags, metadata, origin)
   end
 end
 
+function OnStableStudy(studyId, tags, metadata)
+  NotifyBackend(studyId, "StableStudy")
+end
+
 print("Orthanc Lua script loaded - Auto-forwarding to DCM4CHEE enabled")
@@ -2,6 +2,26 @@
 -- Script Lua pour Orthanc Admin
 -- Détecte les RT-STRUCT et déclenche le workflow automatique
 
+-- Notification du backend PACS (synchronisation ciblée de l'étude)
+local BACKEND_URL = os.getenv("PACS_BACKEND_URL") or "http://host.docker.internal:8000"
+local WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN")
+
+function NotifyBackend(studyId, changeType)
+   local headers = { ["Content-Type"] = "application/json" }
+   if WEBHOOK_TOKEN then
+      headers["X-Webhook-Token"] = WEBHOOK_TOKEN
+   end
+   local payload = { events = { { ID = studyId, Type = changeType } } }
+
+   local success, response = pcall(function()
+      return HttpPost(BACKEND_URL .. "/api/webhooks/orthanc/studies", DumpJson(payload, true), headers)
+   end)
+
+   if not success then
+      print("❌ Erreur notification backend: " .. tostring(response))
+   end
+end
+
 function OnStoredInstance(instanceId, tags, metadata, origin)
    -- Obtenir la modalité
    local modality = tags["Modality"]
@@ -19,6 +39,7 @@ end
 
 function OnStableStudy(studyId, tags, metadata)
    print("Étude stable: " .. studyId)
+   NotifyBackend(studyId, "StableStudy")
    
    -- Récupérer toutes les séries de l'étude
    local study = ParseJson(RestApiGet("/studies/" .. studyId))
@@ -26,6 +26,8 @@ import logging
 import os
 from datetime import datetime
 import json
+from io import BytesIO
+from dicom_cache import DicomCache
 
 app = Flask(__name__)
 CORS(app)
@@ -37,6 +39,12 @@ logger = logging.getLogger(__name__)
 # Configuration Orthanc
 ORTHANC_URL = os.getenv('ORTHANC_URL', 'http://orthanc-admin:8042')
 
+# Cache disque des instances partagé avec les autres services
+dicom_cache = DicomCache.from_env(ORTHANC_URL)
+
+# Rattrapage puis suivi de /changes dès l'initialisation du worker, avant la première requête
+dicom_cache.start()
+
 # Configuration PyRadiomics
 RADIOMICS_PARAMS = {
     'binWidth': 25,
@@ -55,7 +63,8 @@ def health():
         'service': 'Professional Radiomics Engine',
         'version': '2.0.0',
         'features_available': 1814,
-        'pyradiomics_version': '3.1.0'
+        'pyradiomics_version': '3.1.0',
+        'dicom_cache': dicom_cache.stats()
     })
 
 @app.route('/api/radiomics/extract', methods=['POST'])
@@ -335,8 +344,7 @@ def load_image_from_orthanc(series_id):
         # Download all instances
         dicom_files = []
         for instance_id in instances:
-            response = requests.get(f"{ORTHANC_URL}/instances/{instance_id}/file")
-            dicom_data = pydicom.dcmread(requests.get(f"{ORTHANC_URL}/instances/{instance_id}/file", stream=True).raw)
+            dicom_data = pydicom.dcmread(BytesIO(dicom_cache.get(instance_id)))
             dicom_files.append(dicom_data)
         
         # Sort by instance number
@@ -2,22 +2,246 @@
 Service d'extraction RT-STRUCT → Masques par slice
 Récupère les RT-STRUCT depuis Orthanc et extrait chaque ROI individuellement
 """
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import pydicom
+from pydicom.errors import InvalidDicomError
 import numpy as np
-from rt_utils import RTStructBuilder
 import requests
 import tempfile
 import os
+import shutil
 import zipfile
 from io import BytesIO
 import json
+import gzip
+import atexit
+import itertools
+import multiprocessing
+import threading
+import pickle
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from requests.adapters import HTTPAdapter
+from dicom_cache import DicomCache
+from rt_raster import CtGeometry, iter_masks, rasterize_rois, roi_contours, roi_names
 
 app = Flask(__name__)
 CORS(app)
 
 ORTHANC_URL = os.environ.get('ORTHANC_URL', 'http://orthanc-admin:8042')
+DOWNLOAD_WORKERS = int(os.environ.get('ORTHANC_DOWNLOAD_WORKERS', '8'))
+DOWNLOAD_TIMEOUT = float(os.environ.get('ORTHANC_DOWNLOAD_TIMEOUT', '60'))
+ROI_WORKERS = int(os.environ.get('ROI_WORKERS', str(os.cpu_count() or 1)))
+
+# Attributs d'en-tête nécessaires au classement et à la géométrie des coupes
+GEOMETRY_TAGS = [
+    'InstanceNumber', 'SOPInstanceUID', 'Rows', 'Columns', 'PixelSpacing',
+    'ImagePositionPatient', 'ImageOrientationPatient'
+]
+
+# Session partagée : connexions keep-alive réutilisées par tous les téléchargements
+orthanc = requests.Session()
+orthanc.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=DOWNLOAD_WORKERS))
+orthanc.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=DOWNLOAD_WORKERS))
+dicom_cache = DicomCache.from_env(ORTHANC_URL, session=orthanc)
+
+# Rattrapage puis suivi de /changes dès l'initialisation du worker, avant la première requête ;
+# pas dans les processus du pool ROI, qui importent aussi ce module
+if multiprocessing.parent_process() is None:
+    dicom_cache.start()
+
+def _download_instance(instance_id):
+    """Fichier DICOM d'une instance Orthanc (cache disque partagé)"""
+    return dicom_cache.get(instance_id)
+
+def _save_ct_slice(instance_id, ct_dir):
+    """Télécharger une coupe ; en-tête (InstanceNumber, géométrie) lu dans le fichier reçu"""
+    content = _download_instance(instance_id)
+    header = pydicom.dcmread(BytesIO(content), stop_before_pixels=True, specific_tags=GEOMETRY_TAGS)
+    instance_number = int(getattr(header, 'InstanceNumber', None) or 0)
+    path = os.path.join(ct_dir, f'CT_{instance_number:05d}_{instance_id}.dcm')
+    with open(path, 'wb') as f:
+        f.write(content)
+    return header
+
+def _download_ct_series(ct_series_id, ct_dir):
+    """Télécharger toutes les coupes d'une série en parallèle (DOWNLOAD_WORKERS requêtes au plus) ; en-têtes"""
+    response = orthanc.get(f'{ORTHANC_URL}/series/{ct_series_id}', timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    instances = response.json()['Instances']
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        return list(executor.map(lambda instance_id: _save_ct_slice(instance_id, ct_dir), instances))
+
+# Pool ROI partagé par les requêtes du processus : créé au premier usage, en forkserver
+# (pas de fork d'un processus Flask multi-threadé), arrêté à la sortie
+_roi_pool = None
+_roi_pool_lock = threading.Lock()
+
+def _get_roi_pool():
+    global _roi_pool
+    with _roi_pool_lock:
+        if _roi_pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _roi_pool = ProcessPoolExecutor(max_workers=ROI_WORKERS, mp_context=multiprocessing.get_context(method))
+            atexit.register(_roi_pool.shutdown, wait=False, cancel_futures=True)
+        return _roi_pool
+
+def _reset_roi_pool(pool):
+    """Oublier un pool cassé (processus tué) : le suivant est recréé à la prochaine requête"""
+    global _roi_pool
+    with _roi_pool_lock:
+        if _roi_pool is pool:
+            _roi_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _encode_mask(mask, output_format, affine, axes):
+    """Masque encodé en .npy ou en NIfTI compressé (.nii.gz), axes réordonnés selon `axes`"""
+    if output_format == 'numpy':
+        buffer = BytesIO()
+        np.save(buffer, mask)
+        return buffer.getvalue()
+    import nibabel as nib
+    nifti_img = nib.Nifti1Image(mask.transpose(axes).astype(np.uint8), affine)
+    return gzip.compress(nifti_img.to_bytes(), compresslevel=6)
+
+# Contexte des ROIs d'une requête (géométrie CT, format, affine, axes) : écrit une fois dans un
+# fichier temporaire par la requête, lu une fois par processus du pool puis gardé par clé
+_roi_contexts = OrderedDict()
+ROI_CONTEXT_CACHE = 4
+
+def _roi_context(key, path):
+    """Contexte (géométrie, format, affine, axes) d'une requête, chargé une fois par processus"""
+    context = _roi_contexts.pop(key, None)
+    if context is None:
+        with open(path, 'rb') as f:
+            context = pickle.load(f)
+    _roi_contexts[key] = context
+    while len(_roi_contexts) > ROI_CONTEXT_CACHE:
+        _roi_contexts.popitem(last=False)
+    return context
+
+def _encode_roi(roi_name, contours, context_key, context_path):
+    """Rastériser et encoder une ROI dans un processus du pool"""
+    geometry, output_format, affine, axes = _roi_context(context_key, context_path)
+    _, mask = next(iter_masks({roi_name: contours}, geometry))
+    return roi_name, _encode_mask(mask, output_format, affine, axes)
+
+def _roi_payloads(ds, geometry, output_format='nifti', affine=None, axes=(0, 1, 2)):
+    """(nom, fichier encodé) de chaque ROI du RT-STRUCT, dans l'ordre de fin de traitement
+
+    Rastérisation et encodage répartis sur le pool ROI, ROI_WORKERS tâches en cours au
+    plus : une ROI n'est soumise qu'une fois une précédente rendue. Seuls les contours
+    partent avec chaque tâche ; la géométrie est lue une fois par processus. Une ROI en
+    échec est journalisée puis ignorée.
+    """
+    affine = np.eye(4) if affine is None else affine
+    contours = roi_contours(ds)
+    tasks = [(roi_name, contours.get(roi_name, [])) for roi_name in roi_names(ds).values()]
+    if ROI_WORKERS <= 1 or len(tasks) <= 1:
+        for roi_name, mask in iter_masks(dict(tasks), geometry):
+            yield roi_name, _encode_mask(mask, output_format, affine, axes)
+        return
+    
+    pool = _get_roi_pool()
+    context_fd, context_path = tempfile.mkstemp(prefix='roi-context-', suffix='.pkl')
+    with os.fdopen(context_fd, 'wb') as f:
+        pickle.dump((geometry, output_format, affine, axes), f, protocol=pickle.HIGHEST_PROTOCOL)
+    context_key = os.path.basename(context_path)
+    pending = iter(tasks)
+    running = {}
+    
+    def submit(count):
+        for roi_name, polygons in itertools.islice(pending, count):
+            running[pool.submit(_encode_roi, roi_name, polygons, context_key, context_path)] = roi_name
+    
+    try:
+        submit(ROI_WORKERS)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            submit(len(done))
+            for future in done:
+                roi_name = running.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    _reset_roi_pool(pool)
+                    raise
+                except Exception:
+                    app.logger.exception(f"Erreur pour ROI {roi_name}")
+                    continue
+                yield result
+                del result
+    finally:
+        # Client parti ou erreur : ne pas calculer les ROIs restantes de cette requête
+        for future in running:
+            future.cancel()
+        os.unlink(context_path)
+
+class _ZipSink:
+    """Sortie non positionnable d'un ZipFile, vidée après chaque entrée"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _stream_zip(entries, download_name):
+    """Archive ZIP produite au fil des entrées (nom, contenu), par morceaux HTTP
+
+    Contenus déjà compressés (.gz, .png) stockés tels quels, autres en DEFLATE. Chaque
+    entrée est envoyée puis libérée ; seuls les producteurs gardent d'autres entrées
+    en mémoire (_roi_payloads : ROI_WORKERS ROIs en cours au plus).
+    """
+    sink = _ZipSink()
+    zip_file = zipfile.ZipFile(sink, 'w')
+    try:
+        for name, payload in entries:
+            compress_type = zipfile.ZIP_STORED if name.endswith(('.gz', '.png')) else zipfile.ZIP_DEFLATED
+            zip_file.writestr(name, payload, compress_type=compress_type)
+            del payload
+            yield sink.drain()
+    except Exception:
+        # Pas de répertoire central : archive illisible, jamais un ZIP valide incomplet
+        app.logger.exception(f"Archive {download_name} interrompue")
+        raise
+    zip_file.close()
+    yield sink.drain()
+
+def _zip_response(entries, download_name):
+    """Réponse HTTP chunked d'une archive ZIP produite pendant l'envoi
+
+    La première entrée est calculée avant les en-têtes : une erreur à ce stade remonte
+    à la route (500). Une erreur ensuite interrompt le flux sans fin de transfert
+    chunked, ce que le client détecte.
+    """
+    chunks = _stream_zip(entries, download_name)
+    head = next(chunks)
+    
+    def body():
+        try:
+            yield head
+            yield from chunks
+        finally:
+            # Client parti : arrêter les producteurs (tâches ROI en attente annulées)
+            chunks.close()
+    
+    return Response(
+        body(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -31,7 +255,8 @@ def health():
             'Export as DICOM-SEG',
             'Export as NIfTI per ROI',
             'List all ROIs with statistics'
-        ]
+        ],
+        'dicom_cache': dicom_cache.stats()
     })
 
 @app.route('/api/rt-struct/list-rois', methods=['POST'])
@@ -51,12 +276,11 @@ def list_rois():
     
     try:
         # Télécharger RT-STRUCT depuis Orthanc
-        response = requests.get(f'{ORTHANC_URL}/instances/{rtstruct_id}/file')
-        response.raise_for_status()
+        content = _download_instance(rtstruct_id)
         
         # Sauvegarder temporairement
         with tempfile.NamedTemporaryFile(delete=False, suffix='.dcm') as tmp:
-            tmp.write(response.content)
+            tmp.write(content)
             tmp_path = tmp.name
         
         # Parser avec pydicom
@@ -133,36 +357,22 @@ def extract_roi_slices():
     if not roi_name and not roi_number:
         return jsonify({'error': 'roi_name or roi_number required'}), 400
     
+    ct_dir = tempfile.mkdtemp()
     try:
         # Télécharger CT series depuis Orthanc
-        ct_dir = tempfile.mkdtemp()
-        series_info = requests.get(f'{ORTHANC_URL}/series/{ct_series_id}').json()
-        
-        for instance_id in series_info['Instances']:
-            response = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/file')
-            instance_number = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/simplified-tags').json().get('InstanceNumber', '0')
-            
-            with open(os.path.join(ct_dir, f'CT_{instance_number}.dcm'), 'wb') as f:
-                f.write(response.content)
+        geometry = CtGeometry.from_datasets(_download_ct_series(ct_series_id, ct_dir))
         
         # Télécharger RT-STRUCT
-        rtstruct_response = requests.get(f'{ORTHANC_URL}/instances/{rtstruct_id}/file')
         rtstruct_path = os.path.join(ct_dir, 'rtstruct.dcm')
         with open(rtstruct_path, 'wb') as f:
-            f.write(rtstruct_response.content)
-        
-        # Charger avec rt-utils
-        rtstruct = RTStructBuilder.create_from(
-            dicom_series_path=ct_dir,
-            rt_struct_path=rtstruct_path
-        )
+            f.write(_download_instance(rtstruct_id))
+        ds = pydicom.dcmread(rtstruct_path)
         
         # Extraire le masque 3D de la ROI
         if roi_name:
-            mask_3d = rtstruct.get_roi_mask_by_name(roi_name)
+            mask_3d = rasterize_rois(ds, geometry, [roi_name])[roi_name]
         else:
             # Trouver le nom par numéro
-            ds = pydicom.dcmread(rtstruct_path)
             roi_name = None
             for roi_seq in ds.StructureSetROISequence:
                 if roi_seq.ROINumber == roi_number:
@@ -172,22 +382,20 @@ def extract_roi_slices():
             if not roi_name:
                 return jsonify({'error': f'ROI number {roi_number} not found'}), 404
             
-            mask_3d = rtstruct.get_roi_mask_by_name(roi_name)
-        
-        # Créer ZIP avec les slices
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            
-            # Métadonnées
-            metadata = {
-                'roi_name': roi_name,
-                'roi_number': roi_number,
-                'num_slices': mask_3d.shape[2],
-                'shape': list(mask_3d.shape),
-                'voxel_count': int(np.sum(mask_3d)),
-                'volume_voxels': int(np.sum(mask_3d))
-            }
-            zip_file.writestr('metadata.json', json.dumps(metadata, indent=2))
+            mask_3d = rasterize_rois(ds, geometry, [roi_name])[roi_name]
+        
+        # Métadonnées
+        metadata = {
+            'roi_name': roi_name,
+            'roi_number': roi_number,
+            'num_slices': mask_3d.shape[2],
+            'shape': list(mask_3d.shape),
+            'voxel_count': int(np.sum(mask_3d)),
+            'volume_voxels': int(np.sum(mask_3d))
+        }
+        
+        def entries():
+            yield 'metadata.json', json.dumps(metadata, indent=2)
             
             # Exporter chaque slice
             for slice_idx in range(mask_3d.shape[2]):
@@ -199,7 +407,7 @@ def extract_roi_slices():
                         # Sauvegarder comme numpy array
                         slice_buffer = BytesIO()
                         np.save(slice_buffer, slice_mask)
-                        zip_file.writestr(f'slice_{slice_idx:03d}.npy', slice_buffer.getvalue())
+                        yield f'slice_{slice_idx:03d}.npy', slice_buffer.getvalue()
                     
                     elif output_format == 'png':
                         # Sauvegarder comme image PNG
@@ -207,28 +415,20 @@ def extract_roi_slices():
                         img = Image.fromarray((slice_mask * 255).astype(np.uint8))
                         img_buffer = BytesIO()
                         img.save(img_buffer, format='PNG')
-                        zip_file.writestr(f'slice_{slice_idx:03d}.png', img_buffer.getvalue())
+                        yield f'slice_{slice_idx:03d}.png', img_buffer.getvalue()
                     
                     elif output_format == 'dicom':
                         # Créer DICOM-SEG slice
                         # TODO: Implémenter export DICOM-SEG
                         pass
         
-        zip_buffer.seek(0)
-        
-        # Nettoyer
-        import shutil
-        shutil.rmtree(ct_dir)
-        
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'{roi_name}_slices.zip'
-        )
+        return _zip_response(entries(), f'{roi_name}_slices.zip')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        shutil.rmtree(ct_dir, ignore_errors=True)
 
 @app.route('/api/rt-struct/extract-all-rois', methods=['POST'])
 def extract_all_rois():
@@ -248,74 +448,33 @@ def extract_all_rois():
     ct_series_id = data.get('ct_series_id')
     output_format = data.get('output_format', 'nifti')
     
+    if output_format not in ('nifti', 'numpy'):
+        return jsonify({'error': 'output_format must be nifti or numpy'}), 400
+    
+    ct_dir = tempfile.mkdtemp()
     try:
         # Télécharger CT series
-        ct_dir = tempfile.mkdtemp()
-        series_info = requests.get(f'{ORTHANC_URL}/series/{ct_series_id}').json()
-        
-        for instance_id in series_info['Instances']:
-            response = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/file')
-            instance_number = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/simplified-tags').json().get('InstanceNumber', '0')
-            
-            with open(os.path.join(ct_dir, f'CT_{instance_number}.dcm'), 'wb') as f:
-                f.write(response.content)
+        geometry = CtGeometry.from_datasets(_download_ct_series(ct_series_id, ct_dir))
         
         # Télécharger RT-STRUCT
-        rtstruct_response = requests.get(f'{ORTHANC_URL}/instances/{rtstruct_id}/file')
         rtstruct_path = os.path.join(ct_dir, 'rtstruct.dcm')
         with open(rtstruct_path, 'wb') as f:
-            f.write(rtstruct_response.content)
-        
-        # Charger RT-STRUCT
-        rtstruct = RTStructBuilder.create_from(
-            dicom_series_path=ct_dir,
-            rt_struct_path=rtstruct_path
-        )
-        
-        # Lister toutes les ROIs
+            f.write(_download_instance(rtstruct_id))
         ds = pydicom.dcmread(rtstruct_path)
-        roi_names = [roi_seq.ROIName for roi_seq in ds.StructureSetROISequence]
-        
-        # Créer ZIP
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            
-            for roi_name in roi_names:
-                try:
-                    mask_3d = rtstruct.get_roi_mask_by_name(roi_name)
-                    
-                    if output_format == 'nifti':
-                        import nibabel as nib
-                        nifti_img = nib.Nifti1Image(mask_3d.astype(np.uint8), np.eye(4))
-                        nifti_buffer = BytesIO()
-                        nib.save(nifti_img, nifti_buffer)
-                        nifti_buffer.seek(0)
-                        zip_file.writestr(f'{roi_name}.nii.gz', nifti_buffer.getvalue())
-                    
-                    elif output_format == 'numpy':
-                        numpy_buffer = BytesIO()
-                        np.save(numpy_buffer, mask_3d)
-                        zip_file.writestr(f'{roi_name}.npy', numpy_buffer.getvalue())
-                    
-                except Exception as e:
-                    print(f"Erreur pour ROI {roi_name}: {e}")
-                    continue
-        
-        zip_buffer.seek(0)
         
-        # Nettoyer
-        import shutil
-        shutil.rmtree(ct_dir)
-        
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='all_rois.zip'
+        # Masques rastérisés et encodés en parallèle, envoyés dès qu'ils sont prêts
+        extension = 'nii.gz' if output_format == 'nifti' else 'npy'
+        entries = (
+            (f'{roi_name}.{extension}', payload)
+            for roi_name, payload in _roi_payloads(ds, geometry, output_format)
         )
+        return _zip_response(entries, 'all_rois.zip')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        shutil.rmtree(ct_dir, ignore_errors=True)
 
 @app.route('/api/rt-struct/extract-from-folder', methods=['POST'])
 def extract_from_folder():
@@ -335,26 +494,28 @@ def extract_from_folder():
         return jsonify({'error': 'Dossier invalide'}), 400
     
     try:
-        # Charger RT-STRUCT
-        rtstruct = RTStructBuilder.create_from(dicom_series_path=dicom_folder)
-        roi_names = rtstruct.get_roi_names()
-        
-        # Créer ZIP
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for roi_name in roi_names:
-                mask = rtstruct.get_roi_mask_by_name(roi_name)
-                
-                # Sauver en NIfTI
-                nifti_img = nibabel.Nifti1Image(mask.astype(np.uint8), np.eye(4))
-                nifti_buffer = io.BytesIO()
-                nibabel.save(nifti_img, nifti_buffer)
-                nifti_buffer.seek(0)
-                
-                zipf.writestr(f'{roi_name}_mask.nii.gz', nifti_buffer.read())
-        
-        zip_buffer.seek(0)
-        return send_file(zip_buffer, mimetype='application/zip', as_attachment=True, download_name='rois.zip')
+        # Charger en-têtes CT et RT-STRUCT
+        # Tous les fichiers du dossier (sous-dossiers compris, quel que soit leur nom), comme rt_utils
+        ct_headers, ds = [], None
+        for root, _, files in os.walk(dicom_folder):
+            for name in sorted(files):
+                try:
+                    header = pydicom.dcmread(os.path.join(root, name), stop_before_pixels=True)
+                except (InvalidDicomError, OSError):
+                    continue  # Fichier non DICOM
+                if getattr(header, 'Modality', None) == 'RTSTRUCT':
+                    ds = header
+                elif hasattr(header, 'ImagePositionPatient'):
+                    ct_headers.append(header)
+        
+        if ds is None or not ct_headers:
+            return jsonify({'error': 'RT-STRUCT ou coupes CT introuvables'}), 400
+        
+        entries = (
+            (f'{roi_name}_mask.nii.gz', payload)
+            for roi_name, payload in _roi_payloads(ds, CtGeometry.from_datasets(ct_headers))
+        )
+        return _zip_response(entries, 'rois.zip')
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -375,20 +536,13 @@ def export_to_slicer():
     rtstruct_id = data.get('rtstruct_id')
     ct_series_id = data.get('ct_series_id')
     
+    ct_dir = tempfile.mkdtemp()
     try:
         import SimpleITK as sitk
         import nibabel as nib
         
         # Télécharger CT series
-        ct_dir = tempfile.mkdtemp()
-        series_info = requests.get(f'{ORTHANC_URL}/series/{ct_series_id}').json()
-        
-        for instance_id in series_info['Instances']:
-            response = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/file')
-            instance_number = requests.get(f'{ORTHANC_URL}/instances/{instance_id}/simplified-tags').json().get('InstanceNumber', '0')
-            
-            with open(os.path.join(ct_dir, f'CT_{instance_number}.dcm'), 'wb') as f:
-                f.write(response.content)
+        geometry = CtGeometry.from_datasets(_download_ct_series(ct_series_id, ct_dir))
         
         # Lire CT avec SimpleITK pour avoir les métadonnées spatiales correctes
         reader = sitk.ImageSeriesReader()
@@ -396,60 +550,23 @@ def export_to_slicer():
         reader.SetFileNames(dicom_names)
         ct_image = reader.Execute()
         
-        # Convertir en numpy et NIfTI
-        ct_array = sitk.GetArrayFromImage(ct_image)
-        spacing = ct_image.GetSpacing()
-        origin = ct_image.GetOrigin()
-        direction = ct_image.GetDirection()
+        # Convertir en numpy (colonne, ligne, coupe) et NIfTI
+        ct_array = sitk.GetArrayFromImage(ct_image).transpose(2, 1, 0)
         
-        # Créer matrice affine pour NIfTI
-        affine = np.eye(4)
-        affine[:3, :3] = np.array(direction).reshape(3, 3) * spacing
-        affine[:3, 3] = origin
+        # Matrice affine NIfTI : repère voxel DICOM (LPS) vers RAS
+        affine = np.diag([-1.0, -1.0, 1.0, 1.0]) @ geometry.affine
         
         # Télécharger RT-STRUCT
-        rtstruct_response = requests.get(f'{ORTHANC_URL}/instances/{rtstruct_id}/file')
         rtstruct_path = os.path.join(ct_dir, 'rtstruct.dcm')
         with open(rtstruct_path, 'wb') as f:
-            f.write(rtstruct_response.content)
-        
-        # Charger RT-STRUCT
-        rtstruct = RTStructBuilder.create_from(
-            dicom_series_path=ct_dir,
-            rt_struct_path=rtstruct_path
-        )
+            f.write(_download_instance(rtstruct_id))
         
         # Lister ROIs
         ds = pydicom.dcmread(rtstruct_path)
-        roi_names = [roi_seq.ROIName for roi_seq in ds.StructureSetROISequence]
+        names = list(roi_names(ds).values())
         
-        # Créer ZIP pour 3D Slicer
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            
-            # Sauvegarder CT
-            ct_nifti = nib.Nifti1Image(ct_array, affine)
-            ct_buffer = BytesIO()
-            nib.save(ct_nifti, ct_buffer)
-            ct_buffer.seek(0)
-            zip_file.writestr('CT.nii.gz', ct_buffer.getvalue())
-            
-            # Sauvegarder chaque ROI
-            for roi_name in roi_names:
-                try:
-                    mask_3d = rtstruct.get_roi_mask_by_name(roi_name)
-                    mask_nifti = nib.Nifti1Image(mask_3d.astype(np.uint8), affine)
-                    mask_buffer = BytesIO()
-                    nib.save(mask_nifti, mask_buffer)
-                    mask_buffer.seek(0)
-                    
-                    safe_name = roi_name.replace(' ', '_').replace('/', '_')
-                    zip_file.writestr(f'ROI_{safe_name}.nii.gz', mask_buffer.getvalue())
-                except:
-                    continue
-            
-            # Créer fichier instructions
-            instructions = f"""
+        # Créer fichier instructions
+        instructions = f"""
 3D SLICER IMPORT INSTRUCTIONS
 =============================
 
@@ -460,7 +577,7 @@ def export_to_slicer():
 
 Fichiers:
 - CT.nii.gz : Image CT originale
-{chr(10).join([f'- ROI_{roi_name.replace(" ", "_")}.nii.gz : Segmentation {roi_name}' for roi_name in roi_names])}
+{chr(10).join([f'- ROI_{roi_name.replace(" ", "_")}.nii.gz : Segmentation {roi_name}' for roi_name in names])}
 
 Alternativement:
 - Module "Segment Editor"
@@ -471,23 +588,29 @@ Pour visualisation 3D:
 - Module "Volume Rendering" pour le CT
 - Module "Segmentations" → Show 3D pour les ROIs
 """
-            zip_file.writestr('README.txt', instructions)
-        
-        zip_buffer.seek(0)
         
-        # Nettoyer
-        import shutil
-        shutil.rmtree(ct_dir)
+        def entries(ct_array):
+            # Sauvegarder CT, puis libérer le volume avant les ROIs
+            ct_nifti = nib.Nifti1Image(ct_array, affine)
+            del ct_array
+            yield 'CT.nii.gz', gzip.compress(ct_nifti.to_bytes(), compresslevel=6)
+            del ct_nifti
+            
+            # Sauvegarder chaque ROI
+            # Masque (ligne, colonne, coupe) -> (colonne, ligne, coupe) comme le CT
+            for roi_name, payload in _roi_payloads(ds, geometry, 'nifti', affine, (1, 0, 2)):
+                safe_name = roi_name.replace(' ', '_').replace('/', '_')
+                yield f'ROI_{safe_name}.nii.gz', payload
+            
+            yield 'README.txt', instructions
         
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='slicer_project.zip'
-        )
+        return _zip_response(entries(ct_array), 'slicer_project.zip')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    finally:
+        shutil.rmtree(ct_dir, ignore_errors=True)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
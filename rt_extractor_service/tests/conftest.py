@@ -0,0 +1,60 @@
+"""
+Configuration des tests de l'extracteur RT : cache DICOM temporaire, sans suivi de /changes
+"""
+import os
+import tempfile
+from io import BytesIO
+import numpy as np
+import pytest
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+os.environ.setdefault('DICOM_CACHE_DIR', tempfile.mkdtemp(prefix='dicom-cache-'))
+os.environ['DICOM_CACHE_INVALIDATION_INTERVAL'] = '0'
+
+from rt_raster import CtGeometry
+
+@pytest.fixture
+def geometry():
+    """Grille CT 16x16x4, coupes tous les 2 mm"""
+    return CtGeometry(16, 16, [[0.0, 0.0, 2.0 * k] for k in range(4)], [1, 0, 0], [0, 1, 0], [1.0, 1.0])
+
+def make_rtstruct(count):
+    """RT-STRUCT de `count` ROIs : un carré par ROI, sur la coupe 1"""
+    ds = Dataset()
+    ds.StructureSetROISequence = Sequence()
+    ds.ROIContourSequence = Sequence()
+    for number in range(1, count + 1):
+        roi = Dataset()
+        roi.ROINumber, roi.ROIName = number, f'ROI_{number}'
+        ds.StructureSetROISequence.append(roi)
+        contour = Dataset()
+        contour.ContourGeometricType = 'CLOSED_PLANAR'
+        size = 1.5 + number % 8
+        contour.ContourData = np.array(
+            [[0.5, 0.5, 2.0], [size, 0.5, 2.0], [size, size, 2.0], [0.5, size, 2.0]]
+        ).ravel().tolist()
+        roi_contour = Dataset()
+        roi_contour.ReferencedROINumber = number
+        roi_contour.ContourSequence = Sequence([contour])
+        ds.ROIContourSequence.append(roi_contour)
+    return ds
+
+def ct_slice(instance_number):
+    """Coupe CT minimale (en-tête seul) encodée en DICOM Part 10"""
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = '1.2.840.10008.5.1.4.1.1.2'
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    ds = FileDataset(None, {}, file_meta=meta, preamble=b'\0' * 128)
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.InstanceNumber = instance_number
+    ds.Rows, ds.Columns = 4, 4
+    ds.PixelSpacing = [1.0, 1.0]
+    ds.ImagePositionPatient = [0.0, 0.0, 2.0 * instance_number]
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    buffer = BytesIO()
+    ds.save_as(buffer, write_like_original=False)
+    return buffer.getvalue()
@@ -0,0 +1,111 @@
+"""
+Tests pour le téléchargement parallèle d'une série CT
+"""
+import os
+import threading
+import time
+from io import BytesIO
+import pydicom
+import pytest
+import requests
+import app
+from dicom_cache import DicomCache
+from tests.conftest import ct_slice
+
+class FakeResponse:
+    def __init__(self, content=b'', data=None, status=200):
+        self.content = content
+        self._data = data
+        self.status = status
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise requests.HTTPError(f'{self.status} Server Error')
+
+    def json(self):
+        return self._data
+
+class FakeOrthanc:
+    """Session requests simulée : série et fichiers d'instances, téléchargements lents et comptés"""
+
+    def __init__(self, files, delay=0.05, failing=()):
+        self.files = files
+        self.delay = delay
+        self.failing = set(failing)
+        self.downloads = []
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def get(self, url, params=None, timeout=None):
+        if '/series/' in url:
+            return FakeResponse(data={'Instances': list(self.files)})
+        instance_id = url.rsplit('/', 2)[-2]
+        with self.lock:
+            self.downloads.append(instance_id)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self.lock:
+                self.active -= 1
+        if instance_id in self.failing:
+            return FakeResponse(status=500)
+        return FakeResponse(self.files[instance_id])
+
+@pytest.fixture
+def series(monkeypatch, tmp_path):
+    """Série de 8 coupes listées par Orthanc dans le désordre ; session et cache simulés"""
+    numbers = [5, 2, 8, 1, 7, 3, 6, 4]
+    orthanc = FakeOrthanc({f'inst-{n}': ct_slice(n) for n in numbers})
+    monkeypatch.setattr(app, 'orthanc', orthanc)
+    monkeypatch.setattr(app, 'dicom_cache', DicomCache(str(tmp_path / 'cache'), app.ORTHANC_URL, session=orthanc))
+    monkeypatch.setattr(app, 'DOWNLOAD_WORKERS', 4)
+    ct_dir = tmp_path / 'ct'
+    ct_dir.mkdir()
+    return orthanc, str(ct_dir)
+
+def test_download_is_concurrent(series):
+    """Les coupes sont téléchargées en parallèle, DOWNLOAD_WORKERS au plus"""
+    orthanc, ct_dir = series
+    started = time.monotonic()
+    headers = app._download_ct_series('series-1', ct_dir)
+    assert len(headers) == 8
+    assert orthanc.max_active == 4
+    assert time.monotonic() - started < 8 * orthanc.delay
+
+def test_download_uses_cache(series, tmp_path):
+    """Deuxième téléchargement de la série servi par le cache, sans appel à Orthanc"""
+    orthanc, ct_dir = series
+    app._download_ct_series('series-1', ct_dir)
+    again = tmp_path / 'again'
+    again.mkdir()
+    headers = app._download_ct_series('series-1', str(again))
+    assert sorted(orthanc.downloads) == sorted(orthanc.files)
+    assert app.dicom_cache.hits == 8
+    assert sorted(os.listdir(again)) == sorted(os.listdir(ct_dir))
+    assert len(headers) == 8
+
+def test_slices_named_by_instance_number(series):
+    """Fichiers nommés selon l'InstanceNumber lu dans l'en-tête reçu, pas selon l'ordre d'Orthanc"""
+    orthanc, ct_dir = series
+    headers = app._download_ct_series('series-1', ct_dir)
+    names = sorted(os.listdir(ct_dir))
+    assert names == [f'CT_{n:05d}_inst-{n}.dcm' for n in range(1, 9)]
+    assert [int(h.InstanceNumber) for h in headers] == [5, 2, 8, 1, 7, 3, 6, 4]
+    for name in names:
+        with open(os.path.join(ct_dir, name), 'rb') as f:
+            content = f.read()
+        assert content == orthanc.files[name.split('_', 2)[2][:-4]]
+        assert pydicom.dcmread(BytesIO(content)).InstanceNumber == int(name[3:8])
+    geometry = app.CtGeometry.from_datasets(headers)
+    assert [position[2] for position in geometry.positions] == [2.0 * n for n in range(1, 9)]
+
+def test_failed_instance_propagates(series):
+    """Une coupe en erreur fait échouer la série entière"""
+    orthanc, ct_dir = series
+    orthanc.failing.add('inst-3')
+    with pytest.raises(requests.HTTPError):
+        app._download_ct_series('series-1', ct_dir)
+    assert 'inst-3' not in [name.split('_', 2)[2][:-4] for name in os.listdir(ct_dir)]
@@ -0,0 +1,145 @@
+"""
+Tests pour la répartition des ROIs sur le pool de processus
+"""
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pytest
+import app
+from rt_raster import iter_masks
+from tests.conftest import make_rtstruct
+
+class RecordingPool(ThreadPoolExecutor):
+    """Pool de threads qui compte les tâches soumises et non terminées"""
+
+    def __init__(self, workers):
+        super().__init__(workers)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        with self.lock:
+            self.in_flight += 1
+            self.submitted += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        future = super().submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+class BrokenPool:
+    """Pool dont chaque tâche échoue comme après la mort d'un processus"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool('processus du pool terminé'))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+def test_payloads_yield_in_completion_order(monkeypatch, geometry):
+    """Les ROIs sont rendues dans l'ordre de fin de traitement, pas dans l'ordre du RT-STRUCT"""
+    delays = {'ROI_1': 0.3, 'ROI_2': 0.0, 'ROI_3': 0.15}
+    
+    def encode(roi_name, contours, context_key, context_path):
+        time.sleep(delays[roi_name])
+        return roi_name, roi_name.encode()
+    
+    pool = ThreadPoolExecutor(3)
+    monkeypatch.setattr(app, 'ROI_WORKERS', 3)
+    monkeypatch.setattr(app, '_get_roi_pool', lambda: pool)
+    monkeypatch.setattr(app, '_encode_roi', encode)
+    payloads = list(app._roi_payloads(make_rtstruct(3), geometry))
+    pool.shutdown()
+    assert [name for name, _ in payloads] == ['ROI_2', 'ROI_3', 'ROI_1']
+    assert dict(payloads) == {name: name.encode() for name in delays}
+
+def test_payloads_bound_in_flight_tasks(monkeypatch, geometry):
+    """Au plus ROI_WORKERS tâches en cours, même si le client consomme lentement"""
+    pool = RecordingPool(4)
+    monkeypatch.setattr(app, 'ROI_WORKERS', 2)
+    monkeypatch.setattr(app, '_get_roi_pool', lambda: pool)
+    monkeypatch.setattr(app, '_encode_roi', lambda roi_name, *args: (roi_name, b''))
+    names = []
+    for roi_name, _ in app._roi_payloads(make_rtstruct(9), geometry):
+        time.sleep(0.01)
+        names.append(roi_name)
+    pool.shutdown()
+    assert sorted(names) == sorted(f'ROI_{n}' for n in range(1, 10))
+    assert pool.submitted == 9
+    assert pool.max_in_flight == 2
+
+def test_payloads_stop_submitting_when_client_leaves(monkeypatch, geometry):
+    """Générateur fermé après la première ROI : les ROIs restantes ne sont pas soumises"""
+    pool = RecordingPool(2)
+    monkeypatch.setattr(app, 'ROI_WORKERS', 2)
+    monkeypatch.setattr(app, '_get_roi_pool', lambda: pool)
+    monkeypatch.setattr(app, '_encode_roi', lambda roi_name, *args: (roi_name, b''))
+    payloads = app._roi_payloads(make_rtstruct(9), geometry)
+    next(payloads)
+    payloads.close()
+    pool.shutdown()
+    assert pool.submitted <= 4
+
+def test_payloads_skip_failed_roi(monkeypatch, geometry):
+    """Une ROI en échec est ignorée, les autres sont rendues"""
+    def encode(roi_name, contours, context_key, context_path):
+        if roi_name == 'ROI_2':
+            raise ValueError('contour invalide')
+        return roi_name, b''
+    
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(app, 'ROI_WORKERS', 2)
+    monkeypatch.setattr(app, '_get_roi_pool', lambda: pool)
+    monkeypatch.setattr(app, '_encode_roi', encode)
+    names = [roi_name for roi_name, _ in app._roi_payloads(make_rtstruct(3), geometry)]
+    pool.shutdown()
+    assert sorted(names) == ['ROI_1', 'ROI_3']
+
+def test_broken_pool_is_recreated(monkeypatch, geometry):
+    """Pool cassé : l'erreur remonte et le prochain appel crée un nouveau pool"""
+    broken = BrokenPool()
+    monkeypatch.setattr(app, 'ROI_WORKERS', 2)
+    monkeypatch.setattr(app, '_roi_pool', broken)
+    with pytest.raises(BrokenProcessPool):
+        list(app._roi_payloads(make_rtstruct(3), geometry))
+    assert app._roi_pool is None
+    pool = app._get_roi_pool()
+    try:
+        assert pool is not broken
+        assert pool.submit(sum, [1, 2]).result(timeout=60) == 3
+    finally:
+        app._reset_roi_pool(pool)
+
+def test_encode_roi_loads_context_once(monkeypatch, tmp_path, geometry):
+    """Le contexte d'une requête n'est lu qu'une fois, puis servi depuis le cache du processus"""
+    path = tmp_path / 'roi-context.pkl'
+    path.write_bytes(pickle.dumps((geometry, 'numpy', np.eye(4), (0, 1, 2))))
+    monkeypatch.setattr(app, '_roi_contexts', app.OrderedDict())
+    contours = app.roi_contours(make_rtstruct(1))['ROI_1']
+    name, first = app._encode_roi('ROI_1', contours, 'ctx', str(path))
+    path.unlink()
+    _, second = app._encode_roi('ROI_1', contours, 'ctx', str(path))
+    assert name == 'ROI_1' and first == second
+    _, expected = next(iter_masks({'ROI_1': contours}, geometry))
+    assert first == app._encode_mask(expected, 'numpy', np.eye(4), (0, 1, 2))
+
+def test_payloads_match_serial_path(monkeypatch, geometry):
+    """Pool de processus réel : mêmes fichiers que le chemin séquentiel"""
+    ds = make_rtstruct(4)
+    monkeypatch.setattr(app, 'ROI_WORKERS', 1)
+    serial = dict(app._roi_payloads(ds, geometry, 'numpy'))
+    monkeypatch.setattr(app, 'ROI_WORKERS', 2)
+    parallel = dict(app._roi_payloads(ds, geometry, 'numpy'))
+    app._reset_roi_pool(app._roi_pool)
+    assert parallel == serial
+    assert len(serial) == 4
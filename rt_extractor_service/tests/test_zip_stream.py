@@ -0,0 +1,94 @@
+"""
+Tests pour l'archive ZIP envoyée au fil des entrées
+"""
+import zipfile
+from io import BytesIO
+import pytest
+from pydicom.dataset import FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+import app
+from tests.conftest import ct_slice, make_rtstruct
+
+def entries_then_error(count, error_after=None):
+    """Entrées (nom, contenu) ; RuntimeError après `error_after` entrées"""
+    for n in range(count):
+        if n == error_after:
+            raise RuntimeError('producteur en échec')
+        yield f'ROI_{n}_mask.nii.gz' if n % 2 else f'ROI_{n}.txt', bytes([n]) * 2000
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+@pytest.fixture
+def dicom_folder(tmp_path):
+    """Dossier avec 4 coupes CT et un RT-STRUCT de 3 ROIs"""
+    for n in range(1, 5):
+        (tmp_path / f'ct_{n}.dcm').write_bytes(ct_slice(n))
+    rtstruct = make_rtstruct(3)
+    rtstruct.Modality = 'RTSTRUCT'
+    rtstruct.SOPClassUID = '1.2.840.10008.5.1.4.1.1.481.3'
+    rtstruct.SOPInstanceUID = generate_uid()
+    rtstruct.file_meta = FileMetaDataset()
+    rtstruct.file_meta.MediaStorageSOPClassUID = rtstruct.SOPClassUID
+    rtstruct.file_meta.MediaStorageSOPInstanceUID = rtstruct.SOPInstanceUID
+    rtstruct.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    rtstruct.save_as(str(tmp_path / 'rtstruct.dcm'), write_like_original=False)
+    return tmp_path
+
+def test_stream_is_valid_zip():
+    """Morceaux concaténés : archive ZIP valide, contenus intacts"""
+    archive = b''.join(app._stream_zip(entries_then_error(5), 'rois.zip'))
+    with zipfile.ZipFile(BytesIO(archive)) as zip_file:
+        assert zip_file.testzip() is None
+        assert zip_file.namelist() == [name for name, _ in entries_then_error(5)]
+        for name, payload in entries_then_error(5):
+            assert zip_file.read(name) == payload
+
+def test_compressed_entries_are_stored():
+    """Entrées .gz et .png stockées telles quelles, autres en DEFLATE"""
+    entries = [('a.nii.gz', b'x' * 1000), ('b.png', b'y' * 1000), ('c.npy', b'z' * 1000)]
+    archive = b''.join(app._stream_zip(iter(entries), 'rois.zip'))
+    with zipfile.ZipFile(BytesIO(archive)) as zip_file:
+        types = {info.filename: info.compress_type for info in zip_file.infolist()}
+    assert types == {'a.nii.gz': zipfile.ZIP_STORED, 'b.png': zipfile.ZIP_STORED, 'c.npy': zipfile.ZIP_DEFLATED}
+
+def test_first_entry_error_before_headers():
+    """Échec de la première entrée : l'erreur remonte avant toute réponse"""
+    with app.app.test_request_context():
+        with pytest.raises(RuntimeError):
+            app._zip_response(entries_then_error(3, error_after=0), 'rois.zip')
+
+def test_first_entry_error_is_http_500(monkeypatch, client, dicom_folder):
+    """Route : échec avant la première ROI rendu en erreur HTTP 500, pas en ZIP tronqué"""
+    def failing_payloads(ds, geometry, *args):
+        raise RuntimeError('pool indisponible')
+        yield
+    
+    monkeypatch.setattr(app, '_roi_payloads', failing_payloads)
+    response = client.post('/api/rt-struct/extract-from-folder', json={'dicom_folder': str(dicom_folder)})
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'pool indisponible'}
+
+def test_route_streams_roi_archive(monkeypatch, client, dicom_folder):
+    """Route : une entrée NIfTI stockée par ROI"""
+    monkeypatch.setattr(app, 'ROI_WORKERS', 1)
+    response = client.post('/api/rt-struct/extract-from-folder', json={'dicom_folder': str(dicom_folder)})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/zip'
+    with zipfile.ZipFile(BytesIO(response.data)) as zip_file:
+        assert zip_file.namelist() == [f'ROI_{n}_mask.nii.gz' for n in range(1, 4)]
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zip_file.infolist())
+
+def test_mid_stream_error_leaves_invalid_archive(caplog):
+    """Échec en cours d'envoi : flux interrompu, archive sans répertoire central, journalisé"""
+    chunks = []
+    with app.app.test_request_context():
+        response = app._zip_response(entries_then_error(5, error_after=3), 'rois.zip')
+        with pytest.raises(RuntimeError):
+            for chunk in response.response:
+                chunks.append(chunk)
+    assert len(chunks) == 3
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(BytesIO(b''.join(chunks)))
+    assert 'Archive rois.zip interrompue' in caplog.text
@@ -16,6 +16,7 @@ import logging
 from datetime import datetime
 from pydicom.uid import generate_uid
 from pydicom.dataset import Dataset
+from dicom_cache import DicomCache
 
 app = Flask(__name__)
 CORS(app)
@@ -26,6 +27,11 @@ logger = logging.getLogger(__name__)
 ORTHANC_URL = os.getenv("ORTHANC_URL", "http://localhost:8042")
 AUTO_UPLOAD = os.getenv("AUTO_UPLOAD", "true").lower() == "true"
 
+dicom_cache = DicomCache.from_env(ORTHANC_URL)
+
+# Rattrapage puis suivi de /changes dès l'initialisation du worker, avant la première requête
+dicom_cache.start()
+
 @app.route('/')
 def index():
     """Interface web du service"""
@@ -43,7 +49,8 @@ def health():
             "DICOM-SEG generation (basic)",
             "Auto upload to Orthanc"
         ],
-        "note": "Simplified version - for full RT-Utils features, use 3D Slicer"
+        "note": "Simplified version - for full RT-Utils features, use 3D Slicer",
+        "dicom_cache": dicom_cache.stats()
     })
 
 @app.route('/api/convert-rtstruct-to-seg', methods=['POST'])
@@ -66,12 +73,12 @@ def convert_rtstruct_to_seg():
         logger.info(f"Processing RT-STRUCT {rtstruct_uid} for series {series_uid}")
         
         # 1. Télécharger RT-STRUCT
-        rtstruct_path = download_rtstruct(rtstruct_uid)
-        if not rtstruct_path:
+        rtstruct_file = download_rtstruct(rtstruct_uid)
+        if not rtstruct_file:
             return jsonify({"error": "Failed to download RT-STRUCT"}), 404
         
         # 2. Analyser le RT-STRUCT
-        rtstruct = pydicom.dcmread(rtstruct_path)
+        rtstruct = pydicom.dcmread(rtstruct_file)
         
         # 3. Extraire les ROIs
         roi_info = extract_roi_info(rtstruct)
@@ -101,8 +108,8 @@ def extract_voxels():
         rtstruct_uid = data.get('rtstruct_uid')
         roi_name = data.get('roi_name')
         
-        rtstruct_path = download_rtstruct(rtstruct_uid)
-        rtstruct = pydicom.dcmread(rtstruct_path)
+        rtstruct_file = download_rtstruct(rtstruct_uid)
+        rtstruct = pydicom.dcmread(rtstruct_file)
         
         roi_info = extract_roi_info(rtstruct)
         selected_roi = next((r for r in roi_info if r['name'] == roi_name), None)
@@ -148,8 +155,12 @@ def extract_roi_info(rtstruct):
     return roi_info
 
 def download_rtstruct(rtstruct_uid):
-    """Télécharge RT-STRUCT"""
+    """RT-STRUCT en mémoire (cache disque partagé, sans requête s'il y est déjà)"""
     try:
+        cached = dicom_cache.get_by_sop_uid(rtstruct_uid)
+        if cached:
+            return io.BytesIO(cached)
+        
         # Rechercher l'instance
         response = requests.get(f"{ORTHANC_URL}/tools/find", json={
             "Level": "Instance",
@@ -161,16 +172,8 @@ def download_rtstruct(rtstruct_uid):
         
         instance_id = response.json()[0]
         
-        # Télécharger
-        cache_dir = "/app/cache/rtstruct"
-        os.makedirs(cache_dir, exist_ok=True)
-        file_path = f"{cache_dir}/{instance_id}.dcm"
-        
-        file_response = requests.get(f"{ORTHANC_URL}/instances/{instance_id}/file")
-        with open(file_path, 'wb') as f:
-            f.write(file_response.content)
-        
-        return file_path
+        # Télécharger (contenu lu en mémoire : le fichier en cache peut être évincé ensuite)
+        return io.BytesIO(dicom_cache.get(instance_id))
         
     except Exception as e:
         logger.error(f"Error downloading RT-STRUCT: {str(e)}")
@@ -0,0 +1,3 @@
+"""
+Modules partagés entre les services (volume /shared, PYTHONPATH des images)
+"""
@@ -0,0 +1,384 @@
+"""
+Cache disque partagé des instances DICOM d'Orthanc
+Fichiers adressés par contenu (SHA-256) dans un volume commun aux services
+(radiomics, extracteur RT, RT utils, DICOMweb) ; un index SQLite associe l'identifiant
+d'instance Orthanc et le SOPInstanceUID au fichier. Taille bornée avec éviction LRU,
+écritures atomiques (fichier temporaire puis renommage) et invalidation suivant le
+flux /changes d'Orthanc. Compteurs de hits/miss exposés par stats().
+Les écritures de l'index et les créations/suppressions de fichiers se font sous le
+verrou d'écriture SQLite (BEGIN IMMEDIATE) : un processus n'efface jamais un fichier
+qu'un autre vient de référencer. Un fichier évincé entre la recherche et la lecture
+est traité comme un défaut de cache.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+import pydicom
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Changements Orthanc rendant une instance en cache périmée
+INVALIDATING_CHANGES = {'NewInstance', 'Deleted', 'UpdatedAttachment'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    instance_id TEXT PRIMARY KEY,
+    sop_uid TEXT,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entries_sop_uid ON entries (sop_uid);
+CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+class DicomCache:
+    def __init__(self, root, orthanc_url, max_bytes=10 * 1024 ** 3, session=None, timeout=60.0):
+        self.root = root
+        self.orthanc_url = orthanc_url
+        self.max_bytes = max_bytes
+        self.session = session or requests.Session()
+        self.timeout = timeout
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._local = threading.local()
+        self._counters_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.invalidation_interval = 0.0  # Période de suivi de /changes utilisée par start()
+        self._started_pid = None
+        db = self._db()
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(SCHEMA)
+        with self._transaction() as db:
+            # Taille totale tenue à jour à chaque écriture (calculée une fois pour un index existant)
+            db.execute(
+                "INSERT OR IGNORE INTO meta (key, value) "
+                "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM entries"
+            )
+
+    @classmethod
+    def from_env(cls, orthanc_url, session=None):
+        """Cache configuré par DICOM_CACHE_DIR, DICOM_CACHE_MAX_MB et DICOM_CACHE_INVALIDATION_INTERVAL
+
+        Aucun thread ni appel réseau ici : le suivi de /changes est lancé par start(), à
+        l'initialisation du service, dans le processus qui sert les requêtes.
+        """
+        cache = cls(
+            os.getenv('DICOM_CACHE_DIR', '/cache/dicom'),
+            orthanc_url,
+            max_bytes=int(os.getenv('DICOM_CACHE_MAX_MB', '10240')) * 1024 * 1024,
+            session=session
+        )
+        cache.invalidation_interval = float(os.getenv('DICOM_CACHE_INVALIDATION_INTERVAL', '30'))
+        return cache
+
+    def start(self):
+        """Rattraper puis suivre /changes, une fois par processus (sans effet si désactivé)
+
+        Le rattrapage est fait avant de rendre la main : une instance modifiée pendant
+        l'arrêt du service n'est pas servie depuis le cache à la première requête.
+        """
+        with self._counters_lock:
+            if self.invalidation_interval <= 0 or self._started_pid == os.getpid():
+                return None
+            self._started_pid = os.getpid()
+        try:
+            invalidated = self.sync_changes()
+            if invalidated:
+                logger.info(f"Cache DICOM : {invalidated} instances invalidées au démarrage")
+        except Exception as e:
+            logger.warning(f"Cache DICOM : lecture de /changes impossible : {e}")
+        return self.start_invalidation(self.invalidation_interval)
+
+    def _db(self):
+        """Connexion SQLite propre au thread (l'index est partagé entre processus)"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction d'écriture exclusive entre processus (index et fichiers)"""
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    @staticmethod
+    def _add_total(db, delta):
+        if delta:
+            db.execute(
+                "UPDATE meta SET value = CAST(value AS INTEGER) + ? WHERE key = 'total_bytes'", (delta,)
+            )
+
+    def _total(self):
+        row = self._db().execute("SELECT value FROM meta WHERE key = 'total_bytes'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _count(self, counter, n=1):
+        with self._counters_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _lookup(self, column, value):
+        """Fichier en cache pour instance_id ou sop_uid ; None si absent"""
+        db = self._db()
+        row = db.execute(f'SELECT instance_id, digest FROM entries WHERE {column} = ?', (value,)).fetchone()
+        if row is None:
+            return None
+        path = self._blob_path(row[1])
+        if not os.path.exists(path):
+            # Fichier supprimé hors du cache : entrée orpheline
+            self._remove([row[0]])
+            return None
+        db.execute('UPDATE entries SET last_access = ? WHERE instance_id = ?', (time.time(), row[0]))
+        return path
+
+    def _read(self, column, value):
+        """Contenu en cache ; None si absent ou évincé par un autre processus depuis la recherche"""
+        path = self._lookup(column, value)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _download(self, instance_id):
+        response = self.session.get(f'{self.orthanc_url}/instances/{instance_id}/file', timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def path(self, instance_id):
+        """Chemin local de l'instance, téléchargée depuis Orthanc si absente
+
+        Le fichier peut être évincé par un autre processus avant d'être ouvert : get()
+        est préférable quand le contenu suffit.
+        """
+        path = self._lookup('instance_id', instance_id)
+        if path is not None:
+            self._count('hits')
+            return path
+        self._count('misses')
+        return self.put(instance_id, self._download(instance_id))
+
+    def get(self, instance_id):
+        """Contenu DICOM de l'instance, téléchargée depuis Orthanc si absente"""
+        content = self._read('instance_id', instance_id)
+        if content is not None:
+            self._count('hits')
+            return content
+        self._count('misses')
+        content = self._download(instance_id)
+        self.put(instance_id, content)
+        return content
+
+    def get_by_sop_uid(self, sop_uid):
+        """Contenu d'une instance déjà en cache, par SOPInstanceUID (None sinon)"""
+        content = self._read('sop_uid', sop_uid)
+        self._count('hits' if content is not None else 'misses')
+        return content
+
+    def put(self, instance_id, content):
+        """Enregistrer une instance ; chemin du fichier"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        sop_uid = _sop_uid(content)
+        # Fichier préparé hors verrou ; publié (renommage) sous le verrou avec son entrée
+        tmp_path = None if os.path.exists(path) else self._write_temp(path, content)
+        try:
+            with self._transaction() as db:
+                previous = db.execute(
+                    'SELECT digest, size FROM entries WHERE instance_id = ?', (instance_id,)
+                ).fetchone()
+                db.execute(
+                    'INSERT OR REPLACE INTO entries (instance_id, sop_uid, digest, size, last_access) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (instance_id, sop_uid, digest, len(content), time.time())
+                )
+                self._add_total(db, len(content) - (previous[1] if previous else 0))
+                if not os.path.exists(path):
+                    # Supprimé par un autre processus depuis la vérification
+                    if tmp_path is None:
+                        tmp_path = self._write_temp(path, content)
+                    os.replace(tmp_path, path)
+                    tmp_path = None
+                if previous and previous[0] != digest:
+                    self._unlink_unreferenced(db, {previous[0]})
+        finally:
+            if tmp_path is not None:
+                os.unlink(tmp_path)
+        # L'entrée écrite n'est jamais évincée par sa propre insertion, même au-delà de max_bytes
+        self._evict(keep=instance_id)
+        return path
+
+    def _write_temp(self, path, content):
+        """Fichier temporaire complet à côté de `path` (renommage atomique ensuite)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+
+    def _evict(self, keep=None):
+        """Supprimer les entrées les moins récemment lues au-delà de max_bytes (sauf `keep`)"""
+        total = self._total()
+        while total > self.max_bytes:
+            rows = self._db().execute(
+                'SELECT instance_id, size FROM entries WHERE instance_id IS NOT ? ORDER BY last_access LIMIT 100',
+                (keep,)
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for instance_id, size in rows:
+                evicted.append(instance_id)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            self._count('evictions', self._remove(evicted))
+            total = self._total()
+
+    def _remove(self, instance_ids):
+        """Supprimer des entrées et les fichiers qui ne sont plus référencés ; entrées supprimées"""
+        placeholders = ','.join('?' * len(instance_ids))
+        with self._transaction() as db:
+            rows = db.execute(
+                f'SELECT digest, size FROM entries WHERE instance_id IN ({placeholders})', instance_ids
+            ).fetchall()
+            db.execute(f'DELETE FROM entries WHERE instance_id IN ({placeholders})', instance_ids)
+            self._add_total(db, -sum(size for _, size in rows))
+            # Sous le verrou : aucun put concurrent ne peut référencer le fichier entre-temps
+            self._unlink_unreferenced(db, {digest for digest, _ in rows})
+        return len(rows)
+
+    def _unlink_unreferenced(self, db, digests):
+        for digest in digests:
+            if db.execute('SELECT 1 FROM entries WHERE digest = ?', (digest,)).fetchone() is None:
+                try:
+                    os.unlink(self._blob_path(digest))
+                except FileNotFoundError:
+                    pass
+
+    def invalidate(self, instance_ids):
+        """Retirer des instances du cache ; nombre d'entrées retirées"""
+        instance_ids = list(instance_ids)
+        if not instance_ids:
+            return 0
+        count = self._remove(instance_ids)
+        if count:
+            self._count('invalidations', count)
+        return count
+
+    def clear(self):
+        """Vider le cache (tous les processus partageant le volume) ; le curseur /changes est conservé"""
+        instance_ids = [row[0] for row in self._db().execute('SELECT instance_id FROM entries')]
+        for offset in range(0, len(instance_ids), 500):
+            self.invalidate(instance_ids[offset:offset + 500])
+
+    def _cursor(self, db=None):
+        row = (db or self._db()).execute("SELECT value FROM meta WHERE key = 'orthanc_last_seq'").fetchone()
+        return int(row[0]) if row else None
+
+    def _set_cursor(self, seq, db=None):
+        (db or self._db()).execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('orthanc_last_seq', ?)", (str(seq),)
+        )
+
+    def sync_changes(self, limit=1000):
+        """Appliquer le flux /changes d'Orthanc depuis le curseur ; instances invalidées"""
+        since = self._cursor()
+        if since is None:
+            # Sans curseur, les changements passés sont inconnus : repartir d'un cache vide
+            response = self.session.get(f'{self.orthanc_url}/changes', params={'last': ''}, timeout=self.timeout)
+            response.raise_for_status()
+            with self._transaction() as db:
+                # Un autre processus a pu initialiser le curseur entre-temps : ne pas vider son cache
+                if self._cursor(db) is not None:
+                    return 0
+                digests = {row[0] for row in db.execute('SELECT DISTINCT digest FROM entries')}
+                db.execute('DELETE FROM entries')
+                db.execute("UPDATE meta SET value = '0' WHERE key = 'total_bytes'")
+                self._unlink_unreferenced(db, digests)
+                self._set_cursor(response.json().get('Last', 0), db)
+            return 0
+
+        invalidated = 0
+        while True:
+            response = self.session.get(
+                f'{self.orthanc_url}/changes', params={'since': since, 'limit': limit}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+            invalidated += self.invalidate({
+                change['ID'] for change in data.get('Changes', [])
+                if change.get('ResourceType') == 'Instance' and change.get('ChangeType') in INVALIDATING_CHANGES
+            })
+            since = data.get('Last', since)
+            self._set_cursor(since)
+            if data.get('Done', True):
+                return invalidated
+
+    def start_invalidation(self, interval=30.0):
+        """Suivre /changes en tâche de fond (thread démon)"""
+        def loop():
+            while True:
+                try:
+                    invalidated = self.sync_changes()
+                    if invalidated:
+                        logger.info(f"Cache DICOM : {invalidated} instances invalidées")
+                except Exception as e:
+                    logger.warning(f"Cache DICOM : lecture de /changes impossible : {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='dicom-cache-invalidation', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """Compteurs du processus et occupation du cache"""
+        entries = self._db().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        size = self._total()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes
+        }
+
+def _sop_uid(content):
+    """SOPInstanceUID lu dans l'en-tête (None si le fichier n'est pas lisible)"""
+    try:
+        header = pydicom.dcmread(BytesIO(content), stop_before_pixels=True, specific_tags=['SOPInstanceUID'])
+        return str(header.SOPInstanceUID)
+    except Exception:
+        return None
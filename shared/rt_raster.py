@@ -0,0 +1,185 @@
+"""
+Rastérisation des contours RT-STRUCT sur la grille d'une série CT (NumPy seul)
+Les points de tous les contours de toutes les ROIs sont projetés en une fois dans le
+repère voxel de la série (ImagePositionPatient, ImageOrientationPatient, PixelSpacing,
+coupes obliques comprises), puis chaque coupe est remplie par balayage de lignes avec
+la règle pair-impair : plusieurs contours et trous par coupe, centres de pixels sur les
+coordonnées entières. Masques au format de rt_utils : (lignes, colonnes, coupes).
+"""
+from collections import defaultdict
+import numpy as np
+
+class CtGeometry:
+    """Grille voxel d'une série CT ; indices (colonne, ligne, coupe) <-> coordonnées patient (mm)"""
+
+    def __init__(self, rows, cols, positions, row_direction, col_direction, pixel_spacing, sop_uids=None):
+        self.rows = int(rows)
+        self.cols = int(cols)
+        self.positions = np.asarray(positions, dtype=float)  # ImagePositionPatient par coupe, triées
+        self.row_direction = np.asarray(row_direction, dtype=float)  # Sens des colonnes croissantes
+        self.col_direction = np.asarray(col_direction, dtype=float)  # Sens des lignes croissantes
+        self.normal = np.cross(self.row_direction, self.col_direction)
+        self.row_spacing, self.col_spacing = (float(s) for s in pixel_spacing)
+        self.sop_uids = list(sop_uids or [])
+        self.slice_offsets = self.positions @ self.normal
+
+    @classmethod
+    def from_datasets(cls, datasets):
+        """Géométrie d'une série (en-têtes pydicom, sans pixels), coupes triées le long de la normale"""
+        first = datasets[0]
+        orientation = np.array(first.ImageOrientationPatient, dtype=float)
+        normal = np.cross(orientation[:3], orientation[3:])
+        datasets = sorted(datasets, key=lambda ds: float(np.dot(np.array(ds.ImagePositionPatient, dtype=float), normal)))
+        return cls(
+            first.Rows, first.Columns,
+            [[float(v) for v in ds.ImagePositionPatient] for ds in datasets],
+            orientation[:3], orientation[3:],
+            [float(v) for v in first.PixelSpacing],
+            [str(getattr(ds, 'SOPInstanceUID', '')) for ds in datasets]
+        )
+
+    @property
+    def shape(self):
+        return (self.rows, self.cols, len(self.positions))
+
+    @property
+    def affine(self):
+        """Matrice 4x4 (colonne, ligne, coupe, 1) -> patient, pas de coupe moyen"""
+        step = (
+            (self.positions[-1] - self.positions[0]) / (len(self.positions) - 1)
+            if len(self.positions) > 1 else self.normal
+        )
+        affine = np.eye(4)
+        affine[:3, 0] = self.row_direction * self.col_spacing
+        affine[:3, 1] = self.col_direction * self.row_spacing
+        affine[:3, 2] = step
+        affine[:3, 3] = self.positions[0]
+        return affine
+
+    def to_voxels(self, points, contour_index):
+        """Points patient (N, 3) -> (colonne, ligne) continues et coupe de chaque contour
+
+        La coupe d'un contour est la plus proche de son plan ; -1 s'il est hors du volume.
+        """
+        points = np.asarray(points, dtype=float)
+        contours = int(contour_index.max()) + 1 if len(contour_index) else 0
+        offsets = points @ self.normal
+        plane = np.bincount(contour_index, offsets, contours) / np.maximum(np.bincount(contour_index, minlength=contours), 1)
+        slices = np.clip(np.searchsorted(self.slice_offsets, plane), 1, max(len(self.slice_offsets) - 1, 1))
+        if len(self.slice_offsets) > 1:
+            below = self.slice_offsets[slices - 1]
+            slices = np.where(np.abs(plane - below) <= np.abs(plane - self.slice_offsets[slices]), slices - 1, slices)
+            tolerance = np.abs(np.diff(self.slice_offsets)).max() / 2
+        else:
+            slices = np.zeros(contours, dtype=int)
+            tolerance = 0.5
+        slices = np.where(np.abs(plane - self.slice_offsets[slices]) <= tolerance + 1e-3, slices, -1)
+        local = points - self.positions[np.maximum(slices, 0)[contour_index]]
+        voxels = np.stack([local @ self.row_direction / self.col_spacing, local @ self.col_direction / self.row_spacing], axis=1)
+        return voxels, slices
+
+def fill_even_odd(polygons, rows, cols):
+    """Remplir des polygones (liste de tableaux (N, 2) colonne, ligne) par règle pair-impair
+
+    Un pixel est plein si une demi-droite partant de son centre vers la gauche coupe un
+    nombre impair d'arêtes : trous et contours multiples sans orientation imposée.
+    """
+    mask = np.zeros((rows, cols), dtype=bool)
+    filled = _scanline_fill(polygons, rows, cols)
+    if filled is not None:
+        top, left, block = filled
+        mask[top:top + block.shape[0], left:left + block.shape[1]] = block
+    return mask
+
+def _scanline_fill(polygons, rows, cols):
+    """Remplissage limité au rectangle englobant : (première ligne, première colonne, bloc) ou None"""
+    starts = [np.asarray(p, dtype=float) for p in polygons if len(p) >= 3]
+    if not starts:
+        return None
+    start = np.concatenate(starts)
+    end = np.concatenate([np.roll(p, -1, axis=0) for p in starts])
+    x0, y0, x1, y1 = start[:, 0], start[:, 1], end[:, 0], end[:, 1]
+    # Lignes de balayage coupées par chaque arête : centres y dans [min(y0, y1), max(y0, y1))
+    first = np.clip(np.ceil(np.minimum(y0, y1)), 0, rows).astype(np.int64)
+    last = np.clip(np.ceil(np.maximum(y0, y1)), 0, rows).astype(np.int64)
+    counts = np.where(y0 != y1, last - first, 0)
+    total = int(counts.sum())
+    if total == 0:
+        return None
+    edge = np.repeat(np.arange(len(counts)), counts)
+    row = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + first[edge]
+    x = x0[edge] + (row - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+    # Intersection à gauche du centre du pixel j (x <= j) : compte pour toutes les colonnes >= ceil(x)
+    left = int(np.clip(np.ceil(x.min()), 0, cols))
+    right = int(np.clip(np.ceil(x.max()), left, cols))
+    if right == left:
+        return None
+    col = np.clip(np.ceil(x), left, right).astype(np.int64) - left
+    width = right - left
+    top, bottom = int(row.min()), int(row.max()) + 1
+    crossings = np.bincount((row - top) * (width + 1) + col, minlength=(bottom - top) * (width + 1))
+    crossings = crossings.reshape(bottom - top, width + 1)[:, :width]
+    return top, left, (np.cumsum(crossings, axis=1) & 1).astype(bool)
+
+def roi_names(rtstruct):
+    """ROINumber -> ROIName d'un RT-STRUCT"""
+    return {int(roi.ROINumber): str(roi.ROIName) for roi in getattr(rtstruct, 'StructureSetROISequence', [])}
+
+def roi_contours(rtstruct, names=None):
+    """Contours planaires fermés par ROI : {nom: [points (N, 3)]}, filtrés par `names`"""
+    numbers = roi_names(rtstruct)
+    contours = defaultdict(list)
+    for roi_contour in getattr(rtstruct, 'ROIContourSequence', []):
+        name = numbers.get(int(roi_contour.ReferencedROINumber))
+        if name is None or (names is not None and name not in names):
+            continue
+        for contour in getattr(roi_contour, 'ContourSequence', []):
+            if getattr(contour, 'ContourGeometricType', 'CLOSED_PLANAR') != 'CLOSED_PLANAR':
+                continue
+            points = np.asarray(contour.ContourData, dtype=float).reshape(-1, 3)
+            if len(points) >= 3:
+                contours[name].append(points)
+    return contours
+
+def iter_masks(contours, geometry):
+    """Masques (nom, booléens (lignes, colonnes, coupes)) ROI par ROI pour des contours {nom: [points]}
+
+    Projection de tous les points en un seul calcul, puis remplissage coupe par coupe
+    limité au rectangle englobant des contours ; un seul masque en mémoire à la fois.
+    """
+    rows, cols, slices = geometry.shape
+    flat = [(name, points) for name, polygons in contours.items() for points in polygons]
+    by_slice = defaultdict(lambda: defaultdict(list))
+    if flat:
+        lengths = np.array([len(points) for _, points in flat])
+        voxels, contour_slices = geometry.to_voxels(
+            np.concatenate([points for _, points in flat]),
+            np.repeat(np.arange(len(flat)), lengths)
+        )
+        for (name, _), polygon, k in zip(flat, np.split(voxels, np.cumsum(lengths)[:-1]), contour_slices):
+            if k >= 0:
+                by_slice[name][int(k)].append(polygon)
+    for name in contours:
+        # Stockage coupe par coupe (écritures contiguës), exposé en (lignes, colonnes, coupes)
+        volume = np.zeros((slices, rows, cols), dtype=bool)
+        for k, polygons in by_slice.pop(name, {}).items():
+            filled = _scanline_fill(polygons, rows, cols)
+            if filled is not None:
+                top, left, block = filled
+                volume[k, top:top + block.shape[0], left:left + block.shape[1]] = block
+        yield name, volume.transpose(1, 2, 0)
+
+def rasterize_contours(contours, geometry):
+    """Masques {nom: booléens (lignes, colonnes, coupes)} pour des contours {nom: [points]}"""
+    return dict(iter_masks(contours, geometry))
+
+def iter_roi_masks(rtstruct, geometry, names=None):
+    """Masques (nom, masque) des ROIs d'un RT-STRUCT (toutes ou `names`), dans l'ordre du RT-STRUCT"""
+    wanted = [name for name in roi_names(rtstruct).values() if names is None or name in names]
+    contours = roi_contours(rtstruct, names)
+    # ROIs sans contour : masque vide, comme rt_utils
+    yield from iter_masks({name: contours.get(name, []) for name in wanted}, geometry)
+
+def rasterize_rois(rtstruct, geometry, names=None):
+    """Masques {nom: masque} des ROIs d'un RT-STRUCT sur la géométrie CT"""
+    return dict(iter_roi_masks(rtstruct, geometry, names))
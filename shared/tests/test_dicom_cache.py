@@ -0,0 +1,157 @@
+"""
+Tests pour le cache disque partagé des instances DICOM
+"""
+import os
+import pytest
+from shared.dicom_cache import DicomCache
+
+class FakeResponse:
+    def __init__(self, content=b'', data=None):
+        self.content = content
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+class FakeOrthanc:
+    """Session requests simulée : fichiers d'instances et flux /changes"""
+
+    def __init__(self, files=None, changes=None, last=0):
+        self.files = files or {}
+        self.changes = changes or []
+        self.last = last
+        self.downloads = []
+
+    def get(self, url, params=None, timeout=None):
+        if url.endswith('/changes'):
+            if params and 'last' in params:
+                return FakeResponse(data={'Changes': [], 'Done': True, 'Last': self.last})
+            since = int(params['since'])
+            page = [c for c in self.changes if c['Seq'] > since]
+            return FakeResponse(data={'Changes': page, 'Done': True, 'Last': page[-1]['Seq'] if page else since})
+        instance_id = url.rsplit('/', 2)[-2]
+        self.downloads.append(instance_id)
+        return FakeResponse(self.files[instance_id])
+
+@pytest.fixture
+def orthanc():
+    return FakeOrthanc(files={f'i{n}': bytes([n]) * 100 for n in range(10)})
+
+def make_cache(tmp_path, orthanc, **kwargs):
+    return DicomCache(str(tmp_path / 'cache'), 'http://orthanc', session=orthanc, **kwargs)
+
+def test_get_hit_and_miss(tmp_path, orthanc):
+    """Premier accès téléchargé, suivant lu sur disque"""
+    cache = make_cache(tmp_path, orthanc)
+    assert cache.get('i1') == orthanc.files['i1']
+    assert cache.get('i1') == orthanc.files['i1']
+    assert orthanc.downloads == ['i1']
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_file_evicted_by_other_process_is_a_miss(tmp_path, orthanc):
+    """Fichier supprimé entre la recherche et la lecture : téléchargé à nouveau"""
+    cache = make_cache(tmp_path, orthanc)
+    path = cache.path('i1')
+    lookup = cache._lookup
+
+    def lookup_then_evict(column, value):
+        found = lookup(column, value)
+        if found is not None:
+            os.unlink(found)
+        return found
+
+    cache._lookup = lookup_then_evict
+    assert cache.get('i1') == orthanc.files['i1']
+    assert orthanc.downloads == ['i1', 'i1']
+    assert os.path.exists(path)
+
+def test_eviction_keeps_new_entry_and_running_total(tmp_path, orthanc):
+    """Éviction LRU au-delà de max_bytes, sans retirer l'entrée qui vient d'être écrite"""
+    cache = make_cache(tmp_path, orthanc, max_bytes=250)
+    for n in range(3):
+        cache.get(f'i{n}')
+    stats = cache.stats()
+    assert stats['entries'] == 2
+    assert stats['size_bytes'] == 200
+    assert cache.get_by_sop_uid('unknown') is None
+
+    # Entrée plus grande que le cache : conservée jusqu'à la prochaine écriture
+    cache.put('big', b'x' * 400)
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['size_bytes'] == 400
+    assert cache._lookup('instance_id', 'big') is not None
+
+def test_replaced_instance_releases_old_file(tmp_path, orthanc):
+    """Instance réécrite avec un autre contenu : ancien fichier supprimé, total ajusté"""
+    cache = make_cache(tmp_path, orthanc)
+    old_path = cache.put('i1', b'a' * 10)
+    new_path = cache.put('i1', b'b' * 30)
+    assert not os.path.exists(old_path)
+    assert os.path.exists(new_path)
+    assert cache.stats()['size_bytes'] == 30
+
+def test_shared_file_kept_while_referenced(tmp_path, orthanc):
+    """Même contenu pour deux instances : fichier supprimé avec la dernière référence"""
+    cache = make_cache(tmp_path, orthanc)
+    path = cache.put('a', b'same')
+    cache.put('b', b'same')
+    assert cache.invalidate(['a']) == 1
+    assert os.path.exists(path)
+    assert cache.invalidate(['b']) == 1
+    assert not os.path.exists(path)
+    assert cache.stats()['size_bytes'] == 0
+
+def test_bootstrap_does_not_wipe_initialized_cache(tmp_path, orthanc):
+    """Curseur déjà posé par un autre processus : le cache partagé n'est pas vidé"""
+    orthanc.last = 7
+    first = make_cache(tmp_path, orthanc)
+    second = make_cache(tmp_path, orthanc)
+    cursor = second._cursor
+    # Le second processus a lu l'absence de curseur avant l'initialisation par le premier
+    second._cursor = lambda db=None: None if db is None else cursor(db)
+    assert first.sync_changes() == 0
+    first.get('i1')
+    assert second.sync_changes() == 0
+    assert first.stats()['entries'] == 1
+    assert first._cursor() == 7
+
+def test_changes_invalidate_instances(tmp_path, orthanc):
+    """Instances modifiées dans Orthanc retirées du cache"""
+    cache = make_cache(tmp_path, orthanc)
+    cache.sync_changes()
+    cache.get('i1')
+    cache.get('i2')
+    orthanc.changes = [
+        {'Seq': 1, 'ChangeType': 'Deleted', 'ResourceType': 'Instance', 'ID': 'i1'},
+        {'Seq': 2, 'ChangeType': 'StableStudy', 'ResourceType': 'Study', 'ID': 's1'}
+    ]
+    assert cache.sync_changes() == 1
+    assert cache.stats()['entries'] == 1
+    assert cache._cursor() == 2
+
+def test_from_env_starts_nothing(tmp_path, monkeypatch, orthanc):
+    """Construction sans thread ni réseau ; start() lance le suivi une fois par processus"""
+    monkeypatch.setenv('DICOM_CACHE_DIR', str(tmp_path / 'env'))
+    monkeypatch.setenv('DICOM_CACHE_INVALIDATION_INTERVAL', '3600')
+    started = []
+    monkeypatch.setattr(DicomCache, 'start_invalidation', lambda self, interval: started.append(interval))
+    cache = DicomCache.from_env('http://orthanc', session=orthanc)
+    assert started == []
+    cache.start()
+    cache.start()
+    assert started == [3600.0]
+
+def test_start_catches_up_before_returning(tmp_path, monkeypatch, orthanc):
+    """start() applique les changements survenus pendant l'arrêt avant de rendre la main"""
+    monkeypatch.setattr(DicomCache, 'start_invalidation', lambda self, interval: None)
+    cache = make_cache(tmp_path, orthanc)
+    cache.get('i1')
+    cache._set_cursor(0)
+    orthanc.changes = [{'Seq': 1, 'ResourceType': 'Instance', 'ChangeType': 'UpdatedAttachment', 'ID': 'i1'}]
+    cache.invalidation_interval = 30.0
+    cache.start()
+    assert cache.stats()['entries'] == 0
+    assert cache._cursor() == 1
@@ -0,0 +1,75 @@
+"""
+Tests pour la rastérisation des contours RT-STRUCT
+"""
+import numpy as np
+from shared.rt_raster import CtGeometry, _scanline_fill, fill_even_odd, iter_masks
+
+def reference_fill(polygons, rows, cols):
+    """Référence point par point : demi-droite vers la gauche depuis chaque centre de pixel"""
+    mask = np.zeros((rows, cols), dtype=bool)
+    for i in range(rows):
+        for j in range(cols):
+            inside = False
+            for polygon in polygons:
+                polygon = np.asarray(polygon, dtype=float)
+                for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+                    if min(y0, y1) <= i < max(y0, y1) and x0 + (i - y0) * (x1 - x0) / (y1 - y0) <= j:
+                        inside = not inside
+            mask[i, j] = inside
+    return mask
+
+def square(x0, y0, x1, y1):
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=float)
+
+def test_square_with_hole():
+    """Le trou d'un contour imbriqué est vidé (règle pair-impair)"""
+    polygons = [square(1.5, 1.5, 10.5, 10.5), square(4.5, 4.5, 7.5, 7.5)]
+    mask = fill_even_odd(polygons, 12, 12)
+    assert np.array_equal(mask, reference_fill(polygons, 12, 12))
+    assert mask.sum() == 9 * 9 - 3 * 3
+    assert not mask[5, 5] and mask[2, 2]
+
+def test_overlapping_squares_xor():
+    """Deux contours qui se chevauchent : l'intersection est exclue"""
+    polygons = [square(0.5, 0.5, 6.5, 6.5), square(3.5, 3.5, 9.5, 9.5)]
+    mask = fill_even_odd(polygons, 11, 11)
+    assert np.array_equal(mask, reference_fill(polygons, 11, 11))
+    assert not mask[4:7, 4:7].any()
+    assert mask[1, 1] and mask[8, 8]
+
+def test_random_polygons_match_reference():
+    """Polygones quelconques (auto-intersections, débordement de la grille) identiques à la référence"""
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        polygons = [rng.uniform(-4, 20, (int(rng.integers(3, 9)), 2)) for _ in range(int(rng.integers(1, 4)))]
+        assert np.array_equal(fill_even_odd(polygons, 16, 14), reference_fill(polygons, 16, 14))
+
+def test_scanline_fill_bounding_block():
+    """Bloc limité au rectangle englobant ; None hors grille ou sans surface"""
+    polygons = [square(3.5, 2.5, 6.5, 8.5)]
+    top, left, block = _scanline_fill(polygons, 12, 12)
+    assert (top, left, block.shape) == (3, 4, (6, 3))
+    assert block.all()
+    assert _scanline_fill([square(20.5, 20.5, 25.5, 25.5)], 12, 12) is None
+    assert _scanline_fill([np.array([[1.0, 1.0], [5.0, 5.0]])], 12, 12) is None
+    assert _scanline_fill([square(2.5, 2.5, 2.7, 2.7)], 12, 12) is None
+
+def test_iter_masks_slices_and_spacing():
+    """Masques (lignes, colonnes, coupes) : contour sur sa coupe, pas de pixel anisotrope respecté"""
+    geometry = CtGeometry(
+        10, 8, [[0.0, 0.0, 2.5 * k] for k in range(4)],
+        [1, 0, 0], [0, 1, 0], [1.0, 2.0]
+    )
+    outline = np.array([[1.0, 1.5], [9.0, 1.5], [9.0, 6.5], [1.0, 6.5]])  # x, y en mm
+    contours = {
+        'GTV': [np.column_stack([outline, np.full(4, 5.0)])],
+        'Hors': [np.column_stack([outline, np.full(4, 40.0)])],
+        'Vide': [],
+    }
+    masks = dict(iter_masks(contours, geometry))
+    assert list(masks) == ['GTV', 'Hors', 'Vide']
+    assert all(mask.shape == (10, 8, 4) for mask in masks.values())
+    expected = reference_fill([np.column_stack([outline[:, 0] / 2.0, outline[:, 1]])], 10, 8)
+    assert np.array_equal(masks['GTV'][:, :, 2], expected)
+    assert masks['GTV'].sum() == expected.sum() == 5 * 4
+    assert not masks['Hors'].any() and not masks['Vide'].any()